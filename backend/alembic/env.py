@@ -1,9 +1,14 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
+from app.config import setup_env
+
+setup_env()
+
 from app.database import Base
 from app.models import * 
 # this is the Alembic Config object, which provides
@@ -11,6 +16,10 @@ from app.models import *
 # 获取 Alembic 配置对象
 config = context.config
 
+# 与应用使用同一数据库（.env 或环境变量 DATABASE_URL），未设置时使用 alembic.ini 中的地址
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL").replace("%", "%%"))
+
 # 配置日志（可选）
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
@@ -65,6 +74,16 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # 调用方（如测试）可通过 config.attributes["connection"] 传入已有连接
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(
+            connection=connection, target_metadata=target_metadata
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -93,6 +93,9 @@ def downgrade() -> None:
                existing_nullable=True)
     op.add_column('ai_models', sa.Column('model_name', mysql.VARCHAR(collation='utf8mb4_unicode_ci', length=100), nullable=False))
     op.add_column('ai_models', sa.Column('platform_name', mysql.VARCHAR(collation='utf8mb4_unicode_ci', length=100), nullable=False))
-    op.drop_constraint(None, 'ai_models', type_='foreignkey')
+    # 外键由 upgrade 以 None 创建，名称由数据库生成（MySQL 为 ai_models_ibfk_N），按列反查
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('ai_models'):
+        if fk['constrained_columns'] == ['model_id'] and fk['name']:
+            op.drop_constraint(fk['name'], 'ai_models', type_='foreignkey')
     op.drop_column('ai_models', 'model_id')
     # ### end Alembic commands ###
@@ -0,0 +1,30 @@
+"""conversation listing indexes
+
+Revision ID: 4779b06c4a5a
+Revises: 0cee8bac7863
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4779b06c4a5a'
+down_revision: Union[str, Sequence[str], None] = '0cee8bac7863'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_conversations_user_id_updated_at', 'conversations', ['user_id', 'updated_at', 'id'], unique=False)
+    op.create_index('ix_messages_conversation_id_created_at', 'messages', ['conversation_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_conversation_id_created_at', table_name='messages')
+    op.drop_index('ix_conversations_user_id_updated_at', table_name='conversations')
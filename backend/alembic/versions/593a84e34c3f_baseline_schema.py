@@ -0,0 +1,181 @@
+"""empty database baseline
+
+Revision ID: 593a84e34c3f
+Revises:
+Create Date: 2025-08-24 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '593a84e34c3f'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = ('baseline',)
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 主迁移链（9e798574e6c0 起）假定表已由旧版启动时的 create_all 建好，空库直接升级会失败。
+    # 本修订为独立分支，由 f2b7c4e91d03 与主链合并，升级时排在主链之前：
+    # 空库时建出主链开始前的表结构；已有数据库（表已存在）不做任何改动
+    if context.is_offline_mode() or sa.inspect(op.get_bind()).has_table('users'):
+        return
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=255), nullable=False),
+        sa.Column('password_hash', sa.String(length=255), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('role', sa.String(length=50), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+
+    op.create_table(
+        'platforms',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_index('ix_platforms_id', 'platforms', ['id'], unique=False)
+
+    op.create_table(
+        'models',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('platform_id', sa.Integer(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('is_supported', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.ForeignKeyConstraint(['platform_id'], ['platforms.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_models_id', 'models', ['id'], unique=False)
+
+    op.create_table(
+        'ai_models',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('model_type', sa.String(length=50), nullable=True),
+        sa.Column('training_data', sa.String(length=500), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ai_models_id', 'ai_models', ['id'], unique=False)
+
+    op.create_table(
+        'templates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('original_name', sa.String(length=255), nullable=True),
+        sa.Column('uploaded_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('content', sa.String(length=4000), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_templates_id', 'templates', ['id'], unique=False)
+
+    op.create_table(
+        'document_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('doc_type', sa.String(length=100), nullable=True),
+        sa.Column('content', sa.String(length=4000), nullable=True),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('template_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.ForeignKeyConstraint(['template_id'], ['templates.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_document_history_id', 'document_history', ['id'], unique=False)
+
+    op.create_table(
+        'tags',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tags_id', 'tags', ['id'], unique=False)
+    op.create_index('ix_tags_name', 'tags', ['name'], unique=True)
+
+    op.create_table(
+        'document_tags',
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['document_id'], ['document_history.id']),
+        sa.ForeignKeyConstraint(['tag_id'], ['tags.id']),
+        sa.PrimaryKeyConstraint('document_id', 'tag_id')
+    )
+    op.create_index('ix_document_id_tag_id', 'document_tags', ['document_id', 'tag_id'], unique=False)
+
+    op.create_table(
+        'api_logs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('endpoint', sa.String(length=200), nullable=True),
+        sa.Column('request_params', sa.String(length=1000), nullable=True),
+        sa.Column('response', sa.String(length=1000), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_api_logs_id', 'api_logs', ['id'], unique=False)
+
+    op.create_table(
+        'notifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('message', sa.String(length=500), nullable=True),
+        sa.Column('read', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notifications_id', 'notifications', ['id'], unique=False)
+
+    op.create_table(
+        'conversations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('ai_model_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('title', sa.String(length=50), nullable=True),
+        sa.Column('content', sa.String(length=1000), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['ai_model_id'], ['ai_models.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_conversations_id', 'conversations', ['id'], unique=False)
+    op.create_index('ix_user_id_created_at', 'conversations', ['user_id', 'created_at'], unique=False)
+
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('content', sa.String(length=2000), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_messages_id', 'messages', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # 无法区分表是本修订新建的还是早已存在的，降级不删除任何表
+    pass
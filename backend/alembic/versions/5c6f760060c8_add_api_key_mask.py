@@ -0,0 +1,57 @@
+"""add api_key_mask
+
+Revision ID: 5c6f760060c8
+Revises: a42e37a67f7d
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from cryptography.fernet import Fernet, InvalidToken
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c6f760060c8'
+down_revision: Union[str, Sequence[str], None] = 'a42e37a67f7d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _mask(api_key: str) -> str:
+    """脱敏规则（迁移中固定一份，不依赖应用代码）：保留前4位和后4位，长度 ≤ 8 时只保留前4位"""
+    if not api_key:
+        return ""
+    if len(api_key) <= 8:
+        return f"{api_key[:4]}***"
+    return f"{api_key[:4]}***{api_key[-4:]}"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ai_models', sa.Column('api_key_mask', sa.String(length=32), nullable=True))
+
+    # 回填已有配置的脱敏值（需要 ENCRYPTION_KEY；未配置或无效时跳过，接口读取时再按需计算）
+    key = os.getenv("ENCRYPTION_KEY")
+    if not key:
+        return
+    try:
+        fernet = Fernet(key.encode())
+    except ValueError:
+        return
+    conn = op.get_bind()
+    ai_models = sa.table('ai_models', sa.column('id', sa.Integer), sa.column('api_key', sa.String), sa.column('api_key_mask', sa.String))
+    for row in conn.execute(sa.select(ai_models.c.id, ai_models.c.api_key)).fetchall():
+        try:
+            api_key = fernet.decrypt(row.api_key.encode()).decode()
+        except (InvalidToken, UnicodeDecodeError, AttributeError):
+            # 无法解密（密钥已轮换、数据损坏或为空）的行保持 NULL
+            continue
+        conn.execute(ai_models.update().where(ai_models.c.id == row.id).values(api_key_mask=_mask(api_key)))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ai_models', 'api_key_mask')
@@ -0,0 +1,29 @@
+"""template blob structure
+
+Revision ID: 8eae0fff198c
+Revises: a80e9ab434e7
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8eae0fff198c'
+down_revision: Union[str, Sequence[str], None] = 'a80e9ab434e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 已有 blob 的结构在首次使用时从文件解析并回写
+    op.add_column('template_blobs', sa.Column('structure', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('template_blobs', 'structure')
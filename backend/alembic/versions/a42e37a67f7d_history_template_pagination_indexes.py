@@ -0,0 +1,30 @@
+"""history and template pagination indexes
+
+Revision ID: a42e37a67f7d
+Revises: 4779b06c4a5a
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a42e37a67f7d'
+down_revision: Union[str, Sequence[str], None] = '4779b06c4a5a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_document_history_user_id_created_at', 'document_history', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_templates_user_id_status_uploaded_at', 'templates', ['user_id', 'status', 'uploaded_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_templates_user_id_status_uploaded_at', table_name='templates')
+    op.drop_index('ix_document_history_user_id_created_at', table_name='document_history')
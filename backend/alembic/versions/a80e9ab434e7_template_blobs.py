@@ -0,0 +1,49 @@
+"""template blobs
+
+Revision ID: a80e9ab434e7
+Revises: 5c6f760060c8
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a80e9ab434e7'
+down_revision: Union[str, Sequence[str], None] = '5c6f760060c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'template_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('sha256')
+    )
+    op.create_index('ix_template_blobs_id', 'template_blobs', ['id'], unique=False)
+    # 已有模板保持原样（文本仍在 templates.content），重新上传/更新文件时才迁入 blob
+    op.add_column('templates', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.create_index('ix_templates_blob_id', 'templates', ['blob_id'], unique=False)
+    op.create_foreign_key('fk_templates_blob_id', 'templates', 'template_blobs', ['blob_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_templates_blob_id', 'templates', type_='foreignkey')
+    op.drop_index('ix_templates_blob_id', table_name='templates')
+    op.drop_column('templates', 'blob_id')
+    op.drop_index('ix_template_blobs_id', table_name='template_blobs')
+    op.drop_table('template_blobs')
@@ -0,0 +1,26 @@
+"""merge empty database baseline
+
+Revision ID: f2b7c4e91d03
+Revises: 8eae0fff198c, 593a84e34c3f
+Create Date: 2025-09-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7c4e91d03'
+# 合并顺序决定升级顺序：先执行后列出的分支（空库基线），再执行主链
+down_revision: Union[str, Sequence[str], None] = ('8eae0fff198c', '593a84e34c3f')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    pass
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    pass
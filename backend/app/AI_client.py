@@ -1,24 +1,44 @@
 import os
 from abc import ABC, abstractmethod
-from dotenv import load_dotenv
 from .encryption import decrypt_api_key
-from .models import AIModel, Conversation 
-from sqlalchemy.orm import Session
-from typing import Optional, Dict,Iterator,Union
-import requests
+from .log_config import get_sampled_logger
+from .client_registry import client_registry, api_key_fingerprint, httpx_limits, HTTP2_ENABLED
+from .resilience import (
+    get_breaker, get_retry_budget, is_transient_error, backoff_delay, RETRY_MAX_ATTEMPTS
+)
+from .models import AIModel, Conversation, Model
+from sqlalchemy.orm import Session, joinedload
+from dataclasses import dataclass
+from typing import Optional, Dict,Iterator,Union,AsyncIterator,List
+import asyncio
 import json
-# 加载环境变量
-load_dotenv()
+import time
+
+# 逐片段调试日志（量大，默认按 LOG_SAMPLE_RATES 抽样）
+chunk_logger = get_sampled_logger("app.ai_client.chunks")
+
+# SDK 客户端自身不重试（SDK 默认 max_retries=2）：重试只由 ResilientClient 处理，
+# 使每次请求都计入重试预算与熔断器，退避也不会与 SDK 的退避叠加
+SDK_MAX_RETRIES = 0
 
 # 基础AI客户端抽象类
 class BaseAIClient(ABC):
-    @abstractmethod
-    def __init__(self, api_key: str, base_url: str = None, model: str = None):
-        # 统一解密API Key
-        self.api_key = decrypt_api_key(api_key)
+    def __init__(self, api_key: str, base_url: str = None, model: str = None, api_key_encrypted: bool = True):
+        # 统一解密API Key（已解密的Key通过 api_key_encrypted=False 传入，避免重复解密）
+        self.api_key = decrypt_api_key(api_key) if api_key_encrypted else api_key
         self.base_url = base_url
         self.model = model or self._get_default_model()
-        self.client = self._initialize_client()
+        self.client = self._pooled_client("sync", self._initialize_client)
+
+    def _pool_key(self) -> tuple:
+        """连接复用键：同一平台 + BaseURL + API Key 共享底层客户端"""
+        return (type(self).__name__, self.base_url, api_key_fingerprint(self.api_key))
+
+    def _pooled_client(self, kind: str, factory):
+        """从进程级注册表获取客户端（不存在时调用 factory 创建）；本对象存活期间客户端不会被关闭"""
+        return client_registry.get_or_create(
+            self._pool_key(), api_key_fingerprint(self.api_key), kind, factory, owner=self
+        )
 
     @abstractmethod
     def _get_default_model(self) -> str:
@@ -39,6 +59,35 @@ class BaseAIClient(ABC):
         """生成文本的流式接口（迭代返回片段）"""
         pass
 
+    # ---------------- 异步接口（供 FastAPI 事件循环直接使用） ----------------
+    @property
+    def async_client(self):
+        """异步客户端（首次使用时从注册表获取，避免纯同步场景的额外开销）"""
+        return self._pooled_client("async", self._initialize_async_client)
+
+    def _initialize_async_client(self):
+        """初始化平台异步客户端；返回 None 表示该平台无原生异步实现"""
+        return None
+
+    async def agenerate(self, prompt: str, system_prompt: str = None) -> str:
+        """生成文本的异步接口（默认在线程中执行同步实现）"""
+        if system_prompt is None:
+            return await asyncio.to_thread(self.generate, prompt)
+        return await asyncio.to_thread(self.generate, prompt, system_prompt)
+
+    async def astream_generate(self, prompt: str, system_prompt: str = None) -> AsyncIterator[str]:
+        """生成文本的异步流式接口（默认逐片段在线程中拉取同步迭代器，不阻塞事件循环）"""
+        if system_prompt is None:
+            iterator = self.stream_generate(prompt)
+        else:
+            iterator = self.stream_generate(prompt, system_prompt)
+        sentinel = object()
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, sentinel)
+            if chunk is sentinel:
+                break
+            yield chunk
+
 # OpenAI客户端实现
 class OpenAIClient(BaseAIClient):
     def _get_default_model(self) -> str:
@@ -46,10 +95,12 @@ class OpenAIClient(BaseAIClient):
 
     def _initialize_client(self):
         try:
-            from openai import OpenAI
+            from openai import OpenAI, DefaultHttpxClient
             return OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url
+                base_url=self.base_url,
+                http_client=DefaultHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+                max_retries=SDK_MAX_RETRIES
             )
         except ImportError:
             raise ImportError("请安装OpenAI SDK: pip install openai")
@@ -78,22 +129,58 @@ class OpenAIClient(BaseAIClient):
             if content:  # 过滤空内容
                 yield content
 
+    def _initialize_async_client(self):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=DefaultAsyncHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+            max_retries=SDK_MAX_RETRIES
+        )
+
+    async def agenerate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        completion = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+        )
+        return completion.choices[0].message.content
+
+    async def astream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> AsyncIterator[str]:
+        """异步流式生成（OpenAI兼容接口）"""
+        stream = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            stream=True
+        )
+        async for chunk in stream:
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
 # 通义千问客户端实现
 class QwenClient(BaseAIClient):
     # 实现抽象基类的构造方法
-    def __init__(self, api_key: str, base_url: str = None, model: str = None):
+    def __init__(self, api_key: str, base_url: str = None, model: str = None, api_key_encrypted: bool = True):
         # 调用父类的构造方法，完成基础初始化
-        super().__init__(api_key=api_key, base_url=base_url, model=model)
+        super().__init__(api_key=api_key, base_url=base_url, model=model, api_key_encrypted=api_key_encrypted)
 
     def _get_default_model(self) -> str:
         return "qwen-plus"
 
     def _initialize_client(self):
         try:
-            from openai import OpenAI
+            from openai import OpenAI, DefaultHttpxClient
             return OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1"
+                base_url=self.base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1",
+                http_client=DefaultHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+                max_retries=SDK_MAX_RETRIES
             )
         except ImportError:
             raise ImportError("请安装OpenAI SDK: pip install openai")
@@ -121,26 +208,64 @@ class QwenClient(BaseAIClient):
         
         for chunk_idx, chunk in enumerate(stream):
             content = ""  # 初始化，避免未定义
-            print(f"[Qwen 流式片段 {chunk_idx}] 存在choices: {bool(chunk.choices)}")
-            
             if not chunk.choices or len(chunk.choices) == 0:
                 continue
             
             choice = chunk.choices[0]
             if choice.finish_reason is not None:
-                print(f"[Qwen 流式结束] finish_reason: {choice.finish_reason}")
+                chunk_logger.debug("Qwen 流式结束 chunk=%d finish_reason=%s", chunk_idx, choice.finish_reason)
                 break
             
             if choice.delta and choice.delta.content is not None:
                 content = choice.delta.content.strip()
                 # ✅ 新增：过滤长度为0的空片段
                 if len(content) == 0:
-                    print(f"[Qwen 过滤空片段] 片段 {chunk_idx} 内容为空，跳过")
                     continue
                 
-                print(f"[Qwen 有效片段 {chunk_idx}] 内容: {content}")
+                chunk_logger.debug("Qwen 有效片段 chunk=%d length=%d", chunk_idx, len(content))
                 yield content
 
+    def _initialize_async_client(self):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1",
+            http_client=DefaultAsyncHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+            max_retries=SDK_MAX_RETRIES
+        )
+
+    async def agenerate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        completion = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+        )
+        return completion.choices[0].message.content
+
+    async def astream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> AsyncIterator[str]:
+        """异步流式生成（片段过滤规则与 stream_generate 保持一致）"""
+        stream = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.finish_reason is not None:
+                break
+            if choice.delta and choice.delta.content is not None:
+                content = choice.delta.content.strip()
+                if content:
+                    yield content
+
 
 # Anthropic客户端实现
 class AnthropicClient(BaseAIClient):
@@ -149,8 +274,12 @@ class AnthropicClient(BaseAIClient):
 
     def _initialize_client(self):
         try:
-            from anthropic import Anthropic
-            return Anthropic(api_key=self.api_key)
+            from anthropic import Anthropic, DefaultHttpxClient
+            return Anthropic(
+                api_key=self.api_key,
+                http_client=DefaultHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+                max_retries=SDK_MAX_RETRIES
+            )
         except ImportError:
             raise ImportError("请安装Anthropic SDK: pip install anthropic")
 
@@ -176,15 +305,65 @@ class AnthropicClient(BaseAIClient):
                 if event.type == "content_block_delta":
                     # 提取流式片段
                     yield event.delta.text
+
+    def _initialize_async_client(self):
+        from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+        return AsyncAnthropic(
+            api_key=self.api_key,
+            http_client=DefaultAsyncHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+            max_retries=SDK_MAX_RETRIES
+        )
+
+    async def agenerate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        message = await self.async_client.messages.create(
+            model=self.model,
+            max_tokens=1024,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            system=system_prompt
+        )
+        return message.content[0].text
+
+    async def astream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> AsyncIterator[str]:
+        """异步流式生成（Anthropic Claude）"""
+        async with self.async_client.messages.stream(
+            model=self.model,
+            max_tokens=1024,
+            messages=[{"role": "user", "content": prompt}],
+            system=system_prompt
+        ) as stream:
+            async for event in stream:
+                if event.type == "content_block_delta":
+                    yield event.delta.text
 # 百度文心一言/千帆客户端实现
+# 流式响应结束标记（"data: [DONE]"）
+_STREAM_DONE = object()
+
+
+def _sse_data(line: str) -> Optional[str]:
+    """
+    取一行 SSE 响应的数据部分：去掉开头的 "data:" 前缀（只去一次，不会误删内容中的字符）；
+    空行返回 None
+    """
+    line = line.strip()
+    if line.startswith("data:"):
+        line = line[len("data:"):].strip()
+    return line or None
+
+
+def _chat_messages(prompt: str, system_prompt: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+
 class ErnieClient(BaseAIClient):
     # 实现抽象基类要求的__init__方法
-    def __init__(self, api_key: str, base_url: str = None, model: str = None):
-        # 初始化基类未实现的属性
-        self.api_key = api_key
-        self.base_url = base_url
-        self.model = model or self._get_default_model()  # 使用默认模型（如果未指定）
-        self.client = self._initialize_client()  # 初始化请求客户端
+    def __init__(self, api_key: str, base_url: str = None, model: str = None, api_key_encrypted: bool = True):
+        # 与其他平台一致：数据库中的Key为加密存储，由基类统一解密
+        super().__init__(api_key=api_key, base_url=base_url, model=model, api_key_encrypted=api_key_encrypted)
 
     def _get_default_model(self) -> str:
         """返回默认模型，使用百度千帆上的deepseek模型作为示例"""
@@ -192,6 +371,7 @@ class ErnieClient(BaseAIClient):
 
     def _initialize_client(self):
         """初始化请求会话，设置超时和连接池管理"""
+        import requests
         session = requests.Session()
         # 设置超时时间：连接超时10秒，读取超时30秒
         session.timeout = (10, 30)
@@ -203,6 +383,7 @@ class ErnieClient(BaseAIClient):
         ))
         return session
 
+    # ---------------- 同步/异步接口共用的请求构建与响应解析 ----------------
     def _get_request_headers(self) -> dict:
         """构建请求头"""
         return {
@@ -216,78 +397,104 @@ class ErnieClient(BaseAIClient):
             return self.base_url
         return "https://qianfan.baidubce.com/v2/chat/completions"
 
-    def generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
-        """全量生成文本"""
-        url = self._get_api_endpoint()
-        headers = self._get_request_headers()
-        
+    def _build_payload(self, prompt: str, system_prompt: str, stream: bool = False) -> dict:
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
+            "messages": _chat_messages(prompt, system_prompt)
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    @staticmethod
+    def _parse_result(result: dict) -> str:
+        if result.get("choices") and len(result["choices"]) > 0:
+            return result["choices"][0]["message"]["content"]
+        raise RuntimeError("百度API返回为空，未包含choices字段")
+
+    @staticmethod
+    def _parse_stream_line(line: str):
+        """解析一行流式响应：返回文本片段，None 表示跳过该行，_STREAM_DONE 表示结束"""
+        data = _sse_data(line)
+        if data is None:
+            return None
+        if data == "[DONE]":
+            return _STREAM_DONE
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        if "error" in chunk:
+            raise RuntimeError(f"流式错误: {chunk['error']['message']}")
+        choices = chunk.get("choices") or []
+        if choices and choices[0].get("delta") and "content" in choices[0]["delta"]:
+            return choices[0]["delta"]["content"] or None
+        return None
 
+    def generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        """全量生成文本"""
         try:
-            response = self.client.post(url, headers=headers, json=payload)
+            response = self.client.post(
+                self._get_api_endpoint(), headers=self._get_request_headers(),
+                json=self._build_payload(prompt, system_prompt)
+            )
             response.raise_for_status()
-            result = response.json()
-            
-            if result.get("choices") and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"]
-            
-            raise RuntimeError("百度API返回为空，未包含choices字段")
-            
+            return self._parse_result(response.json())
         except Exception as e:
             raise RuntimeError(f"全量生成错误: {str(e)}") from e
 
     def stream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> Iterator[str]:
         """流式生成文本"""
-        url = self._get_api_endpoint()
-        headers = self._get_request_headers()
-        
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            "stream": True
-        }
-
         try:
-            with self.client.post(url, headers=headers, json=payload, stream=True) as response:
+            with self.client.post(
+                self._get_api_endpoint(), headers=self._get_request_headers(),
+                json=self._build_payload(prompt, system_prompt, stream=True), stream=True
+            ) as response:
                 response.raise_for_status()
-                
                 for line in response.iter_lines(decode_unicode=True):
-                    if not line:
-                        continue
-                    
-                    line = line.lstrip("data: ").strip()
-                    if line == "[DONE]":
+                    content = self._parse_stream_line(line or "")
+                    if content is _STREAM_DONE:
+                        break
+                    if content:
+                        yield content
+        except Exception as e:
+            raise RuntimeError(f"流式生成错误: {str(e)}") from e
+
+    def _initialize_async_client(self):
+        """初始化异步HTTP客户端（超时与连接池配置同同步会话）"""
+        import httpx
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx_limits(),
+            http2=HTTP2_ENABLED
+        )
+
+    async def agenerate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        """异步全量生成文本"""
+        try:
+            response = await self.async_client.post(
+                self._get_api_endpoint(), headers=self._get_request_headers(),
+                json=self._build_payload(prompt, system_prompt)
+            )
+            response.raise_for_status()
+            return self._parse_result(response.json())
+        except Exception as e:
+            raise RuntimeError(f"全量生成错误: {str(e)}") from e
+
+    async def astream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> AsyncIterator[str]:
+        """异步流式生成文本"""
+        try:
+            async with self.async_client.stream(
+                "POST", self._get_api_endpoint(), headers=self._get_request_headers(),
+                json=self._build_payload(prompt, system_prompt, stream=True)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    content = self._parse_stream_line(line)
+                    if content is _STREAM_DONE:
                         break
-                    
-                    if not line:
-                        continue
-                    
-                    try:
-                        chunk = json.loads(line)
-                        if "error" in chunk:
-                            raise RuntimeError(f"流式错误: {chunk['error']['message']}")
-                            
-                        if (chunk.get("choices") and 
-                            len(chunk["choices"]) > 0 and 
-                            chunk["choices"][0].get("delta") and 
-                            "content" in chunk["choices"][0]["delta"]):
-                            
-                            content = chunk["choices"][0]["delta"]["content"]
-                            if content:
-                                yield content
-                                
-                    except json.JSONDecodeError:
-                        continue
-                        
+                    if content:
+                        yield content
         except Exception as e:
             raise RuntimeError(f"流式生成错误: {str(e)}") from e
 
@@ -305,71 +512,101 @@ class SparkClient(BaseAIClient):
         except ImportError:
             raise ImportError("请安装requests: pip install requests")
 
-    def generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
-        """全量生成（讯飞星火原生API）"""
+    # ---------------- 同步/异步接口共用的请求构建与响应解析 ----------------
+    def _get_api_endpoint(self) -> str:
         # 讯飞星火API要求：base_url需包含版本路径（如/v3.1/chat/completions）
         if not self.base_url:
             raise ValueError("讯飞星火客户端必须配置base_url（如：https://spark-api.xf-yun.com/v3.1/chat/completions）")
-        
-        headers = {
+        return self.base_url
+
+    def _get_request_headers(self) -> dict:
+        return {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+
+    def _build_payload(self, prompt: str, system_prompt: str, stream: bool = False) -> dict:
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            "messages": _chat_messages(prompt, system_prompt),
             "max_tokens": 2048,  # 讯飞星火默认最大 tokens
             "temperature": 0.7
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    @staticmethod
+    def _parse_stream_line(line: str):
+        """解析一行流式响应（data: {"id":"...","choices":[...]}）：返回文本片段、None（跳过）或 _STREAM_DONE"""
+        data = _sse_data(line)
+        if data is None:
+            return None
+        if data == "[DONE]":  # 流式结束标记
+            return _STREAM_DONE
+        try:
+            chunk_data = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        content = chunk_data["choices"][0]["delta"].get("content")
+        if content and len(content.strip()) > 0:
+            return content
+        return None
 
-        response = self.client.post(self.base_url, headers=headers, json=payload)
+    def generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        """全量生成（讯飞星火原生API）"""
+        response = self.client.post(
+            self._get_api_endpoint(), headers=self._get_request_headers(),
+            json=self._build_payload(prompt, system_prompt)
+        )
         response.raise_for_status()  # 抛出HTTP错误
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        return response.json()["choices"][0]["message"]["content"]
 
     def stream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> Iterator[str]:
         """流式生成（讯飞星火原生API，基于SSE）"""
-        if not self.base_url:
-            raise ValueError("讯飞星火客户端必须配置base_url（如：https://spark-api.xf-yun.com/v3.1/chat/completions）")
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 2048,
-            "temperature": 0.7,
-            "stream": True
-        }
-
-        # 流式请求（SSE格式，需解析分块数据）
         with self.client.post(
-            self.base_url, headers=headers, json=payload, stream=True
+            self._get_api_endpoint(), headers=self._get_request_headers(),
+            json=self._build_payload(prompt, system_prompt, stream=True), stream=True
         ) as response:
             response.raise_for_status()
             for line in response.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                # 讯飞星火SSE格式：data: {"id":"...","choices":[...]}
-                line = line.lstrip("data: ").strip()
-                if line == "[DONE]":  # 流式结束标记
+                content = self._parse_stream_line(line or "")
+                if content is _STREAM_DONE:
                     break
-                try:
-                    import json
-                    chunk_data = json.loads(line)
-                    content = chunk_data["choices"][0]["delta"].get("content")
-                    if content and len(content.strip()) > 0:
-                        yield content
-                except json.JSONDecodeError:
-                    continue
+                if content:
+                    yield content
+
+    def _initialize_async_client(self):
+        """初始化讯飞星火异步HTTP客户端"""
+        import httpx
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx_limits(),
+            http2=HTTP2_ENABLED
+        )
+
+    async def agenerate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        """异步全量生成（讯飞星火原生API）"""
+        response = await self.async_client.post(
+            self._get_api_endpoint(), headers=self._get_request_headers(),
+            json=self._build_payload(prompt, system_prompt)
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def astream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> AsyncIterator[str]:
+        """异步流式生成（讯飞星火原生API，基于SSE）"""
+        async with self.async_client.stream(
+            "POST", self._get_api_endpoint(), headers=self._get_request_headers(),
+            json=self._build_payload(prompt, system_prompt, stream=True)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                content = self._parse_stream_line(line)
+                if content is _STREAM_DONE:
+                    break
+                if content:
+                    yield content
 
 class GLMClient(BaseAIClient):
     def _get_default_model(self) -> str:
@@ -379,12 +616,14 @@ class GLMClient(BaseAIClient):
     def _initialize_client(self):
         """初始化GLM客户端（基于OpenAI兼容接口）"""
         try:
-            from openai import OpenAI
+            from openai import OpenAI, DefaultHttpxClient
             # 智谱兼容接口默认地址：https://open.bigmodel.cn/api/paas/v4/chat/completions
             default_base_url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
             return OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url or default_base_url
+                base_url=self.base_url or default_base_url,
+                http_client=DefaultHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+                max_retries=SDK_MAX_RETRIES
             )
         except ImportError:
             raise ImportError("请安装OpenAI SDK: pip install openai")
@@ -419,11 +658,55 @@ class GLMClient(BaseAIClient):
             if content and len(content.strip()) > 0:
                 yield content
 
+    def _initialize_async_client(self):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        default_base_url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url or default_base_url,
+            http_client=DefaultAsyncHttpxClient(http2=HTTP2_ENABLED, limits=httpx_limits()),
+            max_retries=SDK_MAX_RETRIES
+        )
+
+    async def agenerate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        """异步全量生成（GLM兼容接口）"""
+        completion = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=2048
+        )
+        return completion.choices[0].message.content
+
+    async def astream_generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> AsyncIterator[str]:
+        """异步流式生成（GLM兼容接口）"""
+        stream = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=2048,
+            stream=True
+        )
+        async for chunk in stream:
+            content = chunk.choices[0].delta.content
+            if content and len(content.strip()) > 0:
+                yield content
+
 class LLaMAClient(BaseAIClient):
     def _get_default_model(self) -> str:
         """LLaMA 2 默认模型（Hugging Face 模型名）"""
         return "meta-llama/Llama-2-7b-chat-hf"  # 7B对话版（需申请访问权限）
 
+    def _pool_key(self) -> tuple:
+        """InferenceClient 绑定模型，复用键需包含模型名"""
+        return super()._pool_key() + (self.model,)
+
     def _initialize_client(self):
         """初始化LLaMA客户端（基于Hugging Face Inference API）"""
         try:
@@ -469,6 +752,10 @@ class GeminiClient(BaseAIClient):
     def _get_default_model(self) -> str:
         return "gemini-pro"
 
+    def _pool_key(self) -> tuple:
+        """GenerativeModel 绑定模型，复用键需包含模型名"""
+        return super()._pool_key() + (self.model,)
+
     def _initialize_client(self):
         try:
             import google.generativeai as genai
@@ -490,6 +777,109 @@ class GeminiClient(BaseAIClient):
         for chunk in response:
             if chunk.text:  # 过滤空内容
                 yield chunk.text
+# 容错包装：熔断 + 重试预算 + 指数退避（对调用方透明）
+class ResilientClient:
+    """
+    包装平台客户端：
+    - 所有调用先经过 (平台, BaseURL) 熔断器，熔断中直接失败
+    - 非流式 generate/agenerate 为幂等调用，平台不可用类错误在重试预算内按指数退避+抖动重试
+    - 流式调用不重试（由 failover 切换备用模型），仅向熔断器上报结果
+    其余属性透传给被包装的客户端
+    """
+
+    def __init__(self, client: BaseAIClient, provider: str):
+        self.wrapped = client
+        self.breaker = get_breaker(provider, client.base_url)
+        self.retry_budget = get_retry_budget(provider, client.base_url)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    @staticmethod
+    def _args(prompt: str, system_prompt: Optional[str]) -> tuple:
+        # system_prompt 为 None 时使用各平台自身的默认值
+        return (prompt,) if system_prompt is None else (prompt, system_prompt)
+
+    def _should_retry(self, exc: Exception, attempt: int) -> bool:
+        return (
+            attempt < RETRY_MAX_ATTEMPTS
+            and is_transient_error(exc)
+            and self.retry_budget.try_acquire()
+        )
+
+    def generate(self, prompt: str, system_prompt: str = None) -> str:
+        self.retry_budget.record_request()
+        attempt = 1
+        while True:
+            self.breaker.before_call()
+            try:
+                result = self.wrapped.generate(*self._args(prompt, system_prompt))
+            except Exception as e:
+                self.breaker.record_error(e)
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def agenerate(self, prompt: str, system_prompt: str = None) -> str:
+        self.retry_budget.record_request()
+        attempt = 1
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await self.wrapped.agenerate(*self._args(prompt, system_prompt))
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self.breaker.record_error(e)
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stream_generate(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        self.breaker.before_call()
+        reported = False
+        try:
+            for chunk in self.wrapped.stream_generate(*self._args(prompt, system_prompt)):
+                if not reported:
+                    # 收到首个片段即认为平台可用
+                    self.breaker.record_success()
+                    reported = True
+                yield chunk
+        except Exception as e:
+            self.breaker.record_error(e)
+            reported = True
+            raise
+        finally:
+            if not reported:
+                self.breaker.release()
+
+    async def astream_generate(self, prompt: str, system_prompt: str = None) -> AsyncIterator[str]:
+        self.breaker.before_call()
+        reported = False
+        try:
+            async for chunk in self.wrapped.astream_generate(*self._args(prompt, system_prompt)):
+                if not reported:
+                    self.breaker.record_success()
+                    reported = True
+                yield chunk
+        except Exception as e:
+            self.breaker.record_error(e)
+            reported = True
+            raise
+        finally:
+            if not reported:
+                self.breaker.release()
+
+
 # AI客户端工厂类
 class AIClientFactory:
     SUPPORTED_PROVIDERS = {
@@ -509,7 +899,7 @@ class AIClientFactory:
         return list(cls.SUPPORTED_PROVIDERS.keys())
 
     @classmethod
-    def create_client(cls, provider: str, api_key: str, base_url: str = None, model: str = None):
+    def create_client(cls, provider: str, api_key: str, base_url: str = None, model: str = None, api_key_encrypted: bool = True):
         """创建指定平台的客户端实例"""
         provider = provider.lower()
         if provider not in cls.SUPPORTED_PROVIDERS:
@@ -517,9 +907,21 @@ class AIClientFactory:
         
         client_class = cls.SUPPORTED_PROVIDERS[provider]
         try:
-            return client_class(api_key=api_key, base_url=base_url, model=model)
+            client = client_class(api_key=api_key, base_url=base_url, model=model, api_key_encrypted=api_key_encrypted)
         except Exception as e:
             raise RuntimeError(f"初始化{provider}客户端失败: {str(e)}") from e
+        return ResilientClient(client, provider)
+
+    @classmethod
+    def create_client_for_context(cls, context: "GenerationContext"):
+        """根据已解析的生成上下文创建客户端（Key 已解密，无需再查库/解密）"""
+        return cls.create_client(
+            provider=context.provider,
+            api_key=context.api_key,
+            base_url=context.base_url,
+            model=context.model_name,
+            api_key_encrypted=False
+        )
 
 
 # 基于环境变量的默认生成函数（向后兼容）
@@ -536,36 +938,175 @@ def generate_text(prompt: str) -> str:
         client = QwenClient(
             api_key=qwen_api_key,
             base_url=qwen_api_url,
-            model=qwen_model
+            model=qwen_model,
+            api_key_encrypted=False  # 环境变量中为明文Key
         )
         return client.generate(prompt)
     except Exception as e:
         raise RuntimeError(f"生成文本失败: {str(e)}") from e
 
 
+# 平台名称映射（数据库存储名 → 客户端工厂标识）
+PLATFORM_MAPPING = {
+    "Alibaba": "qwen",
+    "OpenAI": "openai",
+    "Anthropic": "anthropic",
+    "Google": "gemini"
+}
+
+
+def normalize_provider(platform_name: str) -> str:
+    """将数据库中的平台名称转换为 AIClientFactory 的平台标识"""
+    return PLATFORM_MAPPING.get(platform_name, platform_name.lower())
+
+
+@dataclass(frozen=True)
+class GenerationContext:
+    """单次生成请求解析一次的模型配置（Key 已解密），直接交给客户端层使用"""
+    provider: str
+    api_key: str
+    model_name: str
+    base_url: Optional[str]
+    ai_model_id: int
+    platform_name: str
+
+    @property
+    def used_model(self) -> str:
+        """展示用模型名称，如 "OpenAI - gpt-4o" """
+        return f"{self.platform_name} - {self.model_name}"
+
+    @classmethod
+    def from_ai_model(cls, ai_model: AIModel) -> "GenerationContext":
+        """由已预加载 Model/Platform 关联的 AIModel 构建上下文"""
+        platform_name = ai_model.model.platform.name
+        return cls(
+            provider=normalize_provider(platform_name),
+            api_key=decrypt_api_key(ai_model.api_key),
+            model_name=ai_model.model.name,
+            base_url=ai_model.effective_base_url or None,
+            ai_model_id=ai_model.id,
+            platform_name=platform_name
+        )
+
+
+def _find_preferred_ai_model(user_id: int, db: Session) -> Optional[AIModel]:
+    """
+    查询用户偏好的AI模型（预加载 Model → Platform）
+    优先取最近更新会话所用的模型，其次取最新添加的模型
+    """
+    last_used_ai_model = db.query(AIModel).join(
+        Conversation, Conversation.ai_model_id == AIModel.id
+    ).filter(
+        Conversation.user_id == user_id,
+        AIModel.user_id == user_id
+    ).options(
+        joinedload(AIModel.model).joinedload(Model.platform)
+    ).order_by(
+        Conversation.updated_at.desc()
+    ).first()
+    if last_used_ai_model:
+        return last_used_ai_model
+
+    return db.query(AIModel).filter(
+        AIModel.user_id == user_id
+    ).options(
+        joinedload(AIModel.model).joinedload(Model.platform)
+    ).order_by(
+        AIModel.created_at.desc()
+    ).first()
+
+
+def resolve_generation_context(
+    user_id: int,
+    db: Session,
+    ai_model_id: Optional[int] = None
+) -> Optional[GenerationContext]:
+    """
+    解析本次生成使用的模型配置（每个请求只查询/解密一次）
+    - 指定 ai_model_id 时严格使用该模型（不存在或不属于该用户返回 None）
+    - 未指定时使用用户偏好模型
+    """
+    if ai_model_id:
+        ai_model = db.query(AIModel).filter(
+            AIModel.id == ai_model_id,
+            AIModel.user_id == user_id
+        ).options(
+            joinedload(AIModel.model).joinedload(Model.platform)
+        ).first()
+    else:
+        ai_model = _find_preferred_ai_model(user_id, db)
+
+    if not ai_model:
+        return None
+    return GenerationContext.from_ai_model(ai_model)
+
+
+def resolve_fallback_contexts(
+    user_id: int,
+    db: Session,
+    primary: GenerationContext,
+    limit: int = 2
+) -> List[GenerationContext]:
+    """
+    解析主模型之外的备用模型配置（用于故障切换/对冲请求；仅在用户未手动指定模型时使用）
+    按用户配置的更新时间倒序，跳过暂不支持的平台及与主模型相同的平台+模型
+    """
+    if limit <= 0:
+        return []
+    candidates = db.query(AIModel).filter(
+        AIModel.user_id == user_id,
+        AIModel.id != primary.ai_model_id
+    ).options(
+        joinedload(AIModel.model).joinedload(Model.platform)
+    ).order_by(
+        AIModel.updated_at.desc(), AIModel.id.desc()
+    ).all()
+
+    fallbacks = []
+    seen = {(primary.provider, primary.model_name, primary.base_url)}
+    for ai_model in candidates:
+        provider = normalize_provider(ai_model.model.platform.name)
+        identity = (provider, ai_model.model.name, ai_model.effective_base_url or None)
+        if provider not in AIClientFactory.SUPPORTED_PROVIDERS or identity in seen:
+            continue
+        try:
+            fallbacks.append(GenerationContext.from_ai_model(ai_model))
+        except Exception:
+            # Key 无法解密等异常配置不作为备用
+            continue
+        seen.add(identity)
+        if len(fallbacks) >= limit:
+            break
+    return fallbacks
+
+
+def create_client_for_user(user_id: int, db: Session) -> BaseAIClient:
+    """根据用户模型偏好创建客户端（同步查询数据库，异步路由中需放入线程池调用）"""
+    if db is None:
+        raise ValueError("必须提供数据库会话对象(db)")
+
+    context = resolve_generation_context(user_id, db)
+    if not context:
+        raise ValueError("用户未设置AI模型偏好")
+
+    return AIClientFactory.create_client_for_context(context)
+
+
 # 用户级生成函数
 def generate_text_for_user(
     user_id: int, 
     prompt: str, 
     system_prompt: str = None, 
     db: Session = None,
-    stream: bool = False  # 新增：是否流式输出
+    stream: bool = False,  # 新增：是否流式输出
+    context: Optional[GenerationContext] = None  # 已解析的生成上下文（传入时不再查库）
 ) -> Union[str, Iterator[str]]:
     """根据用户配置生成文本（支持流式/全量）"""
-    if db is None:
-        raise ValueError("必须提供数据库会话对象(db)")
-    
-    user_config = get_user_model_preference(user_id, db)
-    if not user_config:
-        raise ValueError("用户未设置AI模型偏好")
-
     try:
-        client = AIClientFactory.create_client(
-            provider=user_config["provider"],
-            api_key=user_config["api_key"],
-            base_url=user_config.get("base_url"),
-            model=user_config.get("model_name")
-        )
+        if context is not None:
+            client = AIClientFactory.create_client_for_context(context)
+        else:
+            client = create_client_for_user(user_id, db)
         
         if stream:
             try:
@@ -580,61 +1121,18 @@ def generate_text_for_user(
         raise RuntimeError(f"生成文本失败: {str(e)}") from e
 
 
-
-
 def get_user_model_preference(user_id: int, db: Session) -> Optional[Dict]:
     """
-    从数据库获取用户的AI模型偏好配置
+    从数据库获取用户的AI模型偏好配置（api_key 为加密值）
     """
-    # 导入需要的模型（确保已定义Platform模型）
-    from .models import Platform,Model  # 新增导入
-    
-    # 第一步：优先查询用户上次使用的AI模型
-    latest_conversation = db.query(Conversation).filter(
-        Conversation.user_id == user_id
-    ).order_by(
-        Conversation.updated_at.desc()
-    ).first()
-    
-    if latest_conversation:
-        # 预加载完整关联链：AIModel → Model → Platform
-        last_used_ai_model = db.query(AIModel).filter(
-            AIModel.id == latest_conversation.ai_model_id,
-            AIModel.user_id == user_id
-        ).join(
-            AIModel.model  # 关联到Model
-        ).join(
-            Model.platform  # 关联到Platform
-        ).first()
-        
-        if last_used_ai_model:
-            return {
-                # 通过Platform模型获取名称
-                "provider": last_used_ai_model.model.platform.name,
-                "api_key": last_used_ai_model.api_key,
-                "model_name": last_used_ai_model.model.name,
-                "base_url": last_used_ai_model.base_url
-            }
-    
-    # 第二步：若无使用记录，取用户最新添加的AI模型
-    latest_added_ai_model = db.query(AIModel).filter(
-        AIModel.user_id == user_id
-    ).join(
-        AIModel.model
-    ).join(
-        Model.platform
-    ).order_by(
-        AIModel.created_at.desc()
-    ).first()
-    
-    if not latest_added_ai_model:
+    ai_model = _find_preferred_ai_model(user_id, db)
+    if not ai_model:
         return None
-    
-    # 第三步：格式化返回
+
     return {
         # 通过Platform模型获取名称
-        "provider": latest_added_ai_model.model.platform.name,
-        "api_key": latest_added_ai_model.api_key,
-        "model_name": latest_added_ai_model.model.name,
-        "base_url": latest_added_ai_model.base_url
+        "provider": ai_model.model.platform.name,
+        "api_key": ai_model.api_key,
+        "model_name": ai_model.model.name,
+        "base_url": ai_model.base_url
     }
@@ -1,2 +1,2 @@
-from .conversations import router as conv_router   # 注意前面加了点“.”
-from .models import *
\ No newline at end of file
+# 包初始化不做任何事（不导入子模块、不加载 .env）：
+# 导入 app.xxx 时不会连带加载整个应用（路由、ORM、SDK 等），也不会读写环境
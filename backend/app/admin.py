@@ -0,0 +1,31 @@
+# admin.py
+"""管理员运维接口（需 role == "admin"）"""
+from fastapi import APIRouter, Depends, Query
+
+from .deps import require_admin
+from .query_stats import top_fingerprints, SLOW_QUERY_THRESHOLD_MS
+from .resilience import breaker_states
+from .template_store import collect_garbage, TEMPLATE_BLOB_GC_GRACE
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+# ----------------- 接口：查看各AI平台熔断器状态 -----------------
+@router.get("/circuit-breakers")
+def get_circuit_breakers():
+    return {"breakers": breaker_states()}
+
+
+# ----------------- 接口：慢查询统计（按语句指纹聚合，按总耗时倒序） -----------------
+@router.get("/slow-queries")
+def get_slow_queries(limit: int = Query(20, ge=1, le=200)):
+    return {
+        "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "top": top_fingerprints(limit)
+    }
+
+
+# ----------------- 接口：立即清理无引用的模板文件 -----------------
+@router.post("/template-blobs/gc")
+def run_template_blob_gc(grace: float = Query(TEMPLATE_BLOB_GC_GRACE, ge=0, description="引用数归零后的宽限期（秒）")):
+    return collect_garbage(grace)
@@ -1,57 +1,53 @@
 # api.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, Header
 from fastapi.responses import FileResponse, JSONResponse,StreamingResponse
 from fastapi.concurrency import run_in_threadpool
 import json
 import os, time
-from docx import Document
-from docx.shared import Pt
-from docx.oxml.ns import qn
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from dotenv import load_dotenv
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session, joinedload, undefer
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio
 from pydantic import ValidationError
 from typing import List, Optional
-from datetime import datetime
-import pytz
+from datetime import datetime, timezone
 import traceback
 import urllib
 import re
 # 导入自定义模块（确保路径正确）
-from .utils import save_uploaded_file
-from .AI_client import generate_text_for_user, get_user_model_preference ,AIClientFactory # 多平台Client核心函数
+from .utils import save_uploaded_file, SavedUpload, UploadTooLarge
+from .AI_client import resolve_generation_context, resolve_fallback_contexts, GenerationContext, AIClientFactory # 多平台Client核心函数
 from .database import SessionLocal, get_db,get_async_db 
 from .models import (
-    DocumentHistory, Template, AIModel, Conversation, Message, Platform,AIModelUpdate,
+    DocumentHistory, Template, TemplateBlob, AIModel, Conversation, Message, Platform,AIModelUpdate,
     AIModelResponse, PlatformModelResponse, User, AIModelCreate, SystemModelResponse, Model
 )
 from .deps import get_current_user
-from .encryption import encrypt_api_key, decrypt_api_key
+from .encryption import encrypt_api_key, decrypt_api_key, mask_api_key
+from .client_registry import client_registry
+from .sse import format_sse
+from .generation import GenerationRequest, run_generation
+from .generation_jobs import job_manager, JobQueueFull
+from .failover import GENERATION_FALLBACK_MAX
+from .pagination import capped_count, keyset_page
+from .template_store import TEMPLATE_BLOB_DIR, acquire_blob, release_blob
+from .template_structure import ParsedTemplate, parse_template, template_structures, structure_to_prompt, structure_layout
 import logging
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("api.log"), logging.StreamHandler()]
-)
+# 日志输出由 log_config.setup_logging 统一配置（队列 + 后台线程写入）
 logger = logging.getLogger(__name__)
-# 加载环境变量
-load_dotenv()
 
 router = APIRouter()
 
 # ----------------- 目录配置（保持原路径逻辑） -----------------
+# 目录均在首次写入时创建（utils.save_uploaded_file / docx_render），导入模块时不触碰磁盘
 # 上传模板目录
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # 生成文件保存目录
 DOWNLOAD_DIR = os.path.join(os.getcwd(), "generated_docs")
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
 # ----------------- 公文生成Prompt配置（保持原逻辑） -----------------
 PROMPTS = {
@@ -63,6 +59,35 @@ PROMPTS = {
     "对话": "你是专业的公文场景对话撰写助手，需围绕公文办理全流程（如公文起草沟通、审批意见反馈、事项协调对接等）撰写对话内容。需明确对话场景（如“公文起草小组沟通会议对话”“上下级机关审批意见反馈对话”）、对话主体（标注角色及职务，如“起草人-XX部科员”“审批人-XX局副局长”）、对话逻辑（需符合公文办理规范，内容需聚焦具体事项，如格式修改建议、内容补充要求、办理时限确认等），语言需贴合职场沟通语境，既保持正式性，又体现沟通的针对性与高效性。"
 }
 
+# 模板文件大小上限（字节）
+MAX_TEMPLATE_SIZE = int(os.getenv("MAX_TEMPLATE_SIZE", str(10 * 1024 * 1024)))
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+async def _store_template_upload(file: UploadFile) -> SavedUpload:
+    """
+    模板上传公共流程（上传与更新共用）：格式校验 -> 单次流式保存到 blob 目录（边读边限制大小、计算 SHA-256）
+    保存结果交给 template_store.acquire_blob：内容重复时直接复用已有 blob，不再解析
+    """
+    # 同时检查MIME类型和扩展名
+    if not (file.content_type == DOCX_CONTENT_TYPE and file.filename and file.filename.endswith(".docx")):
+        raise HTTPException(status_code=400, detail="请上传正确的docx格式文件")
+    try:
+        return await save_uploaded_file(file, TEMPLATE_BLOB_DIR, max_size=MAX_TEMPLATE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"文件过大，最大支持{MAX_TEMPLATE_SIZE//1024//1024}MB"
+        )
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"文件读取失败：{str(e)}")
+
+def _parse_template_docx(data: bytes) -> ParsedTemplate:
+    # 验证docx文件合法性（避免伪装成docx的恶意文件），直接从内存副本解析出文本与结构
+    try:
+        return parse_template(data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"无效的docx文件：{str(e)}")
+
 # ----------------- 核心接口：上传模板（增强安全校验） -----------------
 @router.post("/upload-template")
 async def upload_template(
@@ -70,54 +95,27 @@ async def upload_template(
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # 新增1：限制文件大小（例如最大10MB）
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    file_size = 0
-    try:
-        # 读取文件前先检查大小
-        while chunk := await file.read(1024 * 1024):  # 1MB块读取
-            file_size += len(chunk)
-            if file_size > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413, 
-                    detail=f"文件过大，最大支持{MAX_FILE_SIZE//1024//1024}MB"
-                )
-        # 重置文件指针（否则后续保存会是空文件）
-        await file.seek(0)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"文件读取失败：{str(e)}")
-    
-    # 原有格式校验增强：同时检查MIME类型和文件头
-    if not (file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" 
-            and file.filename and file.filename.endswith(".docx")):
-        raise HTTPException(status_code=400, detail="请上传正确的docx格式文件")
-    
-    # 保存文件
-    file_path = await save_uploaded_file(file, UPLOAD_DIR)
-    filename = os.path.basename(file_path)
-    
-    # 新增2：验证docx文件合法性（避免伪装成docx的恶意文件）
-    try:
-        # 尝试用python-docx打开，验证文件结构
-        doc = Document(file_path)
-        template_content = "\n".join([para.text for para in doc.paragraphs])
-    except Exception as e:
-        # 验证失败则删除无效文件
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        raise HTTPException(status_code=400, detail=f"无效的docx文件：{str(e)}")
-    
-    # 保存模板记录
-    template = Template(
-        user_id=current_user.id,
-        filename=filename,
-        original_name=file.filename,
-        content=template_content,
-        status="active"
-    )
-    db.add(template)
-    db.commit()
-    db.refresh(template)
+    saved = await _store_template_upload(file)
+
+    # docx 解析与数据库写入均为同步操作，放入线程池执行
+    def save_template():
+        # 相同文件复用已有 blob（文件与解析文本只存一份）
+        blob = acquire_blob(db, saved, _parse_template_docx)
+        # 保存模板记录
+        template = Template(
+            user_id=current_user.id,
+            filename=blob.filename,
+            original_name=file.filename,
+            blob_id=blob.id,
+            status="active"
+        )
+        db.add(template)
+        db.commit()
+        db.refresh(template)
+        return template
+
+    template = await run_in_threadpool(save_template)
+    logger.info("模板已上传 id=%s size=%d sha256=%s", template.id, saved.size, saved.sha256)
     
     return {
         "id": template.id,
@@ -126,300 +124,184 @@ async def upload_template(
         "uploaded_at": template.uploaded_at
     }
 
-# ----------------- 核心接口：公文生成（适配多平台Client+数据库会话） -----------------
-@router.post("/generate")
-async def generate_document(
-    doc_type: str = Form(...),
-    user_input: str = Form(...),
-    conv_id: Optional[int] = Form(None),
-    ai_model_id: Optional[int] = Form(None),
-    template_id: Optional[int] = Form(None),
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    公文生成接口（默认流式输出）
-    - 流式返回AI生成的文本片段（SSE格式）
-    - 生成完成后返回文件、会话等元数据
-    """
+
+def _prepare_generation(
+    doc_type: str,
+    user_input: str,
+    conv_id: Optional[int],
+    ai_model_id: Optional[int],
+    template_id: Optional[int],
+    current_user,
+    db: Session
+) -> GenerationRequest:
+    """生成前置步骤：组装Prompt、解析模型配置（均在请求阶段完成，失败直接返回HTTP错误）"""
     # -------------------------- 1. 前置校验与Prompt组装 --------------------------
     # 1.1 组装公文Prompt（含模板内容）
     base_prompt = PROMPTS.get(doc_type, f"请写一份正式公文：{doc_type}")
+    template_layout = None
     if template_id:
         # 校验模板归属与有效性
         template = db.query(Template).filter(
             Template.id == template_id,
             Template.user_id == current_user.id,
             Template.status == "active"
-        ).first()
+        ).options(joinedload(Template.blob)).first()
         if not template:
             raise HTTPException(status_code=404, detail="指定模板不存在或无权访问")
-        prompt = f"{base_prompt}\n模板内容：{template.content}\n用户要求：{user_input}"
+        if template.blob is not None:
+            # 结构化模板（标题层级、表格、页眉页脚、待填写项）从进程内缓存读取，不再打开docx
+            structure = template_structures.load(template.blob, TEMPLATE_BLOB_DIR)
+            template_content = structure_to_prompt(structure)
+            template_layout = structure_layout(structure)
+        else:
+            # 旧数据只有纯文本
+            template_content = template.content
+        prompt = f"{base_prompt}\n模板内容：{template_content}\n用户要求：{user_input}"
     else:
+        template_content = None
         prompt = f"{base_prompt}\n用户要求：{user_input}"
 
-    # 1.2 获取用户AI模型配置（优先手动选择，其次默认偏好）
-    selected_ai_model: Optional[AIModel] = None
+    # 1.2 解析本次生成的模型配置（优先手动选择，其次默认偏好；整个请求只查询/解密一次）
     try:
+        generation_ctx: Optional[GenerationContext] = resolve_generation_context(
+            user_id=current_user.id, db=db, ai_model_id=ai_model_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取模型配置失败：{str(e)}")
+    if not generation_ctx:
         if ai_model_id:
-            # 优先使用用户手动选择的模型（预加载Platform关联）
-            selected_ai_model = db.query(AIModel).filter(
-                AIModel.id == ai_model_id,
-                AIModel.user_id == current_user.id
-            ).options(
-                joinedload(AIModel.model).joinedload(Model.platform)
-            ).first()
-            if not selected_ai_model:
-                raise HTTPException(status_code=404, detail="选择的AI模型不存在或无权访问")
-
-            # 平台名称映射（数据库存储名 → 客户端工厂标识）
-            platform_mapping = {
-                "Alibaba": "qwen",
-                "OpenAI": "openai",
-                "Anthropic": "anthropic",
-                "Google": "gemini"
-            }
-            db_platform = selected_ai_model.model.platform.name
-            user_config = {
-                "provider": platform_mapping.get(db_platform, db_platform.lower()),
-                "api_key": decrypt_api_key(selected_ai_model.api_key),
-                "model_name": selected_ai_model.model.name,
-                "base_url": selected_ai_model.effective_base_url  # 假设models中定义了effective_base_url属性
-            }
+            raise HTTPException(status_code=404, detail="选择的AI模型不存在或无权访问")
+        raise HTTPException(status_code=400, detail="请先在「API Keys管理」中添加AI模型配置")
 
-        else:
-            # 无手动选择时，使用用户默认偏好（上次使用/最新添加）
-            user_config = get_user_model_preference( 
-                user_id=current_user.id, db=db
-            )
-            if not user_config:
-                raise HTTPException(status_code=400, detail="请先在「API Keys管理」中添加AI模型配置")
-
-            # 平台名称映射（同手动选择逻辑）
-            platform_mapping = {
-                "Alibaba": "qwen",
-                "OpenAI": "openai",
-                "Anthropic": "anthropic",
-                "Google": "gemini"
-            }
-            user_config["provider"] = platform_mapping.get(
-                user_config["provider"],
-                user_config["provider"].lower()
+    if generation_ctx.provider not in AIClientFactory.SUPPORTED_PROVIDERS:
+        raise HTTPException(status_code=400, detail="所选AI平台暂不支持")
+
+    # 1.3 未手动选择模型时，用户配置的其他模型作为备用（主模型失败/过慢时切换）；
+    #     手动选择的模型严格使用，不切换
+    fallbacks = []
+    if not ai_model_id:
+        try:
+            fallbacks = resolve_fallback_contexts(
+                current_user.id, db, generation_ctx, limit=GENERATION_FALLBACK_MAX
             )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"获取模型配置失败：{str(e)}")
 
-            # 同步获取模型实例（用于后续会话关联）
-            selected_ai_model = db.query(AIModel).filter(
-                AIModel.model.has(
-                    Model.platform.has(name=user_config["provider"]),
-                    name=user_config["model_name"]
-                ),
-                AIModel.user_id == current_user.id
-            ).options(
-                joinedload(AIModel.model).joinedload(Model.platform)
-            ).first()
-            if not selected_ai_model:
-                raise HTTPException(status_code=500, detail="用户默认模型配置异常，请重新添加")
-
-    except HTTPException as e:
-        raise e  # 直接抛出前置校验异常
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取模型配置失败：{str(e)}")
+    return GenerationRequest(
+        user_id=current_user.id,
+        doc_type=doc_type,
+        user_input=user_input,
+        prompt=prompt,
+        system_prompt=base_prompt,
+        context=generation_ctx,
+        output_dir=DOWNLOAD_DIR,
+        conv_id=conv_id,
+        template_id=template_id,
+        template_content=template_content,
+        template_layout=template_layout,
+        fallbacks=tuple(fallbacks)
+    )
 
-    # -------------------------- 2. 初始化流式生成 --------------------------
-    # 用线程池包装同步函数（避免阻塞FastAPI事件循环）
-    try:
-        generated_iterator: Iterator[str] = await run_in_threadpool(
-            generate_text_for_user,
-            user_id=current_user.id,
-            prompt=prompt,
-            system_prompt=base_prompt,
-            db=db,
-            stream=True  # 强制开启流式（默认行为）
-        )
-    except Exception as e:
-        error_msg = str(e)
-        # 格式化常见错误
-        if "401" in error_msg and "invalid_api_key" in error_msg.lower():
-            raise HTTPException(status_code=401, detail="API Key不正确或已失效")
-        elif "不支持的平台" in error_msg:
-            raise HTTPException(status_code=400, detail="所选AI平台暂不支持")
-        else:
-            raise HTTPException(status_code=500, detail=f"流式生成初始化失败：{error_msg}")
 
-    # -------------------------- 3. 定义SSE流式生成器 --------------------------
-    full_content: list[str] = []  # 收集完整内容（用于后续DOCX生成和数据库存储）
+# ----------------- 核心接口：公文生成（适配多平台Client+数据库会话） -----------------
+@router.post("/generate")
+async def generate_document(
+    doc_type: str = Form(...),
+    user_input: str = Form(...),
+    conv_id: Optional[int] = Form(None),
+    ai_model_id: Optional[int] = Form(None),
+    template_id: Optional[int] = Form(None),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    公文生成接口（默认流式输出）
+    - 流式返回AI生成的文本片段（SSE格式，事件带id）
+    - 生成完成后返回文件、会话等元数据
+    - 生成在后台任务中执行，断线后可通过 /generate/jobs/{job_id}/events 续传
+    """
+    # 校验与模型配置解析为同步数据库操作，放入线程池执行
+    generation_request = await run_in_threadpool(
+        _prepare_generation, doc_type, user_input, conv_id, ai_model_id, template_id, current_user, db
+    )
+    # 生成与入库由任务 worker 驱动，客户端断线不影响；本连接仅订阅任务事件
+    job = _submit_generation_job(current_user.id, generation_request)
+    return _job_event_stream(job, last_event_id=None)
 
-    async def sse_generator():
-        nonlocal full_content
-        try:
-            # 3.1 实时返回流式文本片段
-            for chunk in generated_iterator:
-                if chunk.strip():  # 过滤空片段
-                    full_content.append(chunk)
-                    # 按SSE规范返回（data字段+JSON序列化，避免前端解析异常）
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                    # 可选：控制流速度（避免前端处理过快）
-                    await asyncio.sleep(0.01)
-
-            # 3.2 流式结束后，处理完整内容（DOCX生成+数据库存储）
-            generated_full = "".join(full_content)
-            if not generated_full:
-                yield f"event: error\ndata: {json.dumps({'detail': 'AI生成内容为空'})}\n\n"
-                return
-
-            # -------------------------- 3.2.1 生成DOCX文件 --------------------------
-            doc = Document()
-            # 设置公文标准格式（仿宋GB2312、小四号字、无段间距）
-            normal_style = doc.styles["Normal"]
-            font = normal_style.font
-            font.name = "FangSong_GB2312"
-            font.size = Pt(16)
-            normal_style._element.rPr.rFonts.set(qn("w:eastAsia"), "FangSong_GB2312")
-            normal_style.paragraph_format.space_before = Pt(0)
-            normal_style.paragraph_format.space_after = Pt(0)
-
-            # 解析Markdown格式（标题、加粗、斜体）
-            for line in generated_full.split("\n"):
-                line = line.strip()
-                if not line:
-                    continue
-                # 处理标题（# 一级 / ## 二级 / ### 三级）
-                if line.startswith("# "):
-                    doc.add_heading(line[2:], level=1)
-                elif line.startswith("## "):
-                    doc.add_heading(line[3:], level=2)
-                elif line.startswith("### "):
-                    doc.add_heading(line[4:], level=3)
-                else:
-                    # 处理加粗（**内容**）和斜体（*内容*）
-                    para = doc.add_paragraph()
-                    bold_parts = line.split("**")
-                    for i, part in enumerate(bold_parts):
-                        if i % 2 == 1:  # 奇数段为加粗内容
-                            run = para.add_run(part)
-                            run.bold = True
-                        else:
-                            italic_parts = part.split("*")
-                            for j, sub_part in enumerate(italic_parts):
-                                run = para.add_run(sub_part)
-                                if j % 2 == 1:  # 奇数段为斜体内容
-                                    run.italic = True
-
-            # 保存DOCX（用户ID+时间戳避免冲突）
-            os.makedirs(DOWNLOAD_DIR, exist_ok=True)  # 确保目录存在
-            filename = f"{doc_type}_{current_user.id}_{int(time.time())}.docx"
-            file_path = os.path.join(DOWNLOAD_DIR, filename)
-            doc.save(file_path)
-
-            # -------------------------- 3.2.2 保存数据库记录 --------------------------
-            # 1. 保存公文历史
-            doc_record = DocumentHistory(
-                user_id=current_user.id,
-                doc_type=doc_type,
-                content=generated_full,
-                filename=filename,
-                template_id=template_id
-            )
-            db.add(doc_record)
-            db.flush()  # 提前获取doc_id，避免依赖commit
-
-            # 2. 处理会话（创建/更新）
-            if conv_id:
-                # 更新已有会话
-                conversation = db.query(Conversation).filter(
-                    Conversation.id == conv_id,
-                    Conversation.user_id == current_user.id
-                ).first()
-                if not conversation:
-                    yield f"event: error\ndata: {json.dumps({'detail': '指定会话不存在'})}\n\n"
-                    db.rollback()
-                    return
-                conversation.updated_at = datetime.now(pytz.UTC)
-                conversation.ai_model_id = selected_ai_model.id
-                conversation.status = "active"
-            else:
-                # 创建新会话（生成简短标题）
-                input_short = user_input.strip()[:8] if len(user_input.strip()) > 8 else user_input.strip()
-                conversation = Conversation(
-                    user_id=current_user.id,
-                    ai_model_id=selected_ai_model.id,
-                    title=f"{doc_type}生成_{input_short}...",
-                    status="active",
-                    created_at=datetime.now(pytz.UTC),
-                    updated_at=datetime.now(pytz.UTC)
-                )
-                db.add(conversation)
-            db.flush()  # 提前获取conversation_id
-
-            # 3. 保存消息记录（用户输入+AI回复）
-            user_msg = Message(
-                conversation_id=conversation.id,
-                role="user",
-                content=user_input,
-                created_at=datetime.now(pytz.UTC)
-            )
-            ai_msg = Message(
-                conversation_id=conversation.id,
-                role="assistant",
-                content=generated_full,
-                docx_file=filename,
-                created_at=datetime.now(pytz.UTC)
-            )
-            db.add_all([user_msg, ai_msg])
 
-            # 提交所有数据库操作
-            db.commit()
-            db.refresh(doc_record)
-            db.refresh(conversation)
-
-            # -------------------------- 3.2.3 发送元数据事件 --------------------------
-            # 包含文件下载、会话续接所需信息
-            metadata = {
-                "filename": filename,
-                "conv_id": conversation.id,
-                "doc_id": doc_record.id,
-                "used_model": f"{selected_ai_model.model.platform.name} - {selected_ai_model.model.name}",
-                "full_text": generated_full  
-            }
-            yield f"event: metadata\ndata: {json.dumps(metadata)}\n\n"
-            await asyncio.sleep(0.001)  # 强制推送
-
-            # -------------------------- 3.2.4 发送生成完成事件 --------------------------
-            yield f"event: complete\ndata: {json.dumps({'status': 'success', 'msg': '生成完成'})}\n\n"
-            await asyncio.sleep(0.001)
-        except Exception as e:
-            # 捕获生成过程中的异常，发送错误事件并回滚
-            error_detail = str(e)
-            # 格式化常见错误
-            if "permission denied" in error_detail.lower():
-                error_detail = "文件保存失败，请检查服务器权限"
-            elif "sqlalchemy" in error_detail.lower():
-                error_detail = "数据库操作失败，请稍后重试"
-            else:
-                error_detail = f"生成异常：{error_detail}"
+def _submit_generation_job(user_id: int, generation_request: GenerationRequest):
+    try:
+        return job_manager.submit(user_id, lambda: run_generation(generation_request))
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="生成任务繁忙，请稍后重试")
 
-            # 发送错误事件
-            yield f"event: error\ndata: {json.dumps({'detail': error_detail})}\n\n"
-            # 回滚未提交的数据库操作
-            db.rollback()
-        finally:
-            # 关闭数据库会话（根据依赖注入逻辑调整，避免连接泄漏）
-            db.close()
 
-    # -------------------------- 4. 返回StreamingResponse --------------------------
+def _job_event_stream(job, last_event_id: Optional[int]) -> StreamingResponse:
+    """订阅生成任务事件并以SSE返回（事件带id，断线后可用 Last-Event-ID 续传）"""
+    async def sse_generator():
+        async for seq, event, data in job.subscribe(last_event_id):
+            yield format_sse(data, event=event, event_id=seq)
+
     return StreamingResponse(
         sse_generator(),
         media_type="text/event-stream",  # SSE标准媒体类型
         headers={
             "Cache-Control": "no-cache",  # 禁止客户端缓存
             "Connection": "keep-alive",  # 保持长连接
-            "X-Accel-Buffering": "no"  # 禁用Nginx等反向代理的缓冲（关键！确保实时性）
+            "X-Accel-Buffering": "no",  # 禁用Nginx等反向代理的缓冲（关键！确保实时性）
+            "X-Job-Id": job.id
         }
     )
 
+
+# ----------------- 接口：以任务方式提交公文生成（立即返回任务ID） -----------------
+@router.post("/generate/jobs", status_code=202)
+async def submit_generate_job(
+    doc_type: str = Form(...),
+    user_input: str = Form(...),
+    conv_id: Optional[int] = Form(None),
+    ai_model_id: Optional[int] = Form(None),
+    template_id: Optional[int] = Form(None),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """提交生成任务后立即返回任务ID，结果通过事件订阅接口获取"""
+    # 校验与模型配置解析为同步数据库操作，放入线程池执行
+    generation_request = await run_in_threadpool(
+        _prepare_generation, doc_type, user_input, conv_id, ai_model_id, template_id, current_user, db
+    )
+    job = _submit_generation_job(current_user.id, generation_request)
+    return job.to_dict()
+
+
+# ----------------- 接口：查询生成任务状态 -----------------
+@router.get("/generate/jobs/{job_id}")
+async def get_generate_job(
+    job_id: str,
+    current_user = Depends(get_current_user)
+):
+    job = job_manager.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="生成任务不存在或已过期")
+    return job.to_dict()
+
+
+# ----------------- 接口：订阅生成任务事件（支持 Last-Event-ID 断点续传） -----------------
+@router.get("/generate/jobs/{job_id}/events")
+async def subscribe_generate_job(
+    job_id: str,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    from_event_id: Optional[int] = Query(None, description="无法设置请求头时，可用该参数指定续传位置"),
+    current_user = Depends(get_current_user)
+):
+    job = job_manager.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="生成任务不存在或已过期")
+    return _job_event_stream(job, last_event_id if last_event_id is not None else from_event_id)
+
 # ----------------- 接口：下载生成的DOCX文件（增强安全） -----------------
 @router.get("/download/{filename}")
-async def download(
+def download(
     filename: str, 
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -456,124 +338,131 @@ async def download(
 
     
 
+def _preview(text: Optional[str], length: int) -> str:
+    """列表预览：text 为数据库截取的前 length+1 个字符，超出 length 时截断并追加省略号"""
+    text = text or ""
+    return text[:length] + "..." if len(text) > length else text
+
+
 # ----------------- 接口：获取用户公文历史 -----------------
 # ----------------- 接口：获取用户公文历史（新增分页） -----------------
 @router.get("/history")
-async def get_history(
+def get_history(
     current_user = Depends(get_current_user), 
     db: Session = Depends(get_db),
-    page: int = Query(1, ge=1, description="页码，从1开始"),  # 新增分页参数
-    page_size: int = Query(10, ge=1, le=50, description="每页条数，最大50")  # 限制最大条数
+    page: int = Query(1, ge=1, description="页码，从1开始（传 cursor 时忽略）"),  # 新增分页参数
+    page_size: int = Query(10, ge=1, le=50, description="每页条数，最大50"),  # 限制最大条数
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，按游标翻页"),
+    with_total: Optional[bool] = Query(None, description="是否统计总数，默认页码模式统计、游标模式不统计")
 ):
-    # 计算偏移量
-    offset = (page - 1) * page_size
-    
-    # 1. 先查询总数（用于前端分页控件）
-    total = db.query(DocumentHistory).filter(
+    base_query = db.query(DocumentHistory).filter(
         DocumentHistory.user_id == current_user.id
-    ).count()
-    
-    # 2. 分页查询数据（仅加载当前页数据）
-    docs = db.query(DocumentHistory).filter(
-        DocumentHistory.user_id == current_user.id
-    ).order_by(DocumentHistory.created_at.desc())\
-     .offset(offset).limit(page_size).all()  # 分页核心逻辑
+    )
+
+    # 1. 总数（有上限，用于前端分页控件；游标翻页默认跳过）
+    total, total_exact = None, None
+    if (not cursor) if with_total is None else with_total:
+        total, total_exact = capped_count(base_query)
+
+    # 2. 分页查询数据：(created_at, id) 游标定位，翻页成本与页码无关
+    #    模板名称通过左外连接一并取回（仅有效模板），预览在数据库端截取，不传输完整正文；
+    #    多取 1 个字符用于判断是否需要省略号
+    page_query = base_query.outerjoin(
+        Template,
+        and_(Template.id == DocumentHistory.template_id, Template.status == "active")
+    ).with_entities(
+        DocumentHistory.id,
+        DocumentHistory.doc_type,
+        DocumentHistory.filename,
+        DocumentHistory.created_at,
+        Template.original_name.label("used_template"),
+        func.substr(DocumentHistory.content, 1, 51).label("content_preview")
+    )
+    docs, next_cursor = keyset_page(
+        page_query,
+        (DocumentHistory.created_at, DocumentHistory.id),
+        cursor,
+        page_size,
+        offset=(page - 1) * page_size
+    )
     
-    # 补充关联的模板名称
     result = []
     for doc in docs:
-        template_name = None
-        if doc.template_id:
-            # 优化：使用exists查询替代完整查询，减少IO
-            template_exists = db.query(Template).filter(
-                Template.id == doc.template_id,
-                Template.status == "active"
-            ).exists()
-            if db.query(template_exists).scalar():
-                template = db.query(Template).filter(
-                    Template.id == doc.template_id
-                ).with_entities(Template.original_name).first()
-                template_name = template.original_name if template else None
-        
         result.append({
             "id": doc.id,
             "doc_type": doc.doc_type,
             "filename": doc.filename,
-            "used_template": template_name,
+            "used_template": doc.used_template,
             "created_at": doc.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "content_preview": doc.content[:50] + "..." if len(doc.content) > 50 else doc.content
+            "content_preview": _preview(doc.content_preview, 50)
         })
     
     # 返回分页元数据+数据列表
     return {
         "total": total,
+        "total_exact": total_exact,
         "page": page,
         "page_size": page_size,
+        "next_cursor": next_cursor,
         "data": result
     }
 
 
 # ----------------- 接口：获取用户模板列表（新增分页） -----------------
 @router.get("/templates")
-async def get_templates(
+def get_templates(
     current_user = Depends(get_current_user), 
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=50)
+    page_size: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，按游标翻页"),
+    with_total: Optional[bool] = Query(None, description="是否统计总数，默认页码模式统计、游标模式不统计")
 ):
-    offset = (page - 1) * page_size
-    total = db.query(Template).filter(
-        Template.user_id == current_user.id,
-        Template.status == "active"
-    ).count()
-    
-    templates = db.query(Template).filter(
+    base_query = db.query(Template).filter(
         Template.user_id == current_user.id,
         Template.status == "active"
-    ).order_by(Template.uploaded_at.desc())\
-     .offset(offset).limit(page_size).all()
+    )
+
+    total, total_exact = None, None
+    if (not cursor) if with_total is None else with_total:
+        total, total_exact = capped_count(base_query)
+
+    # 预览在数据库端截取（多取 1 个字符判断省略号），不加载完整模板内容；新模板的文本在共享 blob 中
+    page_query = base_query.outerjoin(TemplateBlob, Template.blob_id == TemplateBlob.id).with_entities(
+        Template.id,
+        Template.filename,
+        Template.original_name,
+        Template.uploaded_at,
+        func.substr(func.coalesce(TemplateBlob.content, Template.content), 1, 31).label("content_preview")
+    )
+    templates, next_cursor = keyset_page(
+        page_query,
+        (Template.uploaded_at, Template.id),
+        cursor,
+        page_size,
+        offset=(page - 1) * page_size
+    )
     
     return {
         "total": total,
+        "total_exact": total_exact,
         "page": page,
         "page_size": page_size,
+        "next_cursor": next_cursor,
         "data": [
             {
                 "id": t.id,
                 "filename": t.filename,
                 "original_name": t.original_name,
                 "uploaded_at": t.uploaded_at.strftime("%Y-%m-%d %H:%M:%S"),
-                "content_preview": t.content[:30] + "..." if len(t.content) > 30 else t.content
+                "content_preview": _preview(t.content_preview, 30)
             } for t in templates
         ]
     }
 
-# ----------------- 接口：获取用户模板列表 -----------------
-@router.get("/templates")
-async def get_templates(
-    current_user = Depends(get_current_user), 
-    db: Session = Depends(get_db)
-):
-    # 查询当前用户的有效模板（按上传时间倒序）
-    templates = db.query(Template).filter(
-        Template.user_id == current_user.id,
-        Template.status == "active"  # 只返回有效模板
-    ).order_by(Template.uploaded_at.desc()).all()
-    
-    return [
-        {
-            "id": t.id,
-            "filename": t.filename,
-            "original_name": t.original_name,
-            "uploaded_at": t.uploaded_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "content_preview": t.content[:30] + "..." if len(t.content) > 30 else t.content  # 模板内容预览
-        }
-        for t in templates
-    ]
-
 # ----------------- 接口：获取模板内容（从数据库读取，替代文件读取） -----------------
 @router.get("/template-content/{template_id}")  # 改用template_id，避免文件名依赖
-async def get_template_content(
+def get_template_content(
     template_id: int, 
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -583,6 +472,8 @@ async def get_template_content(
         Template.id == template_id,
         Template.user_id == current_user.id,
         Template.status == "active"
+    ).options(
+        undefer(Template.content), joinedload(Template.blob).undefer(TemplateBlob.content)
     ).first()
     
     if not template:
@@ -592,7 +483,7 @@ async def get_template_content(
     return JSONResponse({
         "id": template.id,
         "original_name": template.original_name,
-        "content": template.content
+        "content": template.text
     })
 
 # ----------------- 接口：获取用户API Key列表（解密脱敏） -----------------
@@ -625,17 +516,14 @@ async def get_user_ai_configs(
             if config.model and config.model.platform and hasattr(config.model.platform, "name"):
                 platform_name = config.model.platform.name or "未知平台"  # 处理空字符串
 
-            # 脱敏 API Key
-            try:
-                decrypted_key = decrypt_api_key(config.api_key) if config.api_key else ""
-            except:
-                decrypted_key = ""
-            if len(decrypted_key) <= 8 and decrypted_key:
-                api_key_mask = f"{decrypted_key[:4]}***"
-            elif decrypted_key:
-                api_key_mask = f"{decrypted_key[:4]}***{decrypted_key[-4:]}"
-            else:
-                api_key_mask = "***"
+            # 脱敏 API Key：优先使用写入时保存的脱敏值；历史数据（未回填）才解密计算
+            api_key_mask = config.api_key_mask
+            if not api_key_mask:
+                try:
+                    api_key_mask = mask_api_key(decrypt_api_key(config.api_key) if config.api_key else "")
+                except Exception:
+                    api_key_mask = ""
+            api_key_mask = api_key_mask or "***"
 
             # 构造符合 AIModelResponse 结构的字典
             validated_data.append({
@@ -651,15 +539,15 @@ async def get_user_ai_configs(
         return [AIModelResponse(**data) for data in validated_data]
 
     except ValidationError as e:
-        print(f"响应模型验证失败：{e}")
+        logger.error("响应模型验证失败：%s", e)
         raise HTTPException(status_code=500, detail="数据格式错误")
     except Exception as e:
-        print(f"接口错误：{str(e)}")
+        logger.exception("获取AI配置失败")
         raise HTTPException(status_code=500, detail="获取配置失败")
     
 # ----------------- 接口：获取支持的AI平台及模型列表 -----------------
 @router.get("/platforms", response_model=List[PlatformModelResponse])
-async def get_system_platforms(
+def get_system_platforms(
     include_details: bool = Query(False, description="是否返回模型详情（如描述、是否支持）"),
     db: Session = Depends(get_db)
 ):
@@ -678,7 +566,7 @@ async def get_system_platforms(
 
 
 @router.get("/platforms/{platform_id}/models", response_model=List[SystemModelResponse])
-async def get_platform_models(
+def get_platform_models(
     platform_id: int,
     db: Session = Depends(get_db)
 ):
@@ -707,7 +595,7 @@ async def get_platform_models(
 
 # ----------------- 接口：新增AI模型配置（加密存储） -----------------
 @router.post("/keys", response_model=AIModelResponse)
-async def create_ai_model(
+def create_ai_model(
     ai_model_create: AIModelCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -768,22 +656,18 @@ async def create_ai_model(
     # 加密 API Key 并创建配置
     try:
         encrypted_key = encrypt_api_key(ai_model_create.api_key)
+        # 脱敏值在写入时计算并持久化（列表接口无需解密）
+        api_key_mask = mask_api_key(ai_model_create.api_key)
         new_ai_config = AIModel(
             user_id=current_user.id,
             model_id=model_id,
             api_key=encrypted_key,
+            api_key_mask=api_key_mask,
             base_url=base_url
         )
         db.add(new_ai_config)
         db.commit()
         db.refresh(new_ai_config)
-
-        # 脱敏 API Key（手动构造返回字典，不依赖模型的 @property）
-        decrypted_key = decrypt_api_key(new_ai_config.api_key)
-        if len(decrypted_key) <= 8:
-            api_key_mask = f"{decrypted_key[:4]}***"
-        else:
-            api_key_mask = f"{decrypted_key[:4]}***{decrypted_key[-4:]}"
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"创建AI配置失败：{str(e)}")
@@ -803,7 +687,7 @@ async def create_ai_model(
 
 # ----------------- 接口：删除AI模型配置 -----------------
 @router.delete("/keys/{key_id}")
-async def delete_ai_model(
+def delete_ai_model(
     key_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -840,13 +724,19 @@ async def delete_ai_model(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"删除AI模型配置失败：{str(e)}")
 
+    # 4. 释放该 Key 在进程内复用的客户端连接
+    try:
+        client_registry.invalidate(decrypt_api_key(ai_model.api_key))
+    except Exception as e:
+        logger.warning(f"释放AI客户端连接失败：{str(e)}")
+
     # 返回完整的平台+模型名称（从关联表获取）
     platform_name = ai_model.model.platform.name
     model_name = ai_model.model.name
     return JSONResponse({"message": f"成功删除「{platform_name} - {model_name}」的API配置"})
 # ----------------- 接口：编辑AI模型配置（新增PUT接口） -----------------
 @router.put("/keys/{ai_model_id}", response_model=AIModelResponse)
-async def update_ai_model(
+def update_ai_model(
     ai_model_id: int,
     ai_model_update: AIModelUpdate,
     db: Session = Depends(get_db),
@@ -870,10 +760,18 @@ async def update_ai_model(
     if not system_model:
         raise HTTPException(status_code=400, detail="系统未支持该模型，无法切换")
 
+    # Key 或 BaseURL 变更前，先使旧 Key 对应的复用客户端失效
+    if ai_model_update.api_key or ai_model_update.base_url:
+        try:
+            client_registry.invalidate(decrypt_api_key(ai_model.api_key))
+        except Exception as e:
+            logger.warning(f"释放AI客户端连接失败：{str(e)}")
+
     # 关键：仅当 api_key 有值时才更新加密
     if ai_model_update.api_key:
         try:
             ai_model.api_key = encrypt_api_key(ai_model_update.api_key)
+            ai_model.api_key_mask = mask_api_key(ai_model_update.api_key)
         except Exception as e:
             db.rollback()
             raise HTTPException(status_code=500, detail=f"API Key 加密失败：{str(e)}")
@@ -886,12 +784,12 @@ async def update_ai_model(
     db.commit()
     db.refresh(ai_model)
 
-    # 构造返回数据（脱敏处理）
-    raw_key = decrypt_api_key(ai_model.api_key) if ai_model.api_key else ""
-    if len(raw_key) <= 8:
-        api_key_mask = f"{raw_key[:4]}***" if raw_key else ""
-    else:
-        api_key_mask = f"{raw_key[:4]}***{raw_key[-4:]}" if raw_key else ""
+    # 构造返回数据（脱敏处理；历史数据未回填脱敏值时解密计算）
+    api_key_mask = ai_model.api_key_mask
+    if not api_key_mask and ai_model.api_key:
+        api_key_mask = mask_api_key(decrypt_api_key(ai_model.api_key))
+        ai_model.api_key_mask = api_key_mask
+        db.commit()
 
     return {
         "id": ai_model.id,
@@ -913,12 +811,14 @@ async def update_template(
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # 1. 校验模板存在性
-    template = db.query(Template).filter(
-        Template.id == template_id,
-        Template.user_id == current_user.id,
-        Template.status == "active"
-    ).first()
+    # 1. 校验模板存在性（同步查询放入线程池）
+    template = await run_in_threadpool(
+        lambda: db.query(Template).filter(
+            Template.id == template_id,
+            Template.user_id == current_user.id,
+            Template.status == "active"
+        ).first()
+    )
     if not template:
         raise HTTPException(status_code=404, detail="模板不存在或无权修改")
     
@@ -926,38 +826,26 @@ async def update_template(
     if new_name and new_name.strip():
         template.original_name = new_name.strip()
     
-    # 3. 处理文件内容更新
-    if file:
-        # 复用上传时的安全校验逻辑
-        MAX_FILE_SIZE = 10 * 1024 * 1024
-        file_size = 0
-        try:
-            while chunk := await file.read(1024 * 1024):
-                file_size += len(chunk)
-                if file_size > MAX_FILE_SIZE:
-                    raise HTTPException(status_code=413, detail="文件过大")
-            await file.seek(0)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"文件读取失败：{str(e)}")
-        
-        if not (file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" 
-                and file.filename and file.filename.endswith(".docx")):
-            raise HTTPException(status_code=400, detail="请上传正确的docx格式文件")
-        
-        # 保存新文件并更新内容
-        file_path = await save_uploaded_file(file, UPLOAD_DIR)
-        template.filename = os.path.basename(file_path)
-        try:
-            doc = Document(file_path)
-            template.content = "\n".join([para.text for para in doc.paragraphs])
-        except Exception as e:
-            os.remove(file_path)
-            raise HTTPException(status_code=400, detail=f"无效的docx文件：{str(e)}")
+    # 3. 处理文件内容更新（与上传共用同一流程：校验、流式保存）
+    saved = await _store_template_upload(file) if file else None
     
     # 4. 提交更新
-    template.updated_at = datetime.now(pytz.UTC)  # 新增更新时间字段（需在models.Template中添加）
-    db.commit()
-    db.refresh(template)
+    template.updated_at = datetime.now(timezone.utc)  # 新增更新时间字段（需在models.Template中添加）
+
+    def commit_update():
+        if saved is not None:
+            # 引用新文件的 blob，释放旧 blob（旧数据的文本列同时清空）
+            old_blob_id = template.blob_id
+            blob = acquire_blob(db, saved, _parse_template_docx)
+            template.blob_id = blob.id
+            template.filename = blob.filename
+            template.content = None
+            if old_blob_id is not None:
+                release_blob(db, old_blob_id)
+        db.commit()
+        db.refresh(template)
+
+    await run_in_threadpool(commit_update)
     
     return {
         "id": template.id,
@@ -967,8 +855,9 @@ async def update_template(
     }
 # ----------------- 接口：测试文件写入权限（保留原功能） -----------------
 @router.get("/test-write")
-async def test_write():
+def test_write():
     try:
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
         test_file = os.path.join(DOWNLOAD_DIR, "test_write.txt")
         with open(test_file, "w", encoding="utf-8") as f:
             f.write(f"测试写入权限 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -976,21 +865,30 @@ async def test_write():
     except Exception as e:
         return {"status": "error", "message": f"写入权限测试失败：{str(e)}"}
 @router.post("/conversations/{conversation_id}/generate_title")
+async def generate_conversation_title(conversation_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    # 数据库查询为同步操作，放入线程池执行；AI 调用走异步接口
+    def load_conversation():
+        conversation = db.query(Conversation).filter(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        ).first()
+        if not conversation:
+            return None, [], None
+        messages = db.query(Message).filter(
+            Message.conversation_id == conversation_id
+        ).options(undefer(Message.content)).order_by(Message.id).limit(2).all()
+        ai_model = db.query(AIModel).filter(
+            AIModel.id == conversation.ai_model_id
+        ).options(
+            joinedload(AIModel.model).joinedload(Model.platform)
+        ).first()
+        return conversation, messages, ai_model
 
-def generate_conversation_title(conversation_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    # 1. 获取会话
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    # 1. 获取会话、最新消息及关联的AI模型配置
+    conversation, messages, ai_model = await run_in_threadpool(load_conversation)
     if not conversation:
         raise HTTPException(status_code=404, detail="会话不存在")
 
-    # 2. 获取最新消息
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.id).limit(2).all()
-
     # 3. 构建 prompt，确保 content 是字符串
     prompt_texts = []
     for m in messages:
@@ -1003,34 +901,31 @@ def generate_conversation_title(conversation_id: int, db: Session = Depends(get_
     if not prompt:
         prompt = "无消息内容"
 
-    # 4. 获取用户 AI 模型配置
-    ai_model = db.query(AIModel).filter(AIModel.id == conversation.ai_model_id).first()
+    # 4. 校验用户 AI 模型配置
     if not ai_model:
         raise HTTPException(status_code=400, detail="AI模型未配置")
 
     # 5. 调用 AI 生成标题
     try:
-        client = AIClientFactory.create_client(
-            provider=ai_model.platform.name,
-            api_key=ai_model.api_key,
-            base_url=ai_model.base_url,
-            model=ai_model.model.name
-        )
+        client = AIClientFactory.create_client_for_context(GenerationContext.from_ai_model(ai_model))
 
         title_prompt = f"根据以下对话内容生成一句简短标题:\n{prompt}"
-        response = client.generate(
+        response = await client.agenerate(
             prompt=title_prompt,
             system_prompt="你是一个公文助手，生成标题简明扼要"
         )
 
         # 6. 更新会话标题
-        conversation.title = response.strip()
-        db.commit()
+        def save_title():
+            conversation.title = response.strip()
+            db.commit()
+            return conversation.title
 
-        return {"title": conversation.title}
+        title = await run_in_threadpool(save_title)
+        return {"title": title}
 
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail=f"AI 生成标题失败: {str(e)}")
 
 
@@ -1,21 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException,Header,status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from .database import SessionLocal
 from .models import User
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from pydantic import BaseModel
+from typing import Optional
 import logging
+from .principal_cache import Principal, principal_cache
+from .password_hashing import pwd_context, password_hasher, PasswordHashBusy
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 router = APIRouter()
 
 class UserCreate(BaseModel):
@@ -41,31 +42,81 @@ def get_password_hash(password):
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=15))
+    # iat 用于区分同一用户的不同 token（认证缓存键为 sub + iat）
+    to_encode.update({"exp": expire, "iat": now})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def _hash_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="登录请求繁忙，请稍后重试", headers={"Retry-After": "1"})
+
+# 注册/登录：bcrypt 交给专用执行器，数据库操作放入线程池，均不阻塞事件循环
 @router.post("/register", response_model=dict)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.username == user.username).first()
-    if existing:
+async def register(user: UserCreate, db: Session = Depends(get_db)):
+    def username_taken():
+        return db.query(User.id).filter(User.username == user.username).first() is not None
+
+    if await run_in_threadpool(username_taken):
         raise HTTPException(status_code=400, detail="用户名已存在")
-    hashed_pw = get_password_hash(user.password)
-    db_user = User(username=user.username, password_hash=hashed_pw)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    try:
+        hashed_pw = await password_hasher.hash(user.password)
+    except PasswordHashBusy:
+        raise _hash_busy()
+
+    def save_user():
+        db_user = User(username=user.username, password_hash=hashed_pw)
+        db.add(db_user)
+        db.commit()
+
+    await run_in_threadpool(save_user)
     return {"msg": "注册成功"}
 
 @router.post("/login", response_model=Token)
-def login(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+async def login(user: UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.username == user.username).first()
+    )
+    if not db_user:
+        raise HTTPException(status_code=401, detail="用户名或密码错误")
+    try:
+        verified, new_hash = await password_hasher.verify_and_update(user.password, db_user.password_hash)
+    except PasswordHashBusy:
+        raise _hash_busy()
+    if not verified:
         raise HTTPException(status_code=401, detail="用户名或密码错误")
+    if new_hash:
+        # BCRYPT_ROUNDS 调整后，旧 cost 的哈希在登录成功时迁移
+        def save_hash():
+            db_user.password_hash = new_hash
+            db.commit()
+
+        await run_in_threadpool(save_hash)
     access_token = create_access_token({"sub": db_user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
-def get_current_user(db: Session = Depends(get_db), authorization: str = Header(...)):
+def resolve_principal(payload: dict) -> Optional[Principal]:
+    """
+    按 token 的 (sub, iat) 获取用户身份：优先读缓存，未命中才查库
+    查库使用独立 Session 并立即归还连接，认证本身不会让请求（尤其是流式请求）长期占用连接
+    """
+    username = payload.get("sub")
+    issued_at = payload.get("iat")
+    principal = principal_cache.get(username, issued_at)
+    if principal is not None:
+        return principal
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+    finally:
+        db.close()
+    principal_cache.set(username, issued_at, principal)
+    return principal
+
+def get_current_user(authorization: str = Header(...)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
@@ -74,27 +125,24 @@ def get_current_user(db: Session = Depends(get_db), authorization: str = Header(
     try:
         # Extract token from the Authorization header
         token = authorization.split(" ")[1]  # Expecting 'Bearer <token>'
-        logging.info(f"Received token: {token}")  # Log token
 
         # Decode the token
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        logging.info(f"Decoded token for user: {username}")
     except (JWTError, IndexError) as e:
-        logging.error(f"Error decoding token: {str(e)}")  # Log the error
+        logger.info("Error decoding token: %s", e)
         raise credentials_exception
 
     try:
-        # Fetch the user from the database
-        user = db.query(User).filter(User.username == username).first()
-        if user is None:
-            logging.error(f"User with username {username} not found")
-            raise credentials_exception
-        logging.info(f"User {username} found in the database")
+        # Fetch the user (cached by sub + iat)
+        user = resolve_principal(payload)
     except Exception as e:
-        logging.error(f"Error fetching user from DB: {str(e)}")
+        logger.error("Error fetching user from DB: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
+    if user is None:
+        logger.info("User with username %s not found", username)
+        raise credentials_exception
 
     return user
\ No newline at end of file
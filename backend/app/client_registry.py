@@ -0,0 +1,259 @@
+# client_registry.py
+"""
+进程级 AI 平台客户端注册表
+
+同一 (平台, BaseURL, API Key) 的请求复用同一个 SDK 客户端及其 keep-alive 连接池，
+避免每次 /api/generate、标题生成都重新建立 TLS 握手。
+- 容量有上限，按 LRU 淘汰
+- 超过空闲 TTL 未使用的客户端自动关闭
+- 淘汰时仍有请求在用（如流式生成中）的客户端延迟到请求结束后再关闭
+- API Key 变更/删除时按 Key 指纹失效
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+# 注册表容量与空闲超时（秒）
+CLIENT_POOL_SIZE = int(os.getenv("AI_CLIENT_POOL_SIZE", "64"))
+CLIENT_POOL_IDLE_TTL = float(os.getenv("AI_CLIENT_POOL_IDLE_TTL", "600"))
+
+# 单个客户端的 HTTP 连接池配置
+CLIENT_MAX_CONNECTIONS = int(os.getenv("AI_CLIENT_MAX_CONNECTIONS", "100"))
+CLIENT_MAX_KEEPALIVE = int(os.getenv("AI_CLIENT_MAX_KEEPALIVE", "20"))
+CLIENT_KEEPALIVE_EXPIRY = float(os.getenv("AI_CLIENT_KEEPALIVE_EXPIRY", "60"))
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_ENABLED = os.getenv("AI_CLIENT_HTTP2", "true").lower() == "true"
+except ImportError:
+    HTTP2_ENABLED = False
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """API Key 指纹（注册表中不以明文 Key 作为字典键）"""
+    return hashlib.sha256((api_key or "").encode()).hexdigest()
+
+
+def httpx_limits():
+    """构建共享连接池的 httpx 限制参数"""
+    import httpx
+    return httpx.Limits(
+        max_connections=CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=CLIENT_MAX_KEEPALIVE,
+        keepalive_expiry=CLIENT_KEEPALIVE_EXPIRY,
+    )
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _close_client(client, loop: Optional[asyncio.AbstractEventLoop] = None):
+    """关闭被淘汰的客户端（异步客户端投递回其所属事件循环关闭）"""
+    if client is None:
+        return
+    close = getattr(client, "aclose", None) or getattr(client, "close", None)
+    if close is None:
+        return
+    try:
+        if asyncio.iscoroutinefunction(close):
+            if loop is None or loop.is_closed():
+                return
+            if loop is _current_loop():
+                loop.create_task(close())
+            else:
+                asyncio.run_coroutine_threadsafe(close(), loop)
+        else:
+            close()
+    except Exception:
+        # 关闭失败不影响业务请求，连接会随对象回收释放
+        pass
+
+
+class _PoolEntry:
+    __slots__ = ("key_fingerprint", "clients", "last_used")
+
+    def __init__(self, key_fingerprint: str):
+        self.key_fingerprint = key_fingerprint
+        # kind -> (client, 创建时所属事件循环)
+        self.clients = {}
+        self.last_used = time.monotonic()
+
+
+class ClientRegistry:
+    """
+    有界 LRU + 空闲 TTL 的客户端注册表（线程安全）
+    取用客户端的对象（owner，即平台客户端包装）存活期间视为在用：
+    被淘汰/失效的客户端若仍在用（如流式生成进行中），延迟到最后一个 owner 释放后再关闭
+    """
+
+    def __init__(self, max_size: int = CLIENT_POOL_SIZE, idle_ttl: float = CLIENT_POOL_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[Hashable, _PoolEntry]" = OrderedDict()
+        # 可重入：owner 的 finalize 回调可能在持锁期间由垃圾回收触发（同一线程）
+        self._lock = threading.RLock()
+        # id(client) -> 在用 owner 数；已移出注册表、等待释放后关闭的客户端
+        self._users: Dict[int, int] = {}
+        self._retired: Dict[int, Tuple[object, Optional[asyncio.AbstractEventLoop]]] = {}
+        # owner -> 已登记的 id(client)（同一 owner 多次取用只计一次）
+        self._owners: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key: tuple, key_fingerprint: str, kind: str, factory: Callable, owner=None):
+        """
+        获取（或创建）指定键、指定类型（sync/async）的客户端
+        异步客户端绑定创建时的事件循环，循环变化时重新创建；
+        factory 在锁外执行（SDK 初始化较慢，不阻塞其他键），并发创建时以先写入者为准
+        """
+        loop = _current_loop() if kind == "async" else None
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            evicted.extend(self._expire_locked(now))
+            client = self._lookup_locked(key, kind, loop, now)
+            if client is not None:
+                self.hits += 1
+                self._lease_locked(client, owner)
+        if client is not None:
+            self._close_all(evicted)
+            return client
+
+        created = factory()
+        with self._lock:
+            now = time.monotonic()
+            client = self._lookup_locked(key, kind, loop, now)
+            if client is not None:
+                # 其他线程已抢先创建：使用已登记的客户端，丢弃本次创建的
+                self.hits += 1
+                evicted.append((created, loop))
+            else:
+                self.misses += 1
+                client = created
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = _PoolEntry(key_fingerprint)
+                    self._entries[key] = entry
+                self._entries.move_to_end(key)
+                entry.last_used = now
+                stale = entry.clients.get(kind)
+                if stale is not None:
+                    # 事件循环已变化的旧异步客户端
+                    evicted.append(stale)
+                entry.clients[kind] = (client, loop)
+                while len(self._entries) > self.max_size:
+                    _, old = self._entries.popitem(last=False)
+                    self.evictions += 1
+                    evicted.extend(old.clients.values())
+                    old.clients.clear()
+            self._lease_locked(client, owner)
+        self._close_all(evicted)
+        return client
+
+    def _lookup_locked(self, key: Hashable, kind: str, loop, now: float):
+        """命中时刷新 LRU 顺序与最近使用时间并返回客户端，否则返回 None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cached = entry.clients.get(kind)
+        if cached is None or (kind == "async" and cached[1] is not loop):
+            return None
+        self._entries.move_to_end(key)
+        entry.last_used = now
+        return cached[0]
+
+    def _lease_locked(self, client, owner):
+        """登记 owner 在用该客户端，owner 被回收时自动释放"""
+        if owner is None:
+            return
+        leased = self._owners.get(owner)
+        if leased is None:
+            leased = self._owners[owner] = set()
+        if id(client) in leased:
+            return
+        leased.add(id(client))
+        self._users[id(client)] = self._users.get(id(client), 0) + 1
+        weakref.finalize(owner, self._release, client)
+
+    def _release(self, client):
+        """owner 释放客户端；已淘汰的客户端在最后一个 owner 释放后关闭"""
+        with self._lock:
+            remaining = self._users.get(id(client), 0) - 1
+            if remaining > 0:
+                self._users[id(client)] = remaining
+                return
+            self._users.pop(id(client), None)
+            retired = self._retired.pop(id(client), None)
+        if retired is not None:
+            _close_client(*retired)
+
+    def _close_all(self, evicted: list):
+        """关闭移出注册表的客户端；仍在用的先挂起，等 owner 全部释放后再关闭"""
+        to_close = []
+        with self._lock:
+            for client, loop in evicted:
+                if self._users.get(id(client)):
+                    self._retired[id(client)] = (client, loop)
+                else:
+                    to_close.append((client, loop))
+        for client, loop in to_close:
+            _close_client(client, loop)
+
+    def _expire_locked(self, now: float) -> list:
+        """淘汰超过空闲 TTL 的条目（OrderedDict 头部即最久未使用）"""
+        expired = []
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_ttl:
+                break
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            expired.extend(entry.clients.values())
+            entry.clients.clear()
+        return expired
+
+    def invalidate(self, api_key: str) -> int:
+        """使指定 API Key 的所有客户端失效（Key 更新/删除时调用），返回失效条目数"""
+        fingerprint = api_key_fingerprint(api_key)
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e.key_fingerprint == fingerprint]
+            entries = [self._entries.pop(k) for k in keys]
+        self._close_all([pair for entry in entries for pair in entry.clients.values()])
+        return len(entries)
+
+    def clear(self):
+        """关闭并清空全部客户端（应用关闭时调用，不再等待在用的 owner）"""
+        with self._lock:
+            clients = [pair for entry in self._entries.values() for pair in entry.clients.values()]
+            clients.extend(self._retired.values())
+            self._entries.clear()
+            self._retired.clear()
+        for client, loop in clients:
+            _close_client(client, loop)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "retired_in_use": len(self._retired),
+                "http2": HTTP2_ENABLED,
+            }
+
+
+# 进程级单例
+client_registry = ClientRegistry()
@@ -0,0 +1,19 @@
+# config.py
+"""
+运行环境配置
+
+各模块在导入时通过 os.getenv 读取配置，因此 .env 须在导入这些模块之前加载。
+加载只在入口处显式调用（app.main、alembic/env.py）；测试、基准脚本等直接设置环境变量，不受 .env 影响。
+"""
+_loaded = False
+
+
+def setup_env():
+    """加载 .env（已存在的环境变量优先，不会被覆盖）；重复调用无副作用"""
+    global _loaded
+    if _loaded:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    _loaded = True
@@ -1,55 +1,85 @@
 # conversations.py
-from fastapi import APIRouter, HTTPException, Form, Depends
+from fastapi import APIRouter, HTTPException, Form, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
 from .auth import get_current_user
-from .database import get_db
-from .models import Conversation, Message, ConversationResponse, MessageResponse, AIModel  # 维持原有导入
+from .database import SessionLocal, get_db
+from .models import Conversation, Message, ConversationResponse, MessageResponse, AIModel, Model  # 维持原有导入
+from .pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_before
 from datetime import datetime, timezone
-from sqlalchemy.orm import Session, joinedload  # 新增joinedload用于预加载关联数据
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, joinedload, undefer  # 新增joinedload用于预加载关联数据
 from pydantic import BaseModel
-import pytz
+import os
 router = APIRouter()
 
+# 消息分页：默认/最大每页条数；NDJSON 导出时每批从数据库读取的行数
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+MESSAGE_PAGE_MAX = int(os.getenv("MESSAGE_PAGE_MAX", "200"))
+MESSAGE_STREAM_BATCH = int(os.getenv("MESSAGE_STREAM_BATCH", "100"))
+
 
 # 🔹 获取全部对话（按更新时间倒序，附带最后一条消息+模型信息）
 @router.get("/conversations", response_model=List[ConversationResponse])
-async def get_conversations(
+def get_conversations(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    limit: Optional[int] = Query(None, ge=1, le=100, description="每页条数，不传则返回全部"),
     db: Session = Depends(get_db), 
     current_user = Depends(get_current_user)
 ):
-    # 预加载ai_model关联，避免N+1查询
-    conversations = db.query(Conversation).filter(
+    # 最后一条消息预览：相关子查询 + (conversation_id, created_at) 索引，单条 SQL 取回；
+    # 数据库端只截取前 21 个字符（多取 1 个用于判断是否需要省略号），不传输完整消息内容
+    last_message = select(func.substr(Message.content, 1, 21)).where(
+        Message.conversation_id == Conversation.id
+    ).order_by(
+        Message.created_at.desc(), Message.id.desc()
+    ).limit(1).correlate(Conversation).scalar_subquery()
+
+    query = db.query(Conversation, last_message.label("last_message")).filter(
         Conversation.user_id == current_user.id
-    ).options(joinedload(Conversation.ai_model)).order_by(Conversation.updated_at.desc()).all()
-    
-    if not conversations:
-        return []
-    
+    ).options(
+        # 预加载 AIModel→Model→Platform，避免渲染模型信息时的 N+1
+        joinedload(Conversation.ai_model).joinedload(AIModel.model).joinedload(Model.platform)
+    )
+
+    # 游标分页：(updated_at, id) 倒序，命中 (user_id, updated_at, id) 索引
+    position = decode_cursor(cursor, 2)
+    if position:
+        query = query.filter(keyset_before((Conversation.updated_at, Conversation.id), position))
+    query = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+    if limit:
+        query = query.limit(limit + 1)
+    rows = query.all()
+
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.updated_at, last.id)
+
     result = []
-    for conv in conversations:
-        # 查最后一条消息（预览用）
-        last_message = db.query(Message).filter(
-            Message.conversation_id == conv.id
-        ).order_by(Message.created_at.desc()).first()
-        
-        # 查关联的模型信息（通过AIModel→Model→Platform链式关联）
+    for conv, preview in rows:
+        # 查关联的模型信息（通过AIModel→Model→Platform链式关联，均已预加载）
         ai_model_info = None
-        if conv.ai_model:  # 利用预加载的ai_model，无需再次查询
-            # 从AIModel关联到Model，再从Model关联到Platform
+        used_model = None
+        if conv.ai_model:
             platform_name = conv.ai_model.model.platform.name
             model_name = conv.ai_model.model.name
             ai_model_info = {
                 "platform": platform_name,
                 "model_name": model_name
             }
-        
+            used_model = f"{platform_name} - {model_name}"
+
         result.append({
             "id": conv.id,
             "title": conv.title,
             "created_at": conv.created_at,
             "updated_at": conv.updated_at,
             "ai_model_info": ai_model_info,
-            "last_message": last_message.content[:20] + "..." if last_message else None,
+            "used_model": used_model,
+            # 只有被截断（超过 20 个字符）时才加省略号
+            "last_message": preview[:20] + "..." if preview is not None and len(preview) > 20 else preview,
             "messages": []  # 列表页无需返回完整消息，符合ConversationResponse结构
         })
     
@@ -59,7 +89,7 @@ async def get_conversations(
 # 🔹 新建对话（支持指定AI模型）
 # 🔹 新建对话（支持指定AI模型）
 @router.post("/conversations")
-async def new_conversation(
+def new_conversation(
     title: str = Form("新对话"),
     ai_model_id: Optional[int] = Form(None),
     db: Session = Depends(get_db),
@@ -113,18 +143,19 @@ async def new_conversation(
     }
 # 🔹 获取单个对话（附带消息列表+模型信息）
 @router.get("/conversations/{conv_id}", response_model=ConversationResponse)
-async def get_conversation(
+def get_conversation(
     conv_id: int, 
+    before_id: Optional[int] = Query(None, description="只返回该消息之前的消息（上一页的 next_before_id）"),
+    limit: Optional[int] = Query(None, ge=1, le=MESSAGE_PAGE_MAX, description="返回最近的若干条消息，不传则返回全部"),
     db: Session = Depends(get_db), 
     current_user = Depends(get_current_user)
 ):
-    # 预加载ai_model和messages关联，提升性能
+    # 预加载 AIModel→Model→Platform；消息单独按时间窗口查询，长会话不再一次性加载全部
     conversation = db.query(Conversation).filter(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
     ).options(
-        joinedload(Conversation.ai_model),
-        joinedload(Conversation.messages)
+        joinedload(Conversation.ai_model).joinedload(AIModel.model).joinedload(Model.platform)
     ).first()
     
     if not conversation:
@@ -137,21 +168,117 @@ async def get_conversation(
             "platform": conversation.ai_model.model.platform.name,
             "model_name": conversation.ai_model.model.name
         }
-    
-    # 直接返回预加载的messages，无需再次查询
+
+    messages, next_before_id = _message_window(db, conv_id, before_id, limit)
     return {
         "id": conversation.id,
         "title": conversation.title,
         "created_at": conversation.created_at,
         "updated_at": conversation.updated_at,
         "ai_model_info": ai_model_info,
-        "messages": conversation.messages  # 预加载的消息列表
+        "messages": messages,
+        "next_before_id": next_before_id
+    }
+
+
+def _get_owned_conversation_id(db: Session, conv_id: int, user_id: int) -> int:
+    owned = db.query(Conversation.id).filter(
+        Conversation.id == conv_id,
+        Conversation.user_id == user_id
+    ).scalar()
+    if owned is None:
+        raise HTTPException(404, "对话不存在")
+    return owned
+
+
+def _messages_before(query, db: Session, conv_id: int, before_id: Optional[int]):
+    """按 (created_at, id) 游标截取 before_id 之前的消息；before_id 不属于该会话时返回 400"""
+    if before_id is None:
+        return query
+    anchor = db.query(Message.created_at, Message.id).filter(
+        Message.id == before_id,
+        Message.conversation_id == conv_id
+    ).first()
+    if anchor is None:
+        raise HTTPException(status_code=400, detail="before_id 无效")
+    return query.filter(keyset_before((Message.created_at, Message.id), anchor))
+
+
+def _message_window(db: Session, conv_id: int, before_id: Optional[int], limit: Optional[int]):
+    """
+    取会话中最近的 limit 条消息（按时间正序返回）及下一页游标
+    倒序 + LIMIT 命中 (conversation_id, created_at) 索引，只读取当前窗口
+    """
+    query = db.query(Message).filter(
+        Message.conversation_id == conv_id
+    ).options(undefer(Message.content))
+    query = _messages_before(query, db, conv_id, before_id).order_by(
+        Message.created_at.desc(), Message.id.desc()
+    )
+    if limit:
+        query = query.limit(limit + 1)
+    messages = query.all()
+
+    next_before_id = None
+    if limit and len(messages) > limit:
+        messages = messages[:limit]
+        next_before_id = messages[-1].id
+    messages.reverse()
+    return messages, next_before_id
+
+
+# 🔹 分页获取对话消息（最新在后；按 next_before_id 向前翻页）
+@router.get("/conversations/{conv_id}/messages")
+def get_messages(
+    conv_id: int,
+    before_id: Optional[int] = Query(None, description="只返回该消息之前的消息（上一页的 next_before_id）"),
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_MAX),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    _get_owned_conversation_id(db, conv_id, current_user.id)
+    messages, next_before_id = _message_window(db, conv_id, before_id, limit)
+    return {
+        "data": [MessageResponse.model_validate(m) for m in messages],
+        "next_before_id": next_before_id
     }
 
 
+# 🔹 流式导出对话消息（NDJSON，每行一条消息，按时间正序）
+@router.get("/conversations/{conv_id}/messages/stream")
+def stream_messages(
+    conv_id: int,
+    before_id: Optional[int] = Query(None, description="只导出该消息之前的消息"),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    _get_owned_conversation_id(db, conv_id, current_user.id)
+    # 游标在请求阶段校验，格式错误直接返回 400
+    _messages_before(db.query(Message.id), db, conv_id, before_id)
+
+    def rows():
+        # 请求级 Session 在响应发送前就会关闭，流式读取使用独立 Session；
+        # yield_per 让驱动按批从服务端游标取数，内存占用与会话长度无关
+        stream_db = SessionLocal()
+        try:
+            query = stream_db.query(Message).filter(
+                Message.conversation_id == conv_id
+            ).options(undefer(Message.content))
+            query = _messages_before(query, stream_db, conv_id, before_id).order_by(
+                Message.created_at, Message.id
+            )
+            for message in query.yield_per(MESSAGE_STREAM_BATCH):
+                yield MessageResponse.model_validate(message).model_dump_json() + "\n"
+                stream_db.expunge(message)
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
 # 🔹 更新对话（支持修改标题/关联模型）
 @router.put("/conversations/{conv_id}")
-async def update_conversation(
+def update_conversation(
     conv_id: int,
     title: Optional[str] = Form(None),
     ai_model_id: Optional[int] = Form(None),
@@ -201,7 +328,7 @@ async def update_conversation(
 
 # 🔹 删除对话（级联删除关联消息）
 @router.delete("/conversations/{conv_id}")
-async def delete_conversation(
+def delete_conversation(
     conv_id: int, 
     db: Session = Depends(get_db), 
     current_user = Depends(get_current_user)
@@ -224,7 +351,7 @@ async def delete_conversation(
 
 # 🔹 往对话里追加消息（支持切换模型）
 @router.post("/conversations/{conv_id}/messages")
-async def add_message(
+def add_message(
     conv_id: int,
     role: str = Form(...),
     content: str = Form(...),
@@ -272,7 +399,8 @@ async def add_message(
     db.refresh(conversation)
     
     return {
-        "message": message,
+        # content 为延迟加载列，显式序列化（否则返回的消息不含正文）
+        "message": MessageResponse.model_validate(message),
         "conversation": {
             "id": conversation.id,
             "updated_at": conversation.updated_at,
@@ -303,7 +431,7 @@ def update_conversation_title(
         raise HTTPException(status_code=404, detail="对话不存在或无权限")
 
     conv.title = payload.title
-    conv.updated_at = datetime.now(pytz.UTC)
+    conv.updated_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(conv)
 
@@ -3,8 +3,8 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 from .database import SessionLocal
-from .models import User
-from .auth import SECRET_KEY, ALGORITHM
+from .principal_cache import Principal
+from .auth import SECRET_KEY, ALGORITHM, resolve_principal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -15,17 +15,21 @@ def get_db():
     finally:
         db.close()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    # 不依赖 get_db：缓存命中时认证全程不占用数据库连接
     try:
-        print("收到 token:", token)
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="认证失败")
     except JWTError:
         raise HTTPException(status_code=401, detail="认证失败")
-    user = db.query(User).filter(User.username == username).first()
+    user = resolve_principal(payload)
     if not user:
         raise HTTPException(status_code=401, detail="认证失败")
     return user
+
+def require_admin(current_user: Principal = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return current_user
@@ -0,0 +1,146 @@
+# docx_render.py
+"""
+公文 DOCX 渲染
+
+python-docx 构建文档、解析 Markdown 以及 doc.save() 均为 CPU/同步 IO 操作，
+长文档可达数十毫秒，因此放到独立的渲染进程池执行，避免阻塞事件循环。
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from . import metrics
+
+# 渲染进程数（0 表示不启用进程池，改在默认线程池中渲染）
+DOCX_RENDER_WORKERS = int(os.getenv("DOCX_RENDER_WORKERS", "2"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _warm_imports():
+    """渲染进程初始化：预先导入 python-docx，首个任务无需再付导入成本"""
+    import docx  # noqa: F401
+    from docx.shared import Pt  # noqa: F401
+    from docx.oxml.ns import qn  # noqa: F401
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def render_markdown_docx(markdown_text: str, file_path: str, layout: Optional[dict] = None) -> str:
+    """将 Markdown 文本渲染为公文格式 DOCX 并保存（在渲染进程中执行）；layout 为模板的页眉页脚"""
+    from docx import Document
+    from docx.shared import Pt
+    from docx.oxml.ns import qn
+
+    doc = Document()
+    # 设置公文标准格式（仿宋GB2312、小四号字、无段间距）
+    normal_style = doc.styles["Normal"]
+    font = normal_style.font
+    font.name = "FangSong_GB2312"
+    font.size = Pt(16)
+    normal_style._element.rPr.rFonts.set(qn("w:eastAsia"), "FangSong_GB2312")
+    normal_style.paragraph_format.space_before = Pt(0)
+    normal_style.paragraph_format.space_after = Pt(0)
+
+    # 解析Markdown格式（标题、加粗、斜体）
+    for line in markdown_text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        # 处理标题（# 一级 / ## 二级 / ### 三级）
+        if line.startswith("# "):
+            doc.add_heading(line[2:], level=1)
+        elif line.startswith("## "):
+            doc.add_heading(line[3:], level=2)
+        elif line.startswith("### "):
+            doc.add_heading(line[4:], level=3)
+        else:
+            # 处理加粗（**内容**）和斜体（*内容*）
+            para = doc.add_paragraph()
+            bold_parts = line.split("**")
+            for i, part in enumerate(bold_parts):
+                if i % 2 == 1:  # 奇数段为加粗内容
+                    run = para.add_run(part)
+                    run.bold = True
+                else:
+                    italic_parts = part.split("*")
+                    for j, sub_part in enumerate(italic_parts):
+                        run = para.add_run(sub_part)
+                        if j % 2 == 1:  # 奇数段为斜体内容
+                            run.italic = True
+
+    # 套用模板页眉页脚（来自上传时解析好的结构，无需打开模板文件）
+    if layout:
+        section = doc.sections[0]
+        if layout.get("header"):
+            section.header.paragraphs[0].text = layout["header"]
+        if layout.get("footer"):
+            section.footer.paragraphs[0].text = layout["footer"]
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)  # 确保目录存在
+    doc.save(file_path)
+    return file_path
+
+
+def get_render_executor() -> Optional[ProcessPoolExecutor]:
+    """获取（必要时创建）渲染进程池；未启用时返回 None（使用默认线程池）"""
+    global _executor
+    if DOCX_RENDER_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=DOCX_RENDER_WORKERS,
+                initializer=_warm_imports
+            )
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor):
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def render_docx(markdown_text: str, file_path: str, layout: Optional[dict] = None) -> str:
+    """异步渲染 DOCX：在渲染进程池中执行并等待结果，记录渲染耗时"""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    executor = get_render_executor()
+    try:
+        await loop.run_in_executor(executor, render_markdown_docx, markdown_text, file_path, layout)
+    except BrokenProcessPool:
+        # 渲染进程异常退出：重建进程池，本次改在线程池中完成
+        metrics.incr("docx_render_pool_broken_total")
+        _reset_executor(executor)
+        await loop.run_in_executor(None, render_markdown_docx, markdown_text, file_path, layout)
+    metrics.observe("docx_render_seconds", time.perf_counter() - start)
+    return file_path
+
+
+def warm_up_render_pool():
+    """预热渲染进程池：提前拉起全部 worker 并完成 python-docx 导入"""
+    executor = get_render_executor()
+    if executor is None:
+        return
+    futures = [executor.submit(_ping) for _ in range(DOCX_RENDER_WORKERS)]
+    for future in futures:
+        future.result()
+
+
+def shutdown_render_pool():
+    """关闭渲染进程池（应用关闭时调用）"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
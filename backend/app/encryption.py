@@ -1,9 +1,10 @@
 # encryption.py
 from cryptography.fernet import Fernet
+import hashlib
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import threading
+import time
+from collections import OrderedDict
 
 # 从环境变量读取加密密钥
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
@@ -24,9 +25,86 @@ def encrypt_api_key(api_key: str) -> str:
     encrypted = fernet.encrypt(api_key.encode())
     return encrypted.decode()  # 返回字符串，便于存储
 
+# 解密结果缓存：同一请求/相邻请求内多次解密同一密文（生成上下文、客户端初始化、连接复用失效等）
+# 只做一次 Fernet 解密（HMAC 校验 + AES 解密）
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "1024"))
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "300"))
+
+
+class _DecryptCache:
+    """
+    密文摘要 -> 明文 的 LRU + TTL 缓存
+    键使用密文的 sha256（不保存密文本身）；明文以 bytearray 保存，淘汰/清空时先原地清零，
+    缩短明文在进程内存中的驻留时间（已返回给调用方的 str 副本不受控制）
+    """
+
+    def __init__(self, max_entries: int = API_KEY_CACHE_SIZE, ttl: float = API_KEY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()  # 摘要 -> (写入时间, 明文 bytearray)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _wipe(plaintext: bytearray):
+        plaintext[:] = bytes(len(plaintext))
+
+    def get(self, digest: bytes):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            stored_at, plaintext = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[digest]
+                self._wipe(plaintext)
+                return None
+            self._entries.move_to_end(digest)
+            return plaintext.decode()
+
+    def set(self, digest: bytes, plaintext: bytes):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._wipe(previous[1])
+            self._entries[digest] = (time.monotonic(), bytearray(plaintext))
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._wipe(evicted)
+
+    def clear(self):
+        with self._lock:
+            for _, plaintext in self._entries.values():
+                self._wipe(plaintext)
+            self._entries.clear()
+
+
+_decrypt_cache = _DecryptCache()
+
+
 def decrypt_api_key(encrypted_api_key: str) -> str:
-    """解密 API Key"""
+    """解密 API Key（结果按密文摘要缓存）"""
     if not encrypted_api_key:
         return ""
+    digest = hashlib.sha256(encrypted_api_key.encode()).digest()
+    cached = _decrypt_cache.get(digest)
+    if cached is not None:
+        return cached
     decrypted = fernet.decrypt(encrypted_api_key.encode())
-    return decrypted.decode()
\ No newline at end of file
+    _decrypt_cache.set(digest, decrypted)
+    return decrypted.decode()
+
+
+def clear_decrypt_cache():
+    """清空解密缓存（明文清零），如轮换 ENCRYPTION_KEY 后调用"""
+    _decrypt_cache.clear()
+
+
+def mask_api_key(api_key: str) -> str:
+    """API Key 脱敏：保留前4位和后4位（长度 ≤ 8 时只保留前4位）"""
+    if not api_key:
+        return ""
+    if len(api_key) <= 8:
+        return f"{api_key[:4]}***"
+    return f"{api_key[:4]}***{api_key[-4:]}"
\ No newline at end of file
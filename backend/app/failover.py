@@ -0,0 +1,168 @@
+# failover.py
+"""
+多模型故障切换与对冲请求
+
+FailoverStream 按顺序使用 主模型 + 用户配置的其他模型（备用）：
+- 某个模型在首个 token 之前出现平台不可用类错误（超时、连接失败、429/5xx、熔断中）或返回空内容，
+  立即切换到下一个备用模型；Key 无效、鉴权失败、参数错误等不切换，直接抛给调用方
+- 开启对冲（GENERATION_HEDGE=true）时，若主请求的首 token 耗时超过阈值，
+  并行发起一个备用请求，先产出首 token 的一方胜出，另一方被取消
+- 对冲阈值取最近首 token 耗时的分位数（默认 p95），样本不足时使用固定值
+首个 token 产出之后不再切换（避免重复内容），后续错误直接抛给调用方。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, List, Optional, Sequence
+
+from . import metrics
+from .AI_client import AIClientFactory, GenerationContext
+from .resilience import CircuitOpenError, is_transient_error
+
+# 每次生成最多使用的备用模型数
+GENERATION_FALLBACK_MAX = int(os.getenv("GENERATION_FALLBACK_MAX", "2"))
+GENERATION_HEDGE_ENABLED = os.getenv("GENERATION_HEDGE", "false").lower() == "true"
+# 对冲阈值：首 token 耗时的分位数，不低于 GENERATION_HEDGE_MIN_DELAY 秒
+GENERATION_HEDGE_PERCENTILE = float(os.getenv("GENERATION_HEDGE_PERCENTILE", "0.95"))
+GENERATION_HEDGE_MIN_DELAY = float(os.getenv("GENERATION_HEDGE_MIN_DELAY", "1.0"))
+# 样本不足（少于 GENERATION_HEDGE_MIN_SAMPLES）时使用的固定阈值
+GENERATION_HEDGE_DEFAULT_DELAY = float(os.getenv("GENERATION_HEDGE_DEFAULT_DELAY", "3.0"))
+GENERATION_HEDGE_MIN_SAMPLES = int(os.getenv("GENERATION_HEDGE_MIN_SAMPLES", "20"))
+
+TTFT_METRIC = "generation_ttft_seconds"
+
+
+def hedge_delay() -> float:
+    """当前对冲阈值（秒）"""
+    observed = metrics.percentile(TTFT_METRIC, GENERATION_HEDGE_PERCENTILE, GENERATION_HEDGE_MIN_SAMPLES)
+    if observed is None:
+        return GENERATION_HEDGE_DEFAULT_DELAY
+    return max(GENERATION_HEDGE_MIN_DELAY, observed)
+
+
+class EmptyGeneration(Exception):
+    pass
+
+
+def should_fail_over(exc: BaseException) -> bool:
+    """首 token 前的错误是否切换备用模型：只在平台暂时不可用（含熔断中）或返回空内容时切换"""
+    return isinstance(exc, (EmptyGeneration, CircuitOpenError)) or is_transient_error(exc)
+
+
+class FailoverStream:
+    """
+    带故障切换/对冲的流式生成
+    迭代结束后 winner 为实际产出内容的模型配置（用于入库和展示）
+    """
+
+    def __init__(
+        self,
+        contexts: Sequence[GenerationContext],
+        prompt: str,
+        system_prompt: str,
+        hedge: bool = GENERATION_HEDGE_ENABLED
+    ):
+        if not contexts:
+            raise ValueError("至少需要一个模型配置")
+        self.contexts: List[GenerationContext] = list(contexts)
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+        self.hedge = hedge and len(self.contexts) > 1
+        self.winner: Optional[GenerationContext] = None
+
+    async def _first_token(self, context: GenerationContext):
+        """创建客户端并等待首个 token，返回 (流, 首 token)；失败或被取消时关闭流"""
+        start = time.perf_counter()
+        client = AIClientFactory.create_client_for_context(context)
+        stream = client.astream_generate(prompt=self.prompt, system_prompt=self.system_prompt)
+        try:
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                raise EmptyGeneration("AI生成内容为空")
+        except BaseException:
+            await _close(stream)
+            raise
+        metrics.observe(TTFT_METRIC, time.perf_counter() - start)
+        return stream, first
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        waiting = deque(self.contexts)
+        attempts = {}  # task -> context
+        winner_stream = None
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            context = waiting.popleft()
+            attempts[asyncio.ensure_future(self._first_token(context))] = context
+
+        launch()
+        hedge_at = time.monotonic() + hedge_delay() if self.hedge else None
+        try:
+            while attempts and winner_stream is None:
+                timeout = None
+                if hedge_at is not None and waiting:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(
+                    attempts.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首 token 超过阈值：并行发起对冲请求（每次生成最多一次）
+                    hedge_at = None
+                    metrics.incr("generation_hedges_total")
+                    launch()
+                    continue
+
+                for task in done:
+                    context = attempts.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        metrics.incr("generation_provider_failures_total")
+                        if not should_fail_over(last_error):
+                            # Key 无效等配置问题换模型也无济于事，原样抛给调用方
+                            raise last_error
+                        continue
+                    if winner_stream is None:
+                        winner_stream, first = task.result()
+                        self.winner = context
+                    else:
+                        # 同时完成的另一方直接关闭
+                        await _close(task.result()[0])
+
+                if winner_stream is None and not attempts and waiting:
+                    # 全部在途请求失败：切换到下一个备用模型
+                    metrics.incr("generation_failovers_total")
+                    launch()
+
+            await _cancel_attempts(attempts)
+            if winner_stream is None:
+                raise last_error or EmptyGeneration("AI生成内容为空")
+            if self.winner is not self.contexts[0]:
+                metrics.incr("generation_fallback_wins_total")
+
+            yield first
+            async for chunk in winner_stream:
+                yield chunk
+        finally:
+            await _cancel_attempts(attempts)
+            if winner_stream is not None:
+                await _close(winner_stream)
+
+
+async def _close(stream):
+    try:
+        await stream.aclose()
+    except Exception:
+        pass
+
+
+async def _cancel_attempts(attempts: dict):
+    """取消落败的请求；取消前已成功的请求需关闭其流"""
+    tasks = list(attempts)
+    attempts.clear()
+    for task in tasks:
+        task.cancel()
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, tuple):
+            await _close(result[0])
@@ -0,0 +1,228 @@
+# generation.py
+"""
+公文生成流水线
+
+与 HTTP 连接解耦：run_generation 以 (事件名, 数据) 的形式依次产出
+流式文本帧、元数据、完成/错误事件，由生成任务（generation_jobs）驱动并缓存，
+客户端断线不影响生成与入库。
+"""
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .AI_client import GenerationContext
+from .database import SessionLocal
+from .docx_render import render_docx
+from .failover import FailoverStream
+from .generation_cache import get_generation_cache, make_cache_key
+from .models import Conversation, DocumentHistory, Message
+from .sse import ChunkCoalescer, SSE_FLUSH_BYTES
+
+# 事件名为 None 表示默认的 message 事件（流式文本帧）
+GenerationEvent = Tuple[Optional[str], dict]
+
+
+@dataclass(frozen=True)
+class GenerationRequest:
+    """一次公文生成所需的全部参数（在请求阶段完成校验与解析）"""
+    user_id: int
+    doc_type: str
+    user_input: str
+    prompt: str
+    system_prompt: str
+    context: GenerationContext
+    output_dir: str
+    conv_id: Optional[int] = None
+    template_id: Optional[int] = None
+    template_content: Optional[str] = None
+    # 模板页眉页脚（渲染时套用，见 template_structure.structure_layout）
+    template_layout: Optional[dict] = None
+    # 主模型失败/过慢时依次使用的备用模型
+    fallbacks: Tuple[GenerationContext, ...] = ()
+
+
+class ConversationNotFound(Exception):
+    pass
+
+
+def _persist_generation(
+    request: GenerationRequest,
+    context: GenerationContext,
+    generated_full: str,
+    filename: str
+) -> Tuple[int, int]:
+    """
+    保存公文历史、会话与消息记录（同步数据库操作，在线程池中执行），返回 (doc_id, conv_id)
+    context 为实际产出内容的模型（发生故障切换时不同于 request.context）
+    """
+    db = SessionLocal()
+    try:
+        # 1. 保存公文历史
+        doc_record = DocumentHistory(
+            user_id=request.user_id,
+            doc_type=request.doc_type,
+            content=generated_full,
+            filename=filename,
+            template_id=request.template_id
+        )
+        db.add(doc_record)
+        db.flush()  # 提前获取doc_id，避免依赖commit
+
+        # 2. 处理会话（创建/更新）
+        if request.conv_id:
+            # 更新已有会话
+            conversation = db.query(Conversation).filter(
+                Conversation.id == request.conv_id,
+                Conversation.user_id == request.user_id
+            ).first()
+            if not conversation:
+                raise ConversationNotFound()
+            conversation.updated_at = datetime.now(timezone.utc)
+            conversation.ai_model_id = context.ai_model_id
+            conversation.status = "active"
+        else:
+            # 创建新会话（生成简短标题）
+            user_input = request.user_input.strip()
+            input_short = user_input[:8] if len(user_input) > 8 else user_input
+            conversation = Conversation(
+                user_id=request.user_id,
+                ai_model_id=context.ai_model_id,
+                title=f"{request.doc_type}生成_{input_short}...",
+                status="active",
+                created_at=datetime.now(timezone.utc),
+                updated_at=datetime.now(timezone.utc)
+            )
+            db.add(conversation)
+        db.flush()  # 提前获取conversation_id
+
+        # 3. 保存消息记录（用户输入+AI回复）
+        user_msg = Message(
+            conversation_id=conversation.id,
+            role="user",
+            content=request.user_input,
+            created_at=datetime.now(timezone.utc)
+        )
+        ai_msg = Message(
+            conversation_id=conversation.id,
+            role="assistant",
+            content=generated_full,
+            docx_file=filename,
+            created_at=datetime.now(timezone.utc)
+        )
+        db.add_all([user_msg, ai_msg])
+
+        # 提交所有数据库操作
+        db.commit()
+        return doc_record.id, conversation.id
+    except Exception:
+        # 回滚未提交的数据库操作
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _format_error(error_detail: str) -> str:
+    """格式化常见错误"""
+    if "permission denied" in error_detail.lower():
+        return "文件保存失败，请检查服务器权限"
+    if "sqlalchemy" in error_detail.lower():
+        return "数据库操作失败，请稍后重试"
+    return f"生成异常：{error_detail}"
+
+
+def _cache_key(request: GenerationRequest, context: GenerationContext) -> str:
+    return make_cache_key(
+        user_id=request.user_id,
+        ai_model_id=context.ai_model_id,
+        provider=context.provider,
+        model_name=context.used_model,
+        system_prompt=request.system_prompt,
+        template_content=request.template_content,
+        user_input=request.user_input
+    )
+
+
+def _replay_frames(text: str):
+    """缓存命中时按帧大小切分全文，保持与实时生成相同的事件形态"""
+    for i in range(0, len(text), SSE_FLUSH_BYTES):
+        yield text[i:i + SSE_FLUSH_BYTES]
+
+
+def _output_filename(request: GenerationRequest) -> str:
+    """
+    生成文件名：用户ID + 时间戳 + 随机后缀；缓存命中时瞬间完成，
+    同一秒内重复请求仅靠时间戳会写到同一路径，覆盖之前的文件
+    """
+    return f"{request.doc_type}_{request.user_id}_{int(time.time())}_{uuid.uuid4().hex[:8]}.docx"
+
+
+async def run_generation(request: GenerationRequest) -> AsyncIterator[GenerationEvent]:
+    """执行一次公文生成：流式文本（或缓存回放） → DOCX 渲染 → 入库 → 元数据/完成事件"""
+    full_content: list[str] = []  # 收集完整内容（用于后续DOCX生成和数据库存储）
+    try:
+        cache = get_generation_cache()
+        cache_key = _cache_key(request, request.context) if cache else None
+        context = request.context
+        cached = await run_in_threadpool(cache.get, cache_key) if cache else None
+
+        # 1. 实时产出流式文本（按大小/时间窗口合并片段后成帧）；缓存命中则直接回放
+        #    主模型失败或首 token 过慢时由 FailoverStream 切换/对冲到备用模型
+        if cached is not None:
+            for frame in _replay_frames(cached):
+                full_content.append(frame)
+                yield None, {"chunk": frame}
+        else:
+            stream = FailoverStream(
+                (request.context, *request.fallbacks),
+                prompt=request.prompt,
+                system_prompt=request.system_prompt
+            )
+            async for frame in ChunkCoalescer(stream):
+                full_content.append(frame)
+                yield None, {"chunk": frame}
+            context = stream.winner or request.context
+
+        # 2. 流式结束后，处理完整内容（DOCX生成+数据库存储）
+        generated_full = "".join(full_content)
+        if not generated_full:
+            yield "error", {"detail": "AI生成内容为空"}
+            return
+
+        # 2.1 渲染与保存在独立进程池中执行
+        filename = _output_filename(request)
+        await render_docx(generated_full, os.path.join(request.output_dir, filename), request.template_layout)
+
+        # 2.2 保存数据库记录
+        try:
+            doc_id, conv_id = await run_in_threadpool(
+                _persist_generation, request, context, generated_full, filename
+            )
+        except ConversationNotFound:
+            yield "error", {"detail": "指定会话不存在"}
+            return
+
+        # 2.3 完整生成成功后写入缓存
+        if cache and cached is None:
+            await run_in_threadpool(cache.set, _cache_key(request, context), generated_full)
+
+        # 3. 元数据事件：包含文件下载、会话续接所需信息
+        yield "metadata", {
+            "filename": filename,
+            "conv_id": conv_id,
+            "doc_id": doc_id,
+            "used_model": context.used_model,
+            "full_text": generated_full,
+            "cache_hit": cached is not None
+        }
+
+        # 4. 生成完成事件
+        yield "complete", {"status": "success", "msg": "生成完成"}
+    except Exception as e:
+        # 捕获生成过程中的异常，发送错误事件
+        yield "error", {"detail": _format_error(str(e))}
@@ -0,0 +1,179 @@
+# generation_cache.py
+"""
+公文生成结果缓存（默认关闭，通过 GENERATION_CACHE 开启）
+
+同一用户以同一模型配置（平台 + 模型 + 用户自己的 API Key）对相同的
+系统提示词 + 模板内容 + 用户要求重复生成时，直接回放缓存的全文，避免再次调用付费的 AI 平台。
+缓存按用户及其模型配置隔离：不会把一个用户（用其 Key 付费）生成的内容回放给另一个用户。
+- GENERATION_CACHE=memory：进程内 LRU（多 worker 时各自独立）
+- GENERATION_CACHE=sqlite：本地 SQLite 文件（同机多 worker 共享，重启后保留）
+两种后端均按 条目数上限（LRU）+ TTL 淘汰。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from . import metrics
+
+GENERATION_CACHE = os.getenv("GENERATION_CACHE", "off").lower()
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "512"))
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", "86400"))
+GENERATION_CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", "generation_cache.db")
+
+
+def make_cache_key(
+    user_id: int,
+    ai_model_id: int,
+    provider: str,
+    model_name: str,
+    system_prompt: str,
+    template_content: Optional[str],
+    user_input: str
+) -> str:
+    """缓存键：各组成部分序列化后取 sha256（不同字段之间不会拼接混淆）"""
+    raw = json.dumps(
+        [user_id, ai_model_id, provider, model_name, system_prompt, template_content or "", user_input],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """进程内 LRU + TTL"""
+
+    def __init__(self, max_entries: int = GENERATION_CACHE_SIZE, ttl: float = GENERATION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (写入时间, 内容)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """SQLite 文件缓存：按最近访问时间做 LRU 淘汰"""
+
+    def __init__(
+        self,
+        path: str = GENERATION_CACHE_PATH,
+        max_entries: int = GENERATION_CACHE_SIZE,
+        ttl: float = GENERATION_CACHE_TTL
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generation_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_generation_cache_accessed_at ON generation_cache (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM generation_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if now - stored_at > self.ttl:
+                self._conn.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE generation_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generation_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            # 淘汰过期条目及超出上限的最久未访问条目
+            self._conn.execute("DELETE FROM generation_cache WHERE stored_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM generation_cache WHERE key IN ("
+                " SELECT key FROM generation_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM generation_cache").fetchone()[0]
+
+
+class GenerationCache:
+    """缓存门面：统一记录命中/未命中指标"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        metrics.incr("generation_cache_hits_total" if value is not None else "generation_cache_misses_total")
+        return value
+
+    def set(self, key: str, value: str):
+        self.backend.set(key, value)
+
+    def stats(self) -> dict:
+        hits = metrics.counter("generation_cache_hits_total")
+        misses = metrics.counter("generation_cache_misses_total")
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else None,
+        }
+
+
+_cache: Optional[GenerationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> Optional[GenerationCache]:
+    """按配置创建缓存单例；未开启时返回 None"""
+    global _cache
+    if GENERATION_CACHE not in ("memory", "sqlite"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            backend = SQLiteCacheBackend() if GENERATION_CACHE == "sqlite" else MemoryCacheBackend()
+            _cache = GenerationCache(backend)
+        return _cache
@@ -0,0 +1,269 @@
+# generation_jobs.py
+"""
+后台生成任务
+
+/api/generate 不再与单个 HTTP 连接绑定：
+- 提交后得到任务ID，由 worker 池（asyncio 任务）从队列取出并驱动生成流水线
+- 每个任务把产出的事件写入环形缓冲区，事件带自增序号（即 SSE 的 id）
+- 客户端通过 SSE 订阅，可携带 Last-Event-ID 从任意位置续传；
+  断线重连不会重新调用 AI 平台，多个标签页也可同时观看同一次生成
+- 续传位置已被环形缓冲区淘汰时，先发送 reset 事件（含此前已生成的全文），
+  客户端用它替换已收到的内容后继续接收后续事件
+- 已结束的任务保留 GENERATION_JOB_RETENTION 秒，由后台任务定期清理
+
+队列使用进程内 LocalJobQueue；接口保持 put/get/qsize，
+多实例部署时可替换为 Redis 等外部队列实现。
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+from . import metrics
+from .query_stats import current_route
+
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "64"))
+GENERATION_QUEUE_SIZE = int(os.getenv("GENERATION_QUEUE_SIZE", "1000"))
+# 每个任务环形缓冲区保留的事件数
+GENERATION_JOB_BUFFER_SIZE = int(os.getenv("GENERATION_JOB_BUFFER_SIZE", "4096"))
+# 任务结束后保留多久（秒），期间可重连回放
+GENERATION_JOB_RETENTION = float(os.getenv("GENERATION_JOB_RETENTION", "600"))
+# 清理过期任务的间隔（秒）
+GENERATION_JOB_PURGE_INTERVAL = float(os.getenv("GENERATION_JOB_PURGE_INTERVAL", "60"))
+
+# (序号, 事件名, 数据)；事件名为 None 表示默认的 message 事件
+JobEvent = Tuple[int, Optional[str], dict]
+# 任务执行体：无参调用返回 (事件名, 数据) 异步迭代器
+JobRunner = Callable[[], AsyncIterator[Tuple[Optional[str], dict]]]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class GenerationJob:
+    """单个生成任务：状态 + 事件环形缓冲区"""
+
+    def __init__(self, user_id: int, runner: JobRunner, buffer_size: int = GENERATION_JOB_BUFFER_SIZE):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.runner = runner
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._events: deque = deque(maxlen=buffer_size)
+        # 已被环形缓冲区淘汰的文本片段（拼接即 reset 事件中的全文）
+        self._evicted_chunks: list = []
+        self._next_seq = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def publish(self, event: Optional[str], data: dict) -> int:
+        """写入一条事件并唤醒所有订阅者"""
+        seq = self._next_seq
+        self._next_seq += 1
+        if len(self._events) == self._events.maxlen:
+            _, old_event, old_data = self._events[0]
+            if old_event is None and "chunk" in old_data:
+                self._evicted_chunks.append(old_data["chunk"])
+        self._events.append((seq, event, data))
+        if event == "error":
+            self.status = "failed"
+        self._notify()
+        return seq
+
+    def finish(self):
+        if self.status != "failed":
+            self.status = "succeeded"
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self, last_event_id: Optional[int] = None) -> AsyncIterator[JobEvent]:
+        """
+        订阅任务事件：从 last_event_id 之后开始回放，随后实时推送直至任务结束
+        若请求的位置已被环形缓冲区淘汰，先发送 reset 事件：
+        data.text 为最早保留事件之前的全部文本，其 id 为最早保留事件的前一个序号
+        """
+        cursor = 0 if last_event_id is None else last_event_id + 1
+        while True:
+            changed = self._changed
+            if self._events and cursor < self._events[0][0]:
+                first_seq = self._events[0][0]
+                metrics.incr("generation_job_resets_total")
+                yield first_seq - 1, "reset", {"text": "".join(self._evicted_chunks)}
+                cursor = first_seq
+            pending = []
+            if self._events:
+                # 序号连续，可直接换算出 cursor 在缓冲区中的下标
+                start = max(0, cursor - self._events[0][0])
+                pending = list(islice(self._events, start, None))
+            for item in pending:
+                yield item
+                cursor = item[0] + 1
+            if self.done and cursor >= self._next_seq:
+                return
+            if not pending:
+                await changed.wait()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "last_event_id": self._next_seq - 1 if self._next_seq else None,
+        }
+
+
+class LocalJobQueue:
+    """进程内任务队列（外部队列的本地替身）"""
+
+    def __init__(self, maxsize: int = GENERATION_QUEUE_SIZE):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, job: GenerationJob):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull()
+
+    async def get(self) -> GenerationJob:
+        return await self._queue.get()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def drain(self) -> list:
+        """取出全部未执行的任务"""
+        jobs = []
+        while not self._queue.empty():
+            jobs.append(self._queue.get_nowait())
+        return jobs
+
+
+class JobManager:
+    """任务注册表 + worker 池；worker 绑定所在事件循环，首次提交时自动启动"""
+
+    def __init__(
+        self,
+        workers: int = GENERATION_WORKERS,
+        retention: float = GENERATION_JOB_RETENTION,
+        purge_interval: float = GENERATION_JOB_PURGE_INTERVAL
+    ):
+        self.workers = workers
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._queue: Optional[LocalJobQueue] = None
+        self._tasks: list = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """在当前事件循环中启动 worker（事件循环变化时重新启动）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._abandon_queued()
+        self._loop = loop
+        self._queue = LocalJobQueue()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        if self.purge_interval > 0:
+            # 没有新提交时也要释放已过期任务的事件缓冲区
+            self._tasks.append(loop.create_task(self._purge_loop()))
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._abandon_queued()
+        self._loop = None
+
+    def _abandon_queued(self):
+        """worker 已停止时，队列中尚未执行的任务直接以错误结束，避免订阅者一直等待"""
+        if self._queue is None:
+            return
+        for job in self._queue.drain():
+            job.publish("error", {"detail": "生成任务已取消"})
+            job.finish()
+        self._queue = None
+
+    def submit(self, user_id: int, runner: JobRunner) -> GenerationJob:
+        """提交生成任务（队列已满时抛出 JobQueueFull）"""
+        self.start()
+        self._purge_expired()
+        job = GenerationJob(user_id, runner)
+        self._queue.put(job)
+        self._jobs[job.id] = job
+        metrics.incr("generation_jobs_submitted_total")
+        return job
+
+    def get(self, job_id: str, user_id: int) -> Optional[GenerationJob]:
+        """获取任务（仅限提交者本人）"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def _purge_expired(self) -> int:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            purged = self._purge_expired()
+            if purged:
+                metrics.incr("generation_jobs_purged_total", purged)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            await self._run(job)
+
+    async def _run(self, job: GenerationJob):
+        job.status = "running"
+        # worker 任务不属于任何请求，慢查询统计中归为后台生成任务
+        current_route.set("job generation")
+        metrics.observe("generation_job_queue_seconds", time.time() - job.created_at)
+        start = time.perf_counter()
+        try:
+            async for event, data in job.runner():
+                job.publish(event, data)
+        except asyncio.CancelledError:
+            job.publish("error", {"detail": "生成任务已取消"})
+            raise
+        except Exception as e:
+            job.publish("error", {"detail": f"生成异常：{str(e)}"})
+        finally:
+            job.finish()
+            metrics.observe("generation_job_seconds", time.perf_counter() - start)
+            metrics.incr(f"generation_jobs_{job.status}_total")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers if self._tasks else 0,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": sum(1 for job in list(self._jobs.values()) if job.status == "running"),
+            "jobs": len(self._jobs),
+        }
+
+
+# 进程级单例
+job_manager = JobManager()
@@ -0,0 +1,181 @@
+# log_config.py
+"""
+日志管道：QueueHandler + 后台 QueueListener
+
+业务线程/事件循环只把日志记录放入内存队列（不做文件/终端 I/O），
+由后台线程统一格式化并写入 stderr 及日志文件。
+- LOG_FORMAT=json：每行一条 JSON（ts/level/logger/message/route 及 extra 字段），默认 text
+- LOG_SAMPLE_RATES：按 logger 抽样（仅作用于 WARNING 以下），如
+  "app.ai_client.chunks=0.01,app.slow_query=0.5"，子 logger 继承父级比例；
+  逐片段等高频日志使用 get_sampled_logger，在创建 LogRecord 之前就完成抽样
+- 队列满时丢弃新记录并计数（log_records_dropped_total），不阻塞请求
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from . import metrics
+from .query_stats import current_route
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# 日志文件（置空则只输出到 stderr）
+LOG_FILE = os.getenv("LOG_FILE", "api.log")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "app.ai_client.chunks=0.01")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord 自带属性，其余视为 extra 字段写入 JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "route"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def parse_sample_rates(raw: str) -> Dict[str, float]:
+    rates = {}
+    for item in raw.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+def lookup_sample_rate(rates: Dict[str, float], name: str) -> float:
+    """按最长前缀匹配 logger 名称对应的抽样比例（未配置为 1.0）"""
+    probe = name
+    while probe:
+        if probe in rates:
+            return rates[probe]
+        probe = probe.rpartition(".")[0]
+    return 1.0
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    高频日志（如逐片段调试日志）：isEnabledFor 中先做抽样判断，
+    未抽中的调用不会创建 LogRecord，开销接近一次随机数
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float):
+        super().__init__(logger, {})
+        self.rate = rate
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+    def process(self, msg, kwargs):
+        # 标记已抽样，队列上的 SamplingFilter 不再重复抽样
+        kwargs["extra"] = {**kwargs.get("extra", {}), "_sampled": True}
+        return msg, kwargs
+
+
+def get_sampled_logger(name: str) -> SampledLogger:
+    return SampledLogger(logging.getLogger(name), lookup_sample_rate(parse_sample_rates(LOG_SAMPLE_RATES), name))
+
+
+class JsonFormatter(logging.Formatter):
+    """结构化 JSON 行"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        route = getattr(record, "route", None)
+        if route:
+            entry["route"] = route
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """按 logger 名称抽样 WARNING 以下的记录（最长前缀匹配）"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = self._cache[name] = lookup_sample_rate(self.rates, name)
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates or getattr(record, "_sampled", False):
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class ContextFilter(logging.Filter):
+    """在调用线程中附加请求路由（格式化发生在后台线程，ContextVar 无法跨线程读取）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.route = current_route.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录，而不是阻塞或打印异常"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("log_records_dropped_total")
+
+
+def setup_logging():
+    """配置根 logger（幂等）：根 logger 只挂 QueueHandler，实际输出由后台 listener 完成"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+        handlers = [logging.StreamHandler()]
+        if LOG_FILE:
+            handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        queue_handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LEVEL)
+
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """停止后台 listener（会先写完队列中剩余的记录）"""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
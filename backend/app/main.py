@@ -1,12 +1,72 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from .config import setup_env
+
+# 入口：先加载 .env，再导入在导入时读取环境变量的模块
+setup_env()
+
+from .log_config import setup_logging
 from .api import router as api_router
 from .conversations import router as conv_router
 from .auth import router as auth_router  # 新加
-from .models import Base
-from .database import engine
-app = FastAPI()
-Base.metadata.create_all(bind=engine)
+from .admin import router as admin_router
+from .deps import require_admin
+from .database import pool_stats, warm_up_pool, warm_up_async_pool, dispose_engines
+from .client_registry import client_registry
+from .docx_render import warm_up_render_pool, shutdown_render_pool
+from .generation_jobs import job_manager
+from .generation_cache import get_generation_cache
+from . import metrics
+from .query_stats import RouteContextMiddleware
+from .principal_cache import principal_cache
+from .password_hashing import password_hasher
+from .template_store import run_gc_loop, TEMPLATE_BLOB_GC_INTERVAL
+from .template_structure import template_structures
+
+logger = logging.getLogger(__name__)
+
+
+async def _warm_up():
+    """启动预热：提前建立连接池、拉起渲染进程池及生成 worker，首批请求不再承担这些开销"""
+    try:
+        await run_in_threadpool(warm_up_pool)
+        await warm_up_async_pool()
+    except Exception as e:
+        # 数据库暂不可用时仍然启动，由请求时的连接池重试
+        logger.warning("数据库连接池预热失败: %s", e)
+    # 预热DOCX渲染进程池（提前完成python-docx导入）
+    await run_in_threadpool(warm_up_render_pool)
+    get_generation_cache()
+    job_manager.start()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 导入 app.main 除加载 .env 外没有副作用：日志管道、预热都在启动阶段完成；
+    # 表结构只由 Alembic 迁移管理（alembic upgrade head），启动时不再 create_all
+    setup_logging()
+    await _warm_up()
+    # 定期清理引用数归零的模板文件
+    gc_task = asyncio.create_task(run_gc_loop()) if TEMPLATE_BLOB_GC_INTERVAL > 0 else None
+    try:
+        yield
+    finally:
+        if gc_task is not None:
+            gc_task.cancel()
+        # 关闭进程内复用的AI平台客户端连接
+        client_registry.clear()
+        # 停止后台生成任务 worker（未完成任务会收到取消错误事件）
+        await job_manager.stop()
+        shutdown_render_pool()
+        password_hasher.shutdown()
+        await dispose_engines()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",  # 前端开发地址
@@ -19,12 +79,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 记录当前请求路由，供慢查询统计归因
+app.add_middleware(RouteContextMiddleware)
 
 # 路由注册
 app.include_router(auth_router, prefix="/auth")           # 用户注册/登录
 app.include_router(api_router, prefix="/api")            # 公文生成等通用接口
 app.include_router(conv_router, prefix="/api")  # 对话功能接口
+app.include_router(admin_router, prefix="/admin")  # 管理员运维接口
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics", dependencies=[Depends(require_admin)])
+def get_metrics():
+    # 进程内性能指标（渲染耗时、连接池、缓存等内部状态，与 /admin 运维接口一样仅限管理员）
+    snapshot = metrics.snapshot()
+    snapshot["db_pools"] = pool_stats()
+    snapshot["principal_cache"] = principal_cache.stats()
+    snapshot["password_hasher"] = password_hasher.stats()
+    snapshot["template_structures"] = template_structures.stats()
+    snapshot["generation_jobs"] = job_manager.stats()
+    cache = get_generation_cache()
+    if cache is not None:
+        snapshot["generation_cache"] = cache.stats()
+    return snapshot
@@ -0,0 +1,78 @@
+# metrics.py
+"""
+进程内轻量指标：计数器 + 最近样本窗口（用于计算延迟分位数）
+通过 /metrics 接口查看，多 worker 部署时每个进程独立统计
+"""
+import os
+import threading
+from collections import defaultdict, deque
+from typing import Optional
+
+# 每个指标保留的最近样本数（分位数基于该窗口计算）
+SAMPLE_WINDOW = int(os.getenv("METRICS_SAMPLE_WINDOW", "1024"))
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_samples = {}
+_totals = defaultdict(lambda: [0, 0.0])  # name -> [样本总数, 样本总和]
+
+
+def incr(name: str, value: float = 1):
+    """累加计数器"""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float):
+    """记录一个样本（如耗时秒数）"""
+    with _lock:
+        window = _samples.get(name)
+        if window is None:
+            window = _samples[name] = deque(maxlen=SAMPLE_WINDOW)
+        window.append(value)
+        total = _totals[name]
+        total[0] += 1
+        total[1] += value
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def percentile(name: str, q: float, min_samples: int = 1) -> Optional[float]:
+    """返回指标最近窗口内的分位数（样本不足时返回 None）"""
+    with _lock:
+        window = _samples.get(name)
+        values = sorted(window) if window else []
+    if len(values) < min_samples or not values:
+        return None
+    return _percentile(values, q)
+
+
+def counter(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict:
+    """导出全部指标（计数器 + 样本摘要）"""
+    with _lock:
+        counters = dict(_counters)
+        windows = {name: sorted(window) for name, window in _samples.items()}
+        totals = {name: tuple(total) for name, total in _totals.items()}
+
+    summaries = {}
+    for name, values in windows.items():
+        if not values:
+            continue
+        count, total = totals[name]
+        summaries[name] = {
+            "count": count,
+            "avg": total / count if count else 0,
+            "p50": _percentile(values, 0.5),
+            "p95": _percentile(values, 0.95),
+            "p99": _percentile(values, 0.99),
+            "max": values[-1],
+        }
+    return {"counters": counters, "summaries": summaries}
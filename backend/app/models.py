@@ -1,10 +1,9 @@
 # models.py
 from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Index, Boolean, Text
-from sqlalchemy.orm import relationship, declarative_base
-from datetime import datetime
-import pytz
+from sqlalchemy.orm import relationship, declarative_base, deferred
+from datetime import datetime, timezone
 from pydantic import BaseModel, field_validator,ValidationInfo,Field
-from typing import List, Optional 
+from typing import Dict, List, Optional 
 
 Base = declarative_base()
 
@@ -29,15 +28,18 @@ class ConversationResponse(BaseModel):
     messages: List[MessageResponse]
     # 补充：显示当前会话使用的 AI 模型信息（从关联的 AIModel 推导）
     used_model: Optional[str] = None  # 如 "OpenAI - gpt-3.5"
+    ai_model_info: Optional[Dict[str, str]] = None  # {"platform": ..., "model_name": ...}
+    last_message: Optional[str] = None  # 列表页：最后一条消息预览
+    next_before_id: Optional[int] = None  # 详情页分页：更早消息的游标（无更多时为 None）
 
     class Config:
         from_attributes = True
 
     # 自动填充 used_model（从 AIModel 关联推导）
     @field_validator("used_model", mode="before")
-    def fill_used_model(cls, v, values):
-        if "ai_model" in values:
-            ai_model = values["ai_model"]
+    def fill_used_model(cls, v, values: ValidationInfo):
+        if v is None and "ai_model" in (values.data or {}):
+            ai_model = values.data["ai_model"]
             return f"{ai_model.platform.name} - {ai_model.model.name}"
         return v
 
@@ -126,6 +128,9 @@ class AIModelResponse(BaseModel):
         from_attributes = True  # 支持从SQLAlchemy实例和字典映射
     @field_validator("api_key_mask", mode="before")
     def mask_api_key(cls, v, info: ValidationInfo):
+        # 已传入脱敏值（接口构造/数据库 api_key_mask 列）时直接使用
+        if v:
+            return v
         aimodel_data = info.data
         
         if isinstance(aimodel_data, dict):
@@ -182,7 +187,7 @@ class User(Base):
     username = Column(String(255), unique=True, index=True, nullable=False)
     id = Column(Integer, primary_key=True, index=True)
     password_hash = Column(String(255), nullable=False)
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
     role = Column(String(50), default="user")
 
     # 关系（无调整，保持与用户配置的关联）
@@ -196,13 +201,18 @@ class User(Base):
 
 class DocumentHistory(Base):
     __tablename__ = "document_history"
+    __table_args__ = (
+        # 历史记录游标分页：(created_at, id) 倒序
+        Index('ix_document_history_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     doc_type = Column(String(100))
-    content = Column(Text)  # 调整：用 Text 替代 String(4000)，支持更长公文内容
+    # 正文延迟加载：列表接口只取预览，详情/生成时再 undefer
+    content = deferred(Column(Text))  # 调整：用 Text 替代 String(4000)，支持更长公文内容
     filename = Column(String(255))
     template_id = Column(Integer, ForeignKey("templates.id"), nullable=True)
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # 关系（无调整）
     user = relationship("User", back_populates="documents")
@@ -212,17 +222,44 @@ class DocumentHistory(Base):
 
 class Template(Base):
     __tablename__ = "templates"
+    __table_args__ = (
+        # 模板列表游标分页：有效模板按 (uploaded_at, id) 倒序
+        Index('ix_templates_user_id_status_uploaded_at', 'user_id', 'status', 'uploaded_at', 'id'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     filename = Column(String(255))
     original_name = Column(String(255))
-    uploaded_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
-    content = Column(Text)  # 调整：用 Text 替代 String(4000)，支持更长模板
+    uploaded_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
+    content = deferred(Column(Text))  # 旧数据的模板文本；新上传的模板文本保存在 TemplateBlob 中（延迟加载）
     status = Column(String(50), default="active")
+    # 内容寻址存储：相同文件的模板共用一个 blob（文件与解析文本只存一份）
+    blob_id = Column(Integer, ForeignKey("template_blobs.id"), nullable=True, index=True)
 
     # 关系（无调整）
     user = relationship("User", back_populates="templates")
     documents = relationship("DocumentHistory", back_populates="template")
+    blob = relationship("TemplateBlob")
+
+    @property
+    def text(self) -> Optional[str]:
+        """模板文本：优先取共享 blob 中的解析结果，旧数据仍读 content 列"""
+        return self.blob.content if self.blob is not None else self.content
+
+
+class TemplateBlob(Base):
+    """按 SHA-256 去重的模板文件；ref_count 为引用它的有效模板数，归零后由 GC 清理"""
+    __tablename__ = "template_blobs"
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    size = Column(Integer, nullable=False)
+    filename = Column(String(255), nullable=False)  # 上传目录下的存储文件名：<sha256>.docx
+    content = deferred(Column(Text))  # 解析出的模板文本（延迟加载）
+    structure = deferred(Column(Text))  # 结构化表示（JSON，见 template_structure），通过进程内 LRU 读取
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
+    # 最近一次引用数变化的时间，GC 只清理归零超过宽限期的 blob
+    updated_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
 
 # 1. 系统级平台表（调整：补充默认配置，关联系统模型）
@@ -233,7 +270,7 @@ class Platform(Base):
     base_url = Column(String(255), nullable=False)  # 补充：系统默认 BaseURL（如 OpenAI 官方地址）
     description = Column(Text, nullable=True)  # 补充：平台描述（如 "OpenAI 通用大模型平台"）
     is_active = Column(Boolean, default=True)  # 补充：系统级开关（是否启用该平台）
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # 关系：一个平台对应多个系统模型（一对多）
     models = relationship("Model", back_populates="platform", cascade="all, delete-orphan")
@@ -272,7 +309,7 @@ class Model(Base):
     platform_id = Column(Integer, ForeignKey("platforms.id"), nullable=False)  # 关联系统平台
     description = Column(Text, nullable=True)  # 模型描述（如 "轻量对话模型，适合快速响应"）
     is_supported = Column(Boolean, default=True)  # 是否支持当前业务（如公文生成）
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # 关系：一个模型属于一个平台，关联多个用户配置（AIModel）
     platform = relationship("Platform", back_populates="models")
@@ -287,9 +324,10 @@ class AIModel(Base):
     model_id = Column(Integer, ForeignKey("models.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     api_key = Column(String(255), nullable=False)  # 加密存储的 API Key
+    api_key_mask = Column(String(32), nullable=True)  # 写入时计算的脱敏 Key，列表展示无需解密
     base_url = Column(String(255), nullable=True)  # 用户自定义 BaseURL（默认复用 Platform.base_url）
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
-    updated_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC), onupdate=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     # 关系：关联用户、系统模型（间接关联系统平台）
     user = relationship("User", back_populates="ai_models")
@@ -309,12 +347,14 @@ class Conversation(Base):
     __tablename__ = "conversations"
     __table_args__ = (
         Index('ix_user_id_created_at', 'user_id', 'created_at'),
+        # 会话列表按 updated_at 倒序 + 游标分页
+        Index('ix_conversations_user_id_updated_at', 'user_id', 'updated_at', 'id'),
     )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     ai_model_id = Column(Integer, ForeignKey("ai_models.id"), nullable=False)  # 关联用户 AI 配置
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
-    updated_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC), onupdate=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     title = Column(String(100))  # 调整：加长标题长度（原 50 可能不够）
     status = Column(String(20), default="active")
 
@@ -349,7 +389,7 @@ class APILog(Base):
     endpoint = Column(String(200))
     request_params = Column(Text)  # 调整：用 Text 替代 String(1000)，支持更长参数
     response = Column(Text)  # 调整：用 Text 替代 String(1000)，支持更长响应
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # 关系（无调整）
     user = relationship("User", back_populates="api_logs")
@@ -361,7 +401,7 @@ class Notification(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     message = Column(String(500))
     read = Column(Boolean, default=False)
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # 关系（无调整）
     user = relationship("User", back_populates="notifications")
@@ -369,12 +409,16 @@ class Notification(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # 取会话最后一条消息（列表预览）及按时间顺序读取消息
+        Index('ix_messages_conversation_id_created_at', 'conversation_id', 'created_at'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String(20), nullable=False)  # 'user', 'assistant', 'system'
-    content = Column(Text)  # 调整：用 Text 替代 String(2000)，支持更长消息
+    content = deferred(Column(Text))  # 调整：用 Text 替代 String(2000)，支持更长消息（延迟加载）
     docx_file = Column(String(255), nullable=True)  # 补充：关联生成的 DOCX 文件（原在 Conversation 中分散存储）
-    created_at = Column(TIMESTAMP, default=lambda: datetime.now(pytz.UTC))
+    created_at = Column(TIMESTAMP, default=lambda: datetime.now(timezone.utc))
 
     # 关系（无调整）
     conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
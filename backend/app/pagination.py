@@ -0,0 +1,103 @@
+# pagination.py
+"""
+游标（keyset）分页工具
+
+游标为排序键 (如 updated_at, id) 序列化后的 urlsafe base64 字符串，对前端不透明。
+按 "排序键 < 游标" 过滤代替 OFFSET，翻页成本与页码无关，且可直接利用
+(user_id, 排序列, id) 复合索引。
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, inspect, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# 总数统计上限：超过后不再精确计数，返回上限值并标记为非精确
+PAGINATION_TOTAL_CAP = int(os.getenv("PAGINATION_TOTAL_CAP", "10000"))
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    """解析游标；格式错误时返回 400"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("游标长度不匹配")
+        return [_decode_value(v) for v in values]
+    except Exception:
+        raise HTTPException(status_code=400, detail="分页游标无效")
+
+
+def keyset_before(columns: Sequence, values: Sequence):
+    """
+    倒序翻页条件：(c1, c2, ...) < (v1, v2, ...)
+    展开为 OR/AND 形式（兼容 MySQL/SQLite，且能走复合索引范围扫描）
+    """
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        conditions.append(and_(*equal_prefix, column < value))
+    return or_(*conditions)
+
+
+def keyset_page(
+    query,
+    columns: Sequence,
+    cursor: Optional[str],
+    page_size: int,
+    offset: int = 0
+) -> Tuple[list, Optional[str]]:
+    """
+    按 columns 倒序取一页（columns 末尾须为主键，保证排序唯一）
+    传入游标时按游标定位；否则退回 OFFSET（兼容旧的页码参数）
+    多取 1 行判断是否还有下一页，返回 (当前页数据, 下一页游标)
+    """
+    position = decode_cursor(cursor, len(columns))
+    query = query.order_by(*[column.desc() for column in columns])
+    if position:
+        query = query.filter(keyset_before(columns, position))
+    elif offset:
+        query = query.offset(offset)
+    rows = query.limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(*[getattr(last, column.key) for column in columns])
+
+
+def capped_count(query, cap: int = PAGINATION_TOTAL_CAP) -> Tuple[int, bool]:
+    """
+    有上限的计数：最多扫描 cap+1 行，返回 (数量, 是否精确)
+    避免数据量很大的用户每次翻页都做一次全量 count
+    """
+    # 只取主键列，扫描可完全在索引上完成
+    entity = query.column_descriptions[0]["entity"]
+    limited = query.with_entities(*inspect(entity).primary_key).limit(cap + 1).subquery()
+    total = query.session.query(func.count()).select_from(limited).scalar()
+    if total > cap:
+        return cap, False
+    return total, True
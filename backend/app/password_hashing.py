@@ -0,0 +1,99 @@
+# password_hashing.py
+"""
+密码哈希（bcrypt）专用执行器
+
+bcrypt 是刻意设计的 CPU 密集型运算（cost=12 时单次约 0.2~0.3 秒）。直接在路由中调用会占满
+AnyIO 默认线程池（40 个线程），登录高峰时所有同步路由/数据库操作都要排队。
+这里使用独立的有界线程池（bcrypt 计算期间释放 GIL），并限制排队深度：
+超过 PASSWORD_HASH_QUEUE_LIMIT 时直接拒绝（503），而不是无限堆积请求。
+
+BCRYPT_ROUNDS 调整后，旧 cost 的哈希在用户下次登录成功时自动重新计算（rehash-on-login）。
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from . import metrics
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 并发计算数：默认等于 CPU 核数（再多只会互相抢占 CPU）
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# 计算中 + 排队中的上限，超出即拒绝
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", str(PASSWORD_HASH_WORKERS * 8)))
+
+# cost 不等于 BCRYPT_ROUNDS 的哈希视为需要更新（调高/调低 cost 均在登录时迁移）
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashBusy(Exception):
+    """哈希执行器排队已满"""
+
+
+class PasswordHasher:
+    """有界的 bcrypt 执行器"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT):
+        self.workers = max(1, workers)
+        self.queue_limit = max(self.workers, queue_limit)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            return self._executor
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                metrics.incr("password_hash_rejected_total")
+                raise PasswordHashBusy()
+            self._pending += 1
+        submitted_at = time.perf_counter()
+
+        def timed_call():
+            started_at = time.perf_counter()
+            metrics.observe("password_hash_queue_wait_seconds", started_at - submitted_at)
+            try:
+                return func(*args)
+            finally:
+                metrics.observe("password_hash_seconds", time.perf_counter() - started_at)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), timed_call)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """校验密码；cost 与当前配置不一致时一并返回新哈希（否则为 None）"""
+        return await self._run(pwd_context.verify_and_update, password, password_hash)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "queue_limit": self.queue_limit, "pending": self._pending}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
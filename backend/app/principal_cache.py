@@ -0,0 +1,97 @@
+# principal_cache.py
+"""
+认证用户缓存
+
+每个请求都要 解码JWT + 按用户名查 users 表；SSE/轮询类客户端请求频繁，查询量可观。
+这里按 (sub, iat) 缓存解析出的用户身份（只含路由用到的 id/username/role），
+命中时整个认证过程不占用数据库连接。
+
+- 条目数上限（LRU）+ 短 TTL（默认 30 秒），多 worker 时各进程独立
+- User 行被更新/删除时（ORM flush）立即失效该用户的全部条目；
+  其他进程/直接改库的变更最多在 TTL 后生效
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from sqlalchemy import event, inspect
+
+from . import metrics
+from .models import User
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """已认证用户（与 ORM 对象解耦，可跨请求/线程共享）"""
+    id: int
+    username: str
+    role: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, username=user.username, role=user.role or "user")
+
+
+class PrincipalCache:
+    """(sub, iat) -> Principal 的 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, Optional[int]], tuple]" = OrderedDict()  # key -> (写入时间, Principal)
+        self._lock = threading.Lock()
+
+    def get(self, username: str, issued_at: Optional[int]) -> Optional[Principal]:
+        key = (username, issued_at)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                metrics.incr("principal_cache_misses_total")
+                return None
+            self._entries.move_to_end(key)
+        metrics.incr("principal_cache_hits_total")
+        return entry[1]
+
+    def set(self, username: str, issued_at: Optional[int], principal: Principal):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(username, issued_at)] = (time.monotonic(), principal)
+            self._entries.move_to_end((username, issued_at))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        """清除某用户的全部条目（同一用户可能持有多个不同 iat 的 token）"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == username]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl}
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    principal_cache.invalidate(target.username)
+    # 用户名本身被修改时，旧用户名下的条目也要清除
+    for old_username in inspect(target).attrs.username.history.deleted:
+        principal_cache.invalidate(old_username)
@@ -0,0 +1,136 @@
+# query_stats.py
+"""
+慢查询统计（替代 echo=True 的全量 SQL 日志）
+
+通过 SQLAlchemy 游标事件计时，超过 SLOW_QUERY_THRESHOLD_MS 的语句记入环形缓冲区：
+语句指纹（参数/字面量归一化后的 SQL）、耗时、行数、来源路由。
+/admin/slow-queries 按指纹聚合展示耗时最多的语句；可按比例抽样写入日志。
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from . import metrics
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "500"))
+# 慢查询写入日志的抽样比例（0 表示不写日志，仅保留在缓冲区）
+SLOW_QUERY_LOG_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_LOG_SAMPLE_RATE", "0.1"))
+
+logger = logging.getLogger("app.slow_query")
+
+# 当前请求的路由（由 RouteContextMiddleware 设置，线程池/子任务中自动继承）
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+_slow_queries: deque = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_lock = threading.Lock()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\([^)]+\)s|%s|\?|:\w+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+_PATH_ID = re.compile(r"/(?:\d+|[0-9a-f]{32})(?=/|$)")
+
+
+def fingerprint(statement: str) -> str:
+    """SQL 指纹：字面量与绑定参数统一替换为 ?，IN 列表折叠，空白归一"""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def normalize_route(method: str, path: str) -> str:
+    """路由归一：路径中的数字ID/任务ID替换为 {id}，便于聚合"""
+    return f"{method} {_PATH_ID.sub('/{id}', path)}"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_query_started_at", None)
+    if started_at is None:
+        return
+    duration_ms = (time.perf_counter() - started_at) * 1000
+    if duration_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+    record = {
+        "fingerprint": fingerprint(statement),
+        "duration_ms": round(duration_ms, 2),
+        "rows": cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None,
+        "route": current_route.get(),
+        "at": time.time(),
+    }
+    with _lock:
+        _slow_queries.append(record)
+    metrics.incr("db_slow_queries_total")
+    if SLOW_QUERY_LOG_SAMPLE_RATE > 0 and random.random() < SLOW_QUERY_LOG_SAMPLE_RATE:
+        logger.warning("slow query %s", json.dumps(record, ensure_ascii=False))
+
+
+def install(engine):
+    """为同步引擎（异步引擎传入 async_engine.sync_engine）注册慢查询计时事件"""
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def top_fingerprints(limit: int = 20) -> list:
+    """按指纹聚合缓冲区内的慢查询，按总耗时倒序"""
+    with _lock:
+        records = list(_slow_queries)
+    groups = {}
+    for record in records:
+        group = groups.get(record["fingerprint"])
+        if group is None:
+            group = groups[record["fingerprint"]] = {
+                "fingerprint": record["fingerprint"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "max_rows": None,
+                "routes": {},
+                "last_seen": 0.0,
+            }
+        group["count"] += 1
+        group["total_ms"] += record["duration_ms"]
+        group["max_ms"] = max(group["max_ms"], record["duration_ms"])
+        if record["rows"] is not None:
+            group["max_rows"] = max(group["max_rows"] or 0, record["rows"])
+        route = record["route"] or "-"
+        group["routes"][route] = group["routes"].get(route, 0) + 1
+        group["last_seen"] = max(group["last_seen"], record["at"])
+
+    result = sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)[:limit]
+    for group in result:
+        group["avg_ms"] = round(group["total_ms"] / group["count"], 2)
+        group["total_ms"] = round(group["total_ms"], 2)
+    return result
+
+
+class RouteContextMiddleware:
+    """ASGI 中间件：把当前请求的路由写入 current_route（不包装响应，流式接口无额外开销）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = current_route.set(normalize_route(scope["method"], scope["path"]))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
@@ -0,0 +1,240 @@
+# resilience.py
+"""
+AI 平台调用的容错策略
+
+- 熔断器：按 (平台, BaseURL) 统计连续失败，达到阈值后熔断（快速失败，不再占用线程/连接），
+  冷却期结束后进入半开状态，只放行少量探测请求，探测成功即恢复
+- 重试预算：重试次数不超过近期请求量的一定比例，避免平台故障时重试放大流量
+- 指数退避 + 全抖动：仅用于非流式、幂等的 generate 调用
+
+只有"平台不可用"类错误（超时、连接失败、429、5xx）计入熔断和重试；
+鉴权失败、参数错误等 4xx 说明平台本身可用，不计入。
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from . import metrics
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2.0"))
+# 重试预算：窗口内重试数 ≤ max(最低额度, 请求数 × 比例)
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN = int(os.getenv("RETRY_BUDGET_MIN", "3"))
+RETRY_BUDGET_WINDOW = float(os.getenv("RETRY_BUDGET_WINDOW", "10"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_ERROR_NAMES = {
+    # httpx / requests / openai / anthropic 的网络类异常
+    "TimeoutException", "ConnectError", "ReadError", "RemoteProtocolError", "NetworkError",
+    "PoolTimeout", "ConnectTimeout", "ReadTimeout", "Timeout", "ConnectionError",
+    "APIConnectionError", "APITimeoutError", "InternalServerError", "RateLimitError",
+    "ServiceUnavailableError", "OverloadedError",
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断中，调用被直接拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"平台 {name} 暂时不可用（已熔断），请 {retry_after:.0f} 秒后重试")
+        self.retry_after = retry_after
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """是否为平台不可用类错误（沿异常链检查，兼容客户端包装过的 RuntimeError）"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, CircuitOpenError):
+            return False
+        if isinstance(exc, (TimeoutError, ConnectionError)):
+            return True
+        status = _status_code(exc)
+        if status is not None:
+            return status in _RETRYABLE_STATUS
+        if any(cls.__name__ in _RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class CircuitBreaker:
+    """单个平台端点的熔断器（线程安全，同步/异步调用共用）"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probes_in_flight = 0
+        self.total_failures = 0
+        self.total_rejections = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """调用前检查；熔断中抛出 CircuitOpenError，半开时占用一个探测名额"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.total_rejections += 1
+                    metrics.incr("circuit_rejections_total")
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = HALF_OPEN
+                self.probes_in_flight = 0
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    self.total_rejections += 1
+                    metrics.incr("circuit_rejections_total")
+                    raise CircuitOpenError(self.name, 0)
+                self.probes_in_flight += 1
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self.probes_in_flight = 0
+                self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    metrics.incr("circuit_opened_total")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probes_in_flight = 0
+
+    def record_error(self, exc: BaseException):
+        """按错误类型记录结果：平台不可用计为失败，其余说明平台有响应"""
+        if is_transient_error(exc):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def release(self):
+        """调用未产生结果（如客户端取消）时归还半开探测名额"""
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes_in_flight > 0:
+                self.probes_in_flight -= 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            retry_after = None
+            if self.state == OPEN:
+                retry_after = max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "total_failures": self.total_failures,
+                "total_rejections": self.total_rejections,
+                "retry_after": retry_after,
+            }
+
+
+class RetryBudget:
+    """滑动窗口内的重试额度"""
+
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        min_retries: int = RETRY_BUDGET_MIN,
+        window: float = RETRY_BUDGET_WINDOW
+    ):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: deque = deque()
+        self._retries: deque = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            self._requests.append(now)
+
+    def try_acquire(self) -> bool:
+        """申请一次重试额度；预算耗尽返回 False"""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            if len(self._retries) >= max(self.min_retries, len(self._requests) * self.ratio):
+                metrics.incr("retry_budget_exhausted_total")
+                return False
+            self._retries.append(now)
+            metrics.incr("retries_total")
+            return True
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """第 attempt 次重试（从 1 开始）的等待时间：指数退避 + 全抖动"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+# (平台, BaseURL) -> (熔断器, 重试预算)
+_endpoints: Dict[Tuple[str, str], Tuple[CircuitBreaker, RetryBudget]] = {}
+_endpoints_lock = threading.Lock()
+
+
+def _endpoint(platform: str, base_url: Optional[str]) -> Tuple[CircuitBreaker, RetryBudget]:
+    key = (platform, base_url or "")
+    with _endpoints_lock:
+        endpoint = _endpoints.get(key)
+        if endpoint is None:
+            name = f"{platform}@{base_url}" if base_url else platform
+            endpoint = _endpoints[key] = (CircuitBreaker(name), RetryBudget())
+        return endpoint
+
+
+def get_breaker(platform: str, base_url: Optional[str]) -> CircuitBreaker:
+    """获取 (平台, BaseURL) 对应的熔断器"""
+    return _endpoint(platform, base_url)[0]
+
+
+def get_retry_budget(platform: str, base_url: Optional[str]) -> RetryBudget:
+    """获取 (平台, BaseURL) 对应的重试预算（各端点独立，避免单个平台故障耗尽全部额度）"""
+    return _endpoint(platform, base_url)[1]
+
+
+def breaker_states() -> list:
+    with _endpoints_lock:
+        breakers = [breaker for breaker, _ in _endpoints.values()]
+    return [breaker.to_dict() for breaker in breakers]
@@ -0,0 +1,141 @@
+# sse.py
+"""
+SSE 流式输出工具
+
+ChunkCoalescer 把 AI 平台返回的细碎片段按 大小/时间窗口 合并成帧：
+- 缓冲达到 SSE_FLUSH_BYTES 字节，或首个未发送片段等待超过 SSE_FLUSH_INTERVAL 秒时输出一帧
+- 平台读取在独立任务中进行，通过有界队列交给合并端，时间窗口到期时无需等待下一个片段
+
+合并在生成任务内完成（每个任务一次），帧写入任务的事件环形缓冲区，由所有订阅者共享：
+缓冲区按帧而非按片段计数，长文生成也能完整续传。帧的消费方是 GenerationJob.publish（不会阻塞），
+因此队列不再承担对客户端连接的背压；各订阅者写入快慢互不影响，慢连接只是读取缓冲区的进度落后。
+"""
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Optional
+
+from . import metrics
+
+SSE_FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL", "0.03"))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "1024"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "256"))
+
+_END = object()
+
+
+class _SourceError:
+    __slots__ = ("exc",)
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def format_sse(data: dict, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """按 SSE 规范格式化一条事件（data 为 JSON，避免前端解析异常）"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ChunkCoalescer:
+    """将片段流合并为帧流，并统计本次流的 接收片段数 / 输出帧数"""
+
+    def __init__(
+        self,
+        source: AsyncIterator[str],
+        max_bytes: int = SSE_FLUSH_BYTES,
+        max_delay: float = SSE_FLUSH_INTERVAL,
+        queue_size: int = SSE_QUEUE_SIZE,
+    ):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.chunks_in = 0
+        self.frames_out = 0
+
+    async def _produce(self, queue: asyncio.Queue):
+        try:
+            async for chunk in self.source:
+                if chunk:
+                    await queue.put(chunk)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(_SourceError(e))
+
+    def _take(self, buffer: list) -> Optional[str]:
+        """取出缓冲内容；纯空白内容暂不发送（前端会忽略空白帧），留待与后续片段合并"""
+        frame = "".join(buffer)
+        if not frame.strip():
+            return None
+        buffer.clear()
+        self.frames_out += 1
+        return frame
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        producer = asyncio.create_task(self._produce(queue))
+        getter = None
+        buffer: list = []
+        size = 0
+        deadline = None
+        try:
+            while True:
+                # 复用未完成的 get 任务，超时不取消，避免丢失片段
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    # 时间窗口到期：输出已缓冲的片段
+                    deadline = None
+                    frame = self._take(buffer)
+                    if frame is not None:
+                        size = 0
+                        yield frame
+                    continue
+
+                item, getter = getter.result(), None
+                if item is _END:
+                    break
+                if isinstance(item, _SourceError):
+                    raise item.exc
+
+                self.chunks_in += 1
+                buffer.append(item)
+                size += len(item.encode("utf-8"))
+                if deadline is None:
+                    deadline = loop.time() + self.max_delay
+                if size >= self.max_bytes:
+                    frame = self._take(buffer)
+                    if frame is not None:
+                        size, deadline = 0, None
+                        yield frame
+
+            frame = self._take(buffer)
+            if frame is not None:
+                yield frame
+        finally:
+            for task in (getter, producer):
+                if task is not None and not task.done():
+                    task.cancel()
+                    try:
+                        await task
+                    except (asyncio.CancelledError, Exception):
+                        pass
+            self._record_metrics()
+
+    def _record_metrics(self):
+        metrics.incr("sse_streams_total")
+        metrics.incr("sse_chunks_received_total", self.chunks_in)
+        metrics.incr("sse_frames_emitted_total", self.frames_out)
+        if self.frames_out:
+            metrics.observe("sse_chunks_per_frame", self.chunks_in / self.frames_out)
@@ -0,0 +1,161 @@
+# template_store.py
+"""
+模板内容寻址存储
+
+用户反复上传同一份公文模板时，文件和解析出的文本只保存一份：
+- 文件按 SHA-256 保存为 TEMPLATE_BLOB_DIR/<sha256>.docx，对应一行 TemplateBlob（含解析文本及结构化表示）
+- 上传命中已有 blob 时直接引用（ref_count + 1），删除本次的临时文件，不再解析docx
+- 模板替换文件时 ref_count - 1；归零超过宽限期的 blob 由 GC 删除，
+  目录中没有 blob 记录的文件（临时文件、已删除 blob 的文件）超过宽限期后一并清理
+
+引用数均以 SQL 原子加减更新，调用方负责在同一事务中提交模板记录。
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, undefer
+
+from . import metrics
+from .database import SessionLocal
+from .models import TemplateBlob
+from .template_structure import ParsedTemplate, dump_structure, template_structures
+from .utils import SavedUpload
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_BLOB_DIR = os.getenv(
+    "TEMPLATE_BLOB_DIR", os.path.join(os.path.dirname(__file__), '..', 'uploads', 'blobs')
+)
+# 引用数归零（或文件无对应记录）多久之后才清理（秒），避免与进行中的上传竞争
+TEMPLATE_BLOB_GC_GRACE = float(os.getenv("TEMPLATE_BLOB_GC_GRACE", "3600"))
+# 后台 GC 间隔（秒），0 表示不自动运行（可调用 /admin/template-blobs/gc）
+TEMPLATE_BLOB_GC_INTERVAL = float(os.getenv("TEMPLATE_BLOB_GC_INTERVAL", "3600"))
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _reference_existing(db: Session, sha256: str) -> Optional[TemplateBlob]:
+    """已有相同内容的 blob 时引用数 +1 并返回；不存在（或刚被 GC 删除）返回 None"""
+    updated = db.query(TemplateBlob).filter(TemplateBlob.sha256 == sha256).update(
+        {TemplateBlob.ref_count: TemplateBlob.ref_count + 1}, synchronize_session=False
+    )
+    if not updated:
+        return None
+    return db.query(TemplateBlob).filter(TemplateBlob.sha256 == sha256).options(
+        undefer(TemplateBlob.content)
+    ).one()
+
+
+def acquire_blob(db: Session, saved: SavedUpload, parse: Callable[[bytes], ParsedTemplate]) -> TemplateBlob:
+    """
+    为保存到 TEMPLATE_BLOB_DIR 的上传文件获取 blob 并引用数 +1（调用方负责提交）
+    内容已存在时复用已有文件、文本与结构；否则调用 parse 解析（异常原样抛出），
+    新建 blob 成功后再把上传文件改名为 <sha256>.docx（并发插入失败的一方只删除自己的临时文件）
+    """
+    blob = _reference_existing(db, saved.sha256)
+    if blob is not None:
+        _discard(saved.path)
+        metrics.incr("template_blob_dedup_hits_total")
+        return blob
+
+    try:
+        parsed = parse(saved.data)
+    except BaseException:
+        _discard(saved.path)
+        raise
+    filename = f"{saved.sha256}.docx"
+    blob = TemplateBlob(
+        sha256=saved.sha256, size=saved.size, filename=filename,
+        content=parsed.text, structure=dump_structure(parsed.structure), ref_count=1
+    )
+    try:
+        with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        # 并发上传了相同文件，对方已先创建 blob（及其文件）：改为引用它，丢弃本次的临时文件
+        _discard(saved.path)
+        blob = _reference_existing(db, saved.sha256)
+        if blob is None:
+            raise
+        metrics.incr("template_blob_dedup_hits_total")
+        return blob
+    # 插入成功后才把临时文件改名为最终文件名；调用方提交失败时留下的文件由 GC 按孤立文件清理
+    try:
+        os.replace(saved.path, os.path.join(TEMPLATE_BLOB_DIR, filename))
+    except BaseException:
+        _discard(saved.path)
+        raise
+    metrics.incr("template_blob_created_total")
+    # 结构只由文件内容决定，刚解析的结果直接放入缓存，后续生成无需再读库
+    template_structures.set(saved.sha256, parsed.structure)
+    return blob
+
+
+def release_blob(db: Session, blob_id: int):
+    """模板不再引用 blob 时引用数 -1（调用方负责提交）；文件由 GC 延迟清理"""
+    db.query(TemplateBlob).filter(TemplateBlob.id == blob_id).update(
+        {TemplateBlob.ref_count: TemplateBlob.ref_count - 1}, synchronize_session=False
+    )
+
+
+def collect_garbage(grace: float = TEMPLATE_BLOB_GC_GRACE) -> dict:
+    """
+    删除引用数归零超过 grace 秒的 blob，并清理目录中没有 blob 记录、且修改时间早于 grace 秒的文件
+    （新建 blob 的文件刚写入，修改时间较新，不会被误删）
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace)
+    db = SessionLocal()
+    try:
+        blobs_deleted = db.query(TemplateBlob).filter(
+            TemplateBlob.ref_count <= 0,
+            TemplateBlob.updated_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        known = {filename for (filename,) in db.query(TemplateBlob.filename)}
+    finally:
+        db.close()
+
+    files_removed = 0
+    file_cutoff = time.time() - grace
+    try:
+        names = os.listdir(TEMPLATE_BLOB_DIR)
+    except FileNotFoundError:
+        names = []  # 目录在首次上传时才创建
+    for name in names:
+        path = os.path.join(TEMPLATE_BLOB_DIR, name)
+        if name in known:
+            continue
+        try:
+            if os.path.getmtime(path) < file_cutoff:
+                os.remove(path)
+                files_removed += 1
+        except FileNotFoundError:
+            pass
+
+    metrics.incr("template_blob_gc_deleted_total", blobs_deleted)
+    metrics.incr("template_blob_gc_files_removed_total", files_removed)
+    return {"blobs_deleted": blobs_deleted, "files_removed": files_removed}
+
+
+async def run_gc_loop(interval: float = TEMPLATE_BLOB_GC_INTERVAL):
+    """后台定期 GC（由应用 lifespan 启动与取消）"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await run_in_threadpool(collect_garbage)
+            if result["blobs_deleted"] or result["files_removed"]:
+                logger.info("模板 blob GC: %s", result)
+        except Exception:
+            logger.exception("模板 blob GC 失败")
+
@@ -0,0 +1,220 @@
+# template_structure.py
+"""
+模板结构化表示
+
+上传时用 python-docx 解析一次（每个不同的模板文件只解析一次），得到紧凑的 JSON 结构，
+与 TemplateBlob 一起持久化：
+- blocks：按文档顺序的段落（含 style id，Normal 省略）与表格（单元格文本，合并单元格只保留一次）
+- headers / footers：各节页眉页脚文本（去重）
+- placeholders：待填写项的位置（{{名称}}、【名称】、XX/×× 及下划线空白）
+
+组装 Prompt（保留标题层级、表格、页眉页脚）及渲染（套用页眉页脚）时通过进程内 LRU 读取，
+不再重新打开 docx 压缩包。blob 按内容寻址、内容不可变，缓存以 sha256 为键，无需失效。
+"""
+import io
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from . import metrics
+from .database import SessionLocal
+from .models import TemplateBlob
+
+STRUCTURE_VERSION = 1
+TEMPLATE_STRUCTURE_CACHE_SIZE = int(os.getenv("TEMPLATE_STRUCTURE_CACHE_SIZE", "256"))
+
+# 待填写项：{{名称}}、【名称】、连续的 X/×、连续下划线
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(.+?)\s*\}\}|【([^】]*)】|[XＸ×]{2,}|[_＿]{3,}")
+# 标题样式：英文版 Word 为 Heading1，中文版 Word 的 style id 为纯数字
+HEADING_STYLE_PATTERN = re.compile(r"^(?:Heading)?([1-9])$", re.IGNORECASE)
+
+
+@dataclass
+class ParsedTemplate:
+    text: str  # 正文段落纯文本（与旧版模板内容一致，用于预览与 /template-content）
+    structure: dict
+
+
+def _placeholders(text: str) -> List[list]:
+    """返回 [[start, end, 名称], ...]；XX/下划线类空白的名称为空字符串"""
+    spans = []
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        name = match.group(1) or match.group(2) or ""
+        spans.append([match.start(), match.end(), name.strip()])
+    return spans
+
+
+def _paragraph_block(paragraph, text: str) -> dict:
+    block = {"t": "p", "text": text}
+    # 直接读 w:pStyle 的 style id（未设置即默认样式）；paragraph.style 每次都要遍历样式表查默认样式，较慢
+    style_id = paragraph._p.style
+    if style_id and style_id != "Normal":
+        block["style"] = style_id
+    spans = _placeholders(text)
+    if spans:
+        block["ph"] = spans
+    return block
+
+
+def _table_block(table) -> dict:
+    rows = []
+    for row in table.rows:
+        cells, seen = [], set()
+        for cell in row.cells:
+            # 横向合并的单元格在 row.cells 中重复出现
+            if id(cell._tc) in seen:
+                continue
+            seen.add(id(cell._tc))
+            cells.append(cell.text)
+        rows.append(cells)
+    block = {"t": "table", "rows": rows}
+    spans = [
+        [r, c, *span]
+        for r, cells in enumerate(rows)
+        for c, text in enumerate(cells)
+        for span in _placeholders(text)
+    ]
+    if spans:
+        block["ph"] = spans  # [[行, 列, start, end, 名称], ...]
+    return block
+
+
+def _header_footer_texts(parts) -> List[str]:
+    texts = []
+    for part in parts:
+        text = "\n".join(p.text for p in part.paragraphs if p.text.strip())
+        if text and text not in texts:
+            texts.append(text)
+    return texts
+
+
+def parse_template(data: bytes) -> ParsedTemplate:
+    """解析docx（同步、CPU 密集，在线程池中调用）；文件无效时由 python-docx 抛出异常"""
+    from docx import Document
+    from docx.oxml.ns import qn
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = Document(io.BytesIO(data))
+    blocks, lines = [], []
+    for child in doc.element.body.iterchildren():
+        if child.tag == qn("w:p"):
+            paragraph = Paragraph(child, doc._body)
+            # paragraph.text 每次访问都要遍历 XML，只取一次
+            text = paragraph.text
+            lines.append(text)
+            if text.strip():
+                blocks.append(_paragraph_block(paragraph, text))
+        elif child.tag == qn("w:tbl"):
+            blocks.append(_table_block(Table(child, doc._body)))
+
+    sections = doc.sections
+    structure = {
+        "v": STRUCTURE_VERSION,
+        "blocks": blocks,
+        "headers": _header_footer_texts(s.header for s in sections if not s.header.is_linked_to_previous),
+        "footers": _header_footer_texts(s.footer for s in sections if not s.footer.is_linked_to_previous),
+    }
+    return ParsedTemplate(text="\n".join(lines), structure=structure)
+
+
+def dump_structure(structure: dict) -> str:
+    return json.dumps(structure, ensure_ascii=False, separators=(",", ":"))
+
+
+def structure_to_prompt(structure: dict) -> str:
+    """结构化模板转为 Prompt 文本：标题用 Markdown #，表格用 Markdown 表格，附页眉页脚及待填写项"""
+    lines = []
+    for header in structure.get("headers", []):
+        lines.append(f"【页眉】{header}")
+    placeholders = []
+    for block in structure.get("blocks", []):
+        if block["t"] == "p":
+            match = HEADING_STYLE_PATTERN.match(block.get("style", ""))
+            prefix = "#" * int(match.group(1)) + " " if match else ("# " if block.get("style") == "Title" else "")
+            lines.append(prefix + block["text"])
+            spans = block.get("ph", [])
+        else:
+            for row in block["rows"]:
+                lines.append("| " + " | ".join(cell.replace("\n", " ") for cell in row) + " |")
+            spans = [span[2:] for span in block.get("ph", [])]
+        placeholders.extend(name for _, _, name in spans if name and name not in placeholders)
+    for footer in structure.get("footers", []):
+        lines.append(f"【页脚】{footer}")
+    if placeholders:
+        lines.append("待填写项：" + "、".join(placeholders))
+    return "\n".join(lines)
+
+
+def structure_layout(structure: dict) -> Optional[dict]:
+    """渲染时套用的版式信息（页眉页脚）；模板没有页眉页脚时返回 None"""
+    headers, footers = structure.get("headers", []), structure.get("footers", [])
+    if not headers and not footers:
+        return None
+    return {"header": headers[0] if headers else None, "footer": footers[0] if footers else None}
+
+
+class TemplateStructureCache:
+    """按 blob sha256 缓存已解析的结构（LRU，线程安全）"""
+
+    def __init__(self, max_size: int = TEMPLATE_STRUCTURE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sha256: str) -> Optional[dict]:
+        with self._lock:
+            structure = self._entries.get(sha256)
+            if structure is not None:
+                self._entries.move_to_end(sha256)
+        metrics.incr("template_structure_cache_hits_total" if structure is not None else "template_structure_cache_misses_total")
+        return structure
+
+    def set(self, sha256: str, structure: dict):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[sha256] = structure
+            self._entries.move_to_end(sha256)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size}
+
+    def load(self, blob: TemplateBlob, blob_dir: str) -> dict:
+        """
+        读取 blob 的结构：优先缓存，其次数据库中的 structure 列；
+        早于结构化存储创建的 blob 没有该列，从文件解析一次并回写
+        """
+        structure = self.get(blob.sha256)
+        if structure is not None:
+            return structure
+        raw = blob.structure
+        if raw is not None:
+            structure = json.loads(raw)
+        else:
+            with open(os.path.join(blob_dir, blob.filename), "rb") as f:
+                structure = parse_template(f.read()).structure
+            db = SessionLocal()
+            try:
+                db.query(TemplateBlob).filter(TemplateBlob.id == blob.id).update(
+                    {TemplateBlob.structure: dump_structure(structure)}, synchronize_session=False
+                )
+                db.commit()
+            finally:
+                db.close()
+        self.set(blob.sha256, structure)
+        return structure
+
+
+template_structures = TemplateStructureCache()
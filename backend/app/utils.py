@@ -1,22 +1,60 @@
 # utils.py
+import hashlib
 import json
 import os
-from docx import Document
 import uuid
+from dataclasses import dataclass
+import aiofiles
 from .models import AIModelResponse,AIModel
 from typing import Optional
 DATA_FILE = os.path.join(os.path.dirname(__file__), "conversations.json")
 
-async def save_uploaded_file(upload_file, upload_dir: str) -> str:
+# 上传文件每次读取的块大小（字节）
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+
+class UploadTooLarge(Exception):
+    """上传文件超过大小限制（已写入的部分文件会被删除）"""
+
+
+@dataclass
+class SavedUpload:
+    path: str
+    size: int
+    sha256: str
+    data: bytes  # 文件内容的内存副本，解析时无需再从磁盘读取
+
+
+async def save_uploaded_file(upload_file, upload_dir: str, max_size: Optional[int] = None) -> SavedUpload:
+    """
+    单次流式保存上传文件：逐块累计大小（超过 max_size 立即中止）、计算 SHA-256，
+    并通过 aiofiles 异步写入磁盘，不阻塞事件循环；失败时删除未写完的文件
+    """
     ext = os.path.splitext(upload_file.filename)[1]
     filename = f"{uuid.uuid4().hex}{ext}"
+    os.makedirs(upload_dir, exist_ok=True)  # 首次使用时创建，导入模块时不触碰磁盘
     path = os.path.join(upload_dir, filename)
-    with open(path, 'wb') as f:
-        content = upload_file.file.read()
-        f.write(content)
-    return path
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    try:
+        async with aiofiles.open(path, 'wb') as f:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLarge(size)
+                digest.update(chunk)
+                chunks.append(chunk)
+                await f.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return SavedUpload(path=path, size=size, sha256=digest.hexdigest(), data=b"".join(chunks))
 
 def render_docx_from_template(template_path: str | None, content: str) -> str:
+    from docx import Document  # python-docx 导入较慢，按需加载
+
     doc = Document()
     if template_path and os.path.exists(template_path):
         try:
@@ -64,14 +102,8 @@ def ai_model_to_response(ai_model: "AIModel", system_model: Optional["Model"] =
         if platform:
             platform_name = getattr(platform, "name", "未知平台")
 
-    # 处理脱敏 api_key
-    raw_key = getattr(ai_model, "api_key", "") or ""
-    if not raw_key:
-        api_key_mask = ""
-    elif len(raw_key) <= 8:
-        api_key_mask = f"{raw_key[:4]}***"
-    else:
-        api_key_mask = f"{raw_key[:4]}***{raw_key[-4:]}"
+    # 脱敏 api_key：使用写入时保存的脱敏值（api_key 列为密文，不能直接截取）
+    api_key_mask = getattr(ai_model, "api_key_mask", None) or ""
 
     return AIModelResponse(
         id=ai_model.id,
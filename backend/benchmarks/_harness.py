@@ -0,0 +1,139 @@
+# _harness.py
+"""
+基准测试公共环境：临时 SQLite 数据库 + 模拟 AI 平台 + 进程内 uvicorn
+
+模拟平台 "bench" 按固定间隔吐出片段（不访问外部网络），
+用于在本地复现"流式生成 + 列表查询"混合负载。
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_env(db_path: str = None):
+    """在导入 app 之前配置环境变量（数据库、加密密钥等）"""
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    db_path = db_path or os.path.join(work_dir, "bench.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{db_path}")
+    os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{db_path}")
+    if not os.getenv("ENCRYPTION_KEY"):
+        from cryptography.fernet import Fernet
+        os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+    os.environ.setdefault("SQL_ECHO", "false")
+    os.chdir(work_dir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return work_dir
+
+
+def register_bench_provider(chunks: int = 40, chunk_delay: float = 0.02):
+    """注册模拟平台：每 chunk_delay 秒产出一个片段，共 chunks 个"""
+    from app.AI_client import AIClientFactory, BaseAIClient
+
+    class BenchClient(BaseAIClient):
+        def _get_default_model(self):
+            return "bench-1"
+
+        def _initialize_client(self):
+            return None
+
+        def generate(self, prompt, system_prompt=None):
+            time.sleep(chunk_delay * chunks)
+            return "基准测试标题"
+
+        def stream_generate(self, prompt, system_prompt=None):
+            for i in range(chunks):
+                time.sleep(chunk_delay)
+                yield f"第{i}段内容。"
+
+        async def agenerate(self, prompt, system_prompt=None):
+            await asyncio.sleep(chunk_delay * chunks)
+            return "基准测试标题"
+
+        async def astream_generate(self, prompt, system_prompt=None):
+            for i in range(chunks):
+                await asyncio.sleep(chunk_delay)
+                yield f"第{i}段内容。"
+
+    AIClientFactory.SUPPORTED_PROVIDERS["bench"] = BenchClient
+
+
+def create_schema():
+    from app.database import engine
+    from app.models import Base
+    Base.metadata.create_all(bind=engine)
+
+
+def simulate_db_latency(seconds: float):
+    """每条 SQL 执行前休眠 seconds 秒，模拟生产环境 MySQL 的网络往返（本地 SQLite 几乎为 0）"""
+    if seconds <= 0:
+        return
+    from sqlalchemy import event
+    from app.database import engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _delay(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(seconds)
+
+
+def seed_platform() -> int:
+    """创建模拟平台及模型，返回 Model.id"""
+    from app.database import SessionLocal
+    from app.models import Model, Platform
+    db = SessionLocal()
+    try:
+        platform = Platform(name="bench", base_url="http://bench.local")
+        db.add(platform)
+        db.commit()
+        model = Model(name="bench-1", platform_id=platform.id)
+        db.add(model)
+        db.commit()
+        return model.id
+    finally:
+        db.close()
+
+
+class ServerThread:
+    """在后台线程中运行 uvicorn（单进程、单事件循环，与生产部署的单个 worker 一致）"""
+
+    def __init__(self, app, port: int = 8765):
+        import uvicorn
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    return {
+        "count": len(values),
+        "p50_ms": round(pick(0.5) * 1000, 1),
+        "p95_ms": round(pick(0.95) * 1000, 1),
+        "p99_ms": round(pick(0.99) * 1000, 1),
+        "max_ms": round(values[-1] * 1000, 1),
+    }
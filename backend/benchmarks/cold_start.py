@@ -0,0 +1,126 @@
+# cold_start.py
+"""
+冷启动压测：导入耗时（python -X importtime）及进程启动到首个 /health 响应的时间
+
+每轮在全新子进程中执行，互不共享模块缓存：
+- import：`python -X importtime -c "import app.main"`，取 app.main 的累计导入耗时，
+  并按顶层包汇总自身耗时，列出最重的若干个包
+- ready：`python -m uvicorn app.main:app` 启动（含 lifespan 预热）到 /health 首次返回 200 的时间
+
+--backend-dir 可指向另一份代码（如 git worktree 中的旧版本）做对比。
+
+    cd backend && python benchmarks/cold_start.py --runs 5
+    git worktree add /tmp/old HEAD~1 && python benchmarks/cold_start.py --backend-dir /tmp/old/backend
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import _harness
+
+
+def child_env(backend_dir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = backend_dir + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("LOG_FILE", "")
+    return env
+
+
+def measure_import(backend_dir: str, env: dict):
+    """返回 (app.main 累计导入秒数, {顶层包: 自身导入秒数})"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=backend_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    total = 0.0
+    by_package = defaultdict(float)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        by_package[name.split(".")[0]] += int(self_us) / 1e6
+        if name == "app.main":
+            total = int(cumulative_us) / 1e6
+    return total, by_package
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_ready(backend_dir: str, env: dict, timeout: float) -> float:
+    """启动 uvicorn 子进程，返回到 /health 首次成功的秒数"""
+    import httpx
+
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn 已退出（exit code {proc.returncode}）")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"{timeout} 秒内未就绪")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="列出自身导入耗时最多的顶层包数量")
+    parser.add_argument("--backend-dir", default=_harness.BACKEND_DIR)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    _harness.setup_env()
+    backend_dir = os.path.abspath(args.backend_dir)
+    env = child_env(backend_dir)
+
+    import_times, ready_times = [], []
+    packages = defaultdict(list)
+    for _ in range(args.runs):
+        total, by_package = measure_import(backend_dir, env)
+        import_times.append(total)
+        for name, seconds in by_package.items():
+            packages[name].append(seconds)
+        ready_times.append(measure_ready(backend_dir, env, args.timeout))
+
+    heaviest = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:args.top]
+    result = {
+        "backend_dir": backend_dir,
+        "runs": args.runs,
+        "import_app_main_ms": {
+            "p50": round(statistics.median(import_times) * 1000, 1),
+            "min": round(min(import_times) * 1000, 1),
+        },
+        "time_to_first_health_ms": {
+            "p50": round(statistics.median(ready_times) * 1000, 1),
+            "min": round(min(ready_times) * 1000, 1),
+        },
+        "heaviest_packages_ms": {name: round(statistics.median(values) * 1000, 1) for name, values in heaviest},
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# list_payload.py
+"""
+列表接口数据量压测：大 Text 列延迟加载前后对比
+
+为单个用户预置 ROWS 条历史记录与模板（正文各约 CONTENT_KB KB），
+以及 ROWS/10 个各含 10 条消息的会话，然后：
+
+1. 数据库层对比：同一页数据按"加载完整实体"（旧做法）与"仅取预览子串"（当前做法）
+   分别查询，统计耗时、从数据库读取的文本字节数、Python 内存峰值
+2. 接口层：/api/history、/api/templates、/api/conversations 的延迟与内存峰值
+
+    cd backend && python benchmarks/list_payload.py --rows 2000 --content-kb 20
+"""
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import _harness
+
+MESSAGES_PER_CONVERSATION = 10
+
+
+def seed(user_id: int, ai_model_id: int, rows: int, content_kb: int):
+    from app.database import engine
+    from app.models import Conversation, DocumentHistory, Message, Template
+
+    body = "公文正文内容。" * (content_kb * 1024 // 21 + 1)
+    start = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(DocumentHistory.__table__.insert(), [
+            {"user_id": user_id, "doc_type": "通知", "content": body, "filename": f"bench_{i}.docx",
+             "created_at": start + timedelta(seconds=i)}
+            for i in range(rows)
+        ])
+        conn.execute(Template.__table__.insert(), [
+            {"user_id": user_id, "filename": f"tpl_{i}.docx", "original_name": f"模板{i}.docx", "content": body,
+             "status": "active", "uploaded_at": start + timedelta(seconds=i)}
+            for i in range(rows)
+        ])
+        # 会话：每个会话 MESSAGES_PER_CONVERSATION 条长消息
+        for i in range(rows // MESSAGES_PER_CONVERSATION):
+            conv_id = conn.execute(Conversation.__table__.insert(), {
+                "user_id": user_id, "ai_model_id": ai_model_id, "title": f"压测会话{i}", "status": "active",
+                "created_at": start, "updated_at": start + timedelta(seconds=i)
+            }).inserted_primary_key[0]
+            conn.execute(Message.__table__.insert(), [
+                {"conversation_id": conv_id, "role": "assistant", "content": body,
+                 "created_at": start + timedelta(seconds=j)}
+                for j in range(MESSAGES_PER_CONVERSATION)
+            ])
+
+
+def measure(fn, repeat: int) -> dict:
+    """多次执行 fn，返回延迟分位数及单次调用的 Python 内存峰值"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = _harness.percentiles(latencies)
+    stats["peak_kb"] = round(peak / 1024, 1)
+    if isinstance(result, int):
+        stats["text_bytes"] = result
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--content-kb", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    _harness.setup_env()
+    _harness.register_bench_provider()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+    from sqlalchemy.orm import undefer
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models import AIModel, DocumentHistory, User
+    _harness.create_schema()
+    model_id = _harness.seed_platform()
+
+    client = TestClient(app)
+    creds = {"username": "bench", "password": "bench-password"}
+    client.post("/auth/register", json=creds)
+    token = client.post("/auth/login", json=creds).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/api/keys", json={"model_id": model_id, "api_key": "sk-bench-0000000000"}, headers=headers)
+    db = SessionLocal()
+    user_id = db.query(User).filter(User.username == "bench").one().id
+    ai_model_id = db.query(AIModel.id).filter(AIModel.user_id == user_id).scalar()
+    seed(user_id, ai_model_id, args.rows, args.content_kb)
+
+    def full_rows():
+        # 旧做法：加载完整实体，再在 Python 中切片
+        db.expire_all()
+        docs = db.query(DocumentHistory).options(undefer(DocumentHistory.content)).filter(
+            DocumentHistory.user_id == user_id
+        ).order_by(DocumentHistory.created_at.desc()).limit(args.page_size).all()
+        return sum(len(doc.content.encode("utf-8")) for doc in docs)
+
+    def preview_rows():
+        rows = db.query(
+            DocumentHistory.id, func.substr(DocumentHistory.content, 1, 51)
+        ).filter(
+            DocumentHistory.user_id == user_id
+        ).order_by(DocumentHistory.created_at.desc()).limit(args.page_size).all()
+        return sum(len(preview.encode("utf-8")) for _, preview in rows)
+
+    result = {
+        "rows": args.rows,
+        "content_kb": args.content_kb,
+        "page_size": args.page_size,
+        "db_full_entities": measure(full_rows, args.repeat),
+        "db_preview_only": measure(preview_rows, args.repeat),
+    }
+    db.close()
+
+    for path in ("/api/history", "/api/templates", "/api/conversations"):
+        params = {"page_size": args.page_size} if path != "/api/conversations" else {}
+        result[path] = measure(
+            lambda: client.get(path, headers=headers, params=params).raise_for_status(),
+            args.repeat
+        )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# load_mixed.py
+"""
+混合负载压测：流式生成 + 列表查询
+
+在进程内启动应用（临时 SQLite + 模拟平台），并发执行：
+- STREAMS 个客户端循环调用 /api/generate（SSE 流式生成）
+- LISTERS 个客户端循环调用 /api/history、/api/templates、/api/conversations
+输出列表接口延迟及流式首字节时间的 p50/p95/p99。
+
+路由中的同步数据库调用会阻塞事件循环，表现为列表接口及流式首字节的尾延迟升高；
+可在改动前后分别运行对比：
+
+    cd backend && python benchmarks/load_mixed.py --duration 20 --streams 20 --listers 20
+
+--db-latency 模拟生产数据库的网络往返（默认 2ms）；设为 0 即纯本地 SQLite。
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import _harness
+
+
+async def login(client, base_url: str) -> dict:
+    creds = {"username": "bench", "password": "bench-password"}
+    await client.post(f"{base_url}/auth/register", json=creds)
+    resp = await client.post(f"{base_url}/auth/login", json=creds)
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+async def stream_worker(client, base_url, headers, deadline, ttfb, totals, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        first = None
+        try:
+            async with client.stream(
+                "POST", f"{base_url}/api/generate",
+                data={"doc_type": "通知", "user_input": "压测"}, headers=headers
+            ) as resp:
+                async for line in resp.aiter_lines():
+                    if first is None and line.startswith("data:"):
+                        first = time.perf_counter() - start
+                    if line.startswith("event: error"):
+                        errors.append("stream error event")
+            if first is not None:
+                ttfb.append(first)
+            totals.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(repr(e))
+
+
+async def list_worker(client, base_url, headers, deadline, latencies, errors):
+    paths = ["/api/history", "/api/templates", "/api/conversations"]
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            resp = await client.get(f"{base_url}{path}", headers=headers)
+            resp.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(repr(e))
+
+
+async def run(base_url: str, model_id: int, args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.streams + args.listers + 4)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        headers = await login(client, base_url)
+        await client.post(
+            f"{base_url}/api/keys",
+            json={"model_id": model_id, "api_key": "sk-bench-0000000000"},
+            headers=headers
+        )
+        # 预热：生成若干历史记录，列表接口有数据可查
+        for _ in range(args.seed):
+            await client.post(f"{base_url}/api/generate", data={"doc_type": "通知", "user_input": "预热"}, headers=headers)
+
+        deadline = time.perf_counter() + args.duration
+        ttfb, totals, latencies, errors = [], [], [], []
+        await asyncio.gather(
+            *[stream_worker(client, base_url, headers, deadline, ttfb, totals, errors) for _ in range(args.streams)],
+            *[list_worker(client, base_url, headers, deadline, latencies, errors) for _ in range(args.listers)],
+        )
+
+    return {
+        "listing": _harness.percentiles(latencies),
+        "stream_ttfb": _harness.percentiles(ttfb),
+        "stream_total": _harness.percentiles(totals),
+        "errors": len(errors),
+        "sample_errors": errors[:3],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--streams", type=int, default=10)
+    parser.add_argument("--listers", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=20, help="压测前预先生成的记录数")
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    parser.add_argument("--db-latency", type=float, default=0.002, help="模拟每条SQL的网络往返耗时（秒）")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    _harness.setup_env()
+    from app.main import app
+    _harness.register_bench_provider(args.chunks, args.chunk_delay)
+    _harness.create_schema()
+    model_id = _harness.seed_platform()
+    _harness.simulate_db_latency(args.db_latency)
+
+    with _harness.ServerThread(app, args.port) as server:
+        result = asyncio.run(run(server.base_url, model_id, args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# logging_throughput.py
+"""
+日志开销压测：流式片段处理速度（chunks/sec）
+
+模拟 THREADS 个 worker 线程各自处理流式片段，对比三种日志方式：
+- legacy：旧写法，每个片段 print 两行（行缓冲输出），请求开始时同步写 FileHandler + StreamHandler
+- pipeline：QueueHandler + 后台 listener，逐片段 debug 日志（LOG_LEVEL=INFO，直接过滤）
+- pipeline_debug：同上但 LOG_LEVEL=DEBUG，逐片段日志按 LOG_SAMPLE_RATES 抽样 1%
+
+输出写入临时文件（模拟容器 stdout 管道/日志文件），结果为各方式的 chunks/sec 及相对提升。
+
+    cd backend && python benchmarks/logging_throughput.py --chunks 200000 --threads 4
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import _harness
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def run_workers(threads: int, chunks: int, handle_chunk) -> float:
+    """THREADS 个线程各处理 chunks/threads 个片段，返回 chunks/sec"""
+    per_thread = chunks // threads
+
+    def worker():
+        for i in range(per_thread):
+            handle_chunk(i, f"片段内容{i}")
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def bench_legacy(work_dir: str, args) -> float:
+    reset_root()
+    stdout = open(os.path.join(work_dir, "legacy_stdout.log"), "w", buffering=1, encoding="utf-8")
+    stream_handler = logging.StreamHandler(stdout)
+    file_handler = logging.FileHandler(os.path.join(work_dir, "legacy_api.log"), encoding="utf-8")
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(stream_handler)
+    root.addHandler(file_handler)
+    root.setLevel(logging.INFO)
+
+    def handle_chunk(i, content):
+        if i % args.chunks_per_request == 0:
+            # 每个请求：认证时同步记录 token 及用户（旧 auth.get_current_user）
+            logging.info("Received token: %s", "x" * 120)
+            logging.info("Decoded token for user: %s", "bench")
+            logging.info("User %s found in the database", "bench")
+        print(f"[Qwen 流式片段 {i}] 存在choices: True", file=stdout)
+        print(f"[Qwen 有效片段 {i}] 内容: {content}", file=stdout)
+
+    try:
+        return run_workers(args.threads, args.chunks, handle_chunk)
+    finally:
+        reset_root()
+        stdout.close()
+
+
+def bench_pipeline(work_dir: str, args, level: str) -> float:
+    reset_root()
+    os.environ["LOG_LEVEL"] = level
+    os.environ["LOG_FILE"] = os.path.join(work_dir, f"pipeline_{level.lower()}.log")
+    os.environ.setdefault("LOG_SAMPLE_RATES", "app.ai_client.chunks=0.01")
+    # 重新加载以读取本次配置
+    from app import log_config
+    log_config = importlib.reload(log_config)
+
+    stderr, sys.stderr = sys.stderr, open(os.path.join(work_dir, f"pipeline_{level.lower()}_stderr.log"), "w", buffering=1)
+    log_config.setup_logging()
+    chunk_logger = log_config.get_sampled_logger("app.ai_client.chunks")
+    auth_logger = logging.getLogger("app.auth")
+
+    def handle_chunk(i, content):
+        if i % args.chunks_per_request == 0:
+            auth_logger.debug("authenticated user %s", "bench")
+        chunk_logger.debug("Qwen 有效片段 chunk=%d length=%d", i, len(content))
+
+    try:
+        return run_workers(args.threads, args.chunks, handle_chunk)
+    finally:
+        log_config.shutdown_logging()
+        reset_root()
+        sys.stderr.close()
+        sys.stderr = stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--chunks-per-request", type=int, default=200, help="每个请求的片段数（决定认证日志频率）")
+    args = parser.parse_args()
+
+    work_dir = _harness.setup_env()
+    legacy = bench_legacy(work_dir, args)
+    pipeline = bench_pipeline(work_dir, args, "INFO")
+    pipeline_debug = bench_pipeline(work_dir, args, "DEBUG")
+    result = {
+        "chunks": args.chunks,
+        "threads": args.threads,
+        "legacy_chunks_per_sec": round(legacy),
+        "pipeline_chunks_per_sec": round(pipeline),
+        "pipeline_debug_sampled_chunks_per_sec": round(pipeline_debug),
+        "speedup": round(pipeline / legacy, 2),
+        "speedup_debug_sampled": round(pipeline_debug / legacy, 2),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# login_throughput.py
+"""
+登录吞吐压测：/auth/login 每秒登录数（及每核登录数）
+
+在进程内启动应用，预置 USERS 个用户后由 CONCURRENCY 个客户端循环登录 DURATION 秒，
+同时由 PROBES 个客户端循环请求 /health，观察 bcrypt 计算是否拖慢其他接口。
+输出：登录成功数/秒、每核登录数/秒、登录与探测接口延迟分位数、因排队已满被拒绝（503）的次数。
+
+    cd backend && python benchmarks/login_throughput.py --duration 20 --concurrency 64
+    BCRYPT_ROUNDS=10 python benchmarks/login_throughput.py   # 对比不同 cost
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import _harness
+
+
+async def login_worker(client, base_url, usernames, offset, deadline, latencies, counts):
+    i = offset
+    while time.perf_counter() < deadline:
+        creds = {"username": usernames[i % len(usernames)], "password": "bench-password"}
+        i += 1
+        start = time.perf_counter()
+        try:
+            resp = await client.post(f"{base_url}/auth/login", json=creds)
+        except Exception:
+            counts["errors"] += 1
+            continue
+        if resp.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+            counts["ok"] += 1
+        elif resp.status_code == 503:
+            counts["rejected"] += 1
+            await asyncio.sleep(float(resp.headers.get("Retry-After", "1")))
+        else:
+            counts["errors"] += 1
+
+
+async def probe_worker(client, base_url, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        resp = await client.get(f"{base_url}/health")
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+
+async def run(base_url: str, args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency + args.probes + 4)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        usernames = [f"bench{i}" for i in range(args.users)]
+        for username in usernames:
+            await client.post(f"{base_url}/auth/register", json={"username": username, "password": "bench-password"})
+
+        counts = {"ok": 0, "rejected": 0, "errors": 0}
+        login_latencies, probe_latencies = [], []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(
+            *[login_worker(client, base_url, usernames, i, deadline, login_latencies, counts)
+              for i in range(args.concurrency)],
+            *[probe_worker(client, base_url, deadline, probe_latencies) for _ in range(args.probes)],
+        )
+        elapsed = time.perf_counter() - started
+
+    from app.password_hashing import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
+    cores = os.cpu_count() or 1
+    return {
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "hash_workers": PASSWORD_HASH_WORKERS,
+        "cores": cores,
+        "logins_per_sec": round(counts["ok"] / elapsed, 2),
+        "logins_per_sec_per_core": round(counts["ok"] / elapsed / cores, 2),
+        "rejected": counts["rejected"],
+        "errors": counts["errors"],
+        "login_latency": _harness.percentiles(login_latencies),
+        "health_latency": _harness.percentiles(probe_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--probes", type=int, default=2)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    _harness.setup_env()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from app.main import app
+    _harness.create_schema()
+
+    with _harness.ServerThread(app, args.port) as server:
+        result = asyncio.run(run(server.base_url, args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# pagination_depth.py
+"""
+深分页压测：/api/history 页码（OFFSET）翻页 vs 游标翻页
+
+为单个用户预置 ROWS 条历史记录，分别测量：
+- 页码模式：第 1 页、中间页、最后一页各请求 REPEAT 次（每次附带总数统计）
+- 游标模式：从第 1 页沿 next_cursor 翻到最后一页，按所在深度分段统计
+
+游标模式的单页延迟应与深度无关；页码模式随 OFFSET 增大而线性变慢。
+
+    cd backend && python benchmarks/pagination_depth.py --rows 50000 --page-size 50
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+import _harness
+
+
+def seed_history(user_id: int, rows: int):
+    from app.database import engine
+    from app.models import DocumentHistory
+
+    start = datetime(2025, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            batch.append({
+                "user_id": user_id,
+                "doc_type": "通知",
+                "content": f"第{i}份公文内容" * 20,
+                "filename": f"bench_{i}.docx",
+                # 每秒两条，制造相同 created_at，验证游标按 id 去重
+                "created_at": start + timedelta(seconds=i // 2),
+            })
+            if len(batch) >= 5000:
+                conn.execute(DocumentHistory.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(DocumentHistory.__table__.insert(), batch)
+
+
+def timed_get(client, url, headers, params):
+    start = time.perf_counter()
+    resp = client.get(url, headers=headers, params=params)
+    resp.raise_for_status()
+    return time.perf_counter() - start, resp.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="模拟每条SQL的网络往返耗时（秒）")
+    args = parser.parse_args()
+
+    _harness.setup_env()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from fastapi.testclient import TestClient
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models import User
+    _harness.create_schema()
+
+    client = TestClient(app)
+    creds = {"username": "bench", "password": "bench-password"}
+    client.post("/auth/register", json=creds)
+    token = client.post("/auth/login", json=creds).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    db = SessionLocal()
+    user_id = db.query(User).filter(User.username == "bench").one().id
+    db.close()
+    seed_history(user_id, args.rows)
+    _harness.simulate_db_latency(args.db_latency)
+
+    last_page = (args.rows + args.page_size - 1) // args.page_size
+    offset_result = {}
+    for label, page in (("first", 1), ("middle", last_page // 2), ("last", last_page)):
+        latencies = []
+        for _ in range(args.repeat):
+            elapsed, _ = timed_get(client, "/api/history", headers, {"page": page, "page_size": args.page_size})
+            latencies.append(elapsed)
+        offset_result[f"page_{label}"] = _harness.percentiles(latencies)
+
+    buckets = {"first_third": [], "middle_third": [], "last_third": []}
+    cursor, page, seen = None, 0, 0
+    while True:
+        params = {"page_size": args.page_size}
+        if cursor:
+            params["cursor"] = cursor
+        elapsed, body = timed_get(client, "/api/history", headers, params)
+        page += 1
+        seen += len(body["data"])
+        bucket = ("first_third", "middle_third", "last_third")[min(2, (page - 1) * 3 // last_page)]
+        buckets[bucket].append(elapsed)
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+
+    result = {
+        "rows": args.rows,
+        "page_size": args.page_size,
+        "offset_pagination": offset_result,
+        "cursor_pagination": {name: _harness.percentiles(values) for name, values in buckets.items()},
+        "cursor_rows_seen": seen,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# template_dedup.py
+"""
+模板去重压测：重复上传相同模板时的磁盘占用、解析次数与上传延迟
+
+预置一个用户，生成 UNIQUE 份不同的docx模板（每份约 PARAGRAPHS 段），
+按轮询顺序共上传 UPLOADS 次。输出：
+- blob 目录文件数 / 字节数（应等于不同模板的数量 / 大小，与上传次数无关）
+- 新建 blob 次数（即docx解析次数）与复用次数
+- 首次上传（需解析）与重复上传（直接复用）的延迟分位数
+
+    cd backend && python benchmarks/template_dedup.py --uploads 200 --unique 5
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import time
+
+import _harness
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def make_docx(index: int, paragraphs: int) -> bytes:
+    from docx import Document
+
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(f"模板{index} 第{i}段：各单位要高度重视，认真组织落实相关工作要求。")
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def dir_usage(path: str) -> dict:
+    names = os.listdir(path)
+    return {"files": len(names), "bytes": sum(os.path.getsize(os.path.join(path, name)) for name in names)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--unique", type=int, default=5)
+    parser.add_argument("--paragraphs", type=int, default=300)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    work_dir = _harness.setup_env()
+    os.environ.setdefault("TEMPLATE_BLOB_DIR", os.path.join(work_dir, "blobs"))
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from app.main import app
+    from app import metrics
+    from app.template_store import TEMPLATE_BLOB_DIR
+    _harness.create_schema()
+
+    import httpx
+
+    templates = [make_docx(i, args.paragraphs) for i in range(args.unique)]
+    first_latencies, repeat_latencies = [], []
+    with _harness.ServerThread(app, args.port) as server, httpx.Client(base_url=server.base_url, timeout=60) as client:
+        creds = {"username": "bench", "password": "bench-password"}
+        client.post("/auth/register", json=creds)
+        token = client.post("/auth/login", json=creds).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        for i in range(args.uploads):
+            data = templates[i % args.unique]
+            start = time.perf_counter()
+            resp = client.post(
+                "/api/upload-template", headers=headers,
+                files={"file": (f"template{i % args.unique}.docx", data, DOCX_CONTENT_TYPE)}
+            )
+            resp.raise_for_status()
+            (first_latencies if i < args.unique else repeat_latencies).append(time.perf_counter() - start)
+
+    counters = metrics.snapshot().get("counters", {})
+    result = {
+        "uploads": args.uploads,
+        "unique_templates": args.unique,
+        "uploaded_bytes": sum(len(templates[i % args.unique]) for i in range(args.uploads)),
+        "blob_dir": dir_usage(TEMPLATE_BLOB_DIR),
+        "blobs_created": counters.get("template_blob_created_total", 0),
+        "dedup_hits": counters.get("template_blob_dedup_hits_total", 0),
+        "first_upload_latency": _harness.percentiles(first_latencies),
+        "repeat_upload_latency": _harness.percentiles(repeat_latencies),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
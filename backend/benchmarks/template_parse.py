@@ -0,0 +1,83 @@
+# template_parse.py
+"""
+模板读取开销压测：每次使用模板时重新打开docx vs 结构化表示（库中 JSON / 进程内 LRU）
+
+生成一份约 PARAGRAPHS 段 + TABLES 个表格的模板，各方式重复 REPEAT 次，输出单次耗时分位数：
+- reopen_docx：python-docx 打开压缩包并提取段落文本（旧方式，任何富结构用途都要重来一次）
+- parse_structure：上传时的一次性结构化解析（template_structure.parse_template）
+- json_loads：缓存未命中时从 TemplateBlob.structure 列反序列化
+- lru_hit：进程内缓存命中
+- to_prompt：由结构组装 Prompt 文本
+
+    cd backend && python benchmarks/template_parse.py --paragraphs 300 --repeat 200
+"""
+import argparse
+import io
+import json
+import time
+
+import _harness
+
+
+def make_docx(paragraphs: int, tables: int) -> bytes:
+    from docx import Document
+
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "XX市人民政府办公室"
+    doc.add_heading("关于{{事项名称}}的通知", level=1)
+    for i in range(paragraphs):
+        doc.add_paragraph(f"第{i}条：各单位要于XX月XX日前将【材料名称】报送至办公室，并认真组织落实。")
+    for t in range(tables):
+        table = doc.add_table(rows=10, cols=4)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"表{t}-{r}-{c}"
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def timed(repeat: int, func) -> dict:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return _harness.percentiles(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=300)
+    parser.add_argument("--tables", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    _harness.setup_env()
+    from docx import Document
+    from app.template_structure import TemplateStructureCache, dump_structure, parse_template, structure_to_prompt
+
+    data = make_docx(args.paragraphs, args.tables)
+    parsed = parse_template(data)
+    raw = dump_structure(parsed.structure)
+    cache = TemplateStructureCache()
+    cache.set("bench", parsed.structure)
+
+    def reopen_docx():
+        doc = Document(io.BytesIO(data))
+        return "\n".join(para.text for para in doc.paragraphs)
+
+    result = {
+        "docx_bytes": len(data),
+        "structure_json_bytes": len(raw.encode("utf-8")),
+        "reopen_docx": timed(args.repeat, reopen_docx),
+        "parse_structure": timed(args.repeat, lambda: parse_template(data)),
+        "json_loads": timed(args.repeat, lambda: json.loads(raw)),
+        "lru_hit": timed(args.repeat, lambda: cache.get("bench")),
+        "to_prompt": timed(args.repeat, lambda: structure_to_prompt(parsed.structure)),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
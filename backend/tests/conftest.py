@@ -0,0 +1,92 @@
+# conftest.py
+"""
+测试公共环境：导入 app 之前配置临时 SQLite 数据库、加密密钥与上传目录（不访问外部网络）
+"""
+import os
+import sys
+import tempfile
+
+from cryptography.fernet import Fernet
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="tests_")
+DB_PATH = os.path.join(WORK_DIR, "test.db")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+os.environ["TEMPLATE_BLOB_DIR"] = os.path.join(WORK_DIR, "blobs")
+os.environ["LOG_FILE"] = ""
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import pytest  # noqa: E402
+
+
+def alembic_config(connection):
+    """在指定连接上执行迁移的 Alembic 配置（不读取 alembic.ini 中的数据库地址）"""
+    from alembic.config import Config
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    config.attributes["connection"] = connection
+    return config
+
+
+@pytest.fixture(scope="session")
+def schema():
+    """按 ORM 模型建表（迁移链本身由 test_migrations 覆盖）"""
+    from app.database import engine
+    from app.models import Base
+    Base.metadata.create_all(bind=engine)
+    yield engine
+
+
+@pytest.fixture
+def db(schema):
+    from app.database import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    """创建用户（用户名随机，测试间互不影响）"""
+    import uuid
+    from app.models import User
+
+    def make(username: str = None):
+        user = User(username=username or f"user_{uuid.uuid4().hex[:8]}", password_hash="x")
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_ai_model(db):
+    """为用户创建 AI 配置（平台、系统模型不存在时一并创建）"""
+    from app.encryption import encrypt_api_key, mask_api_key
+    from app.models import AIModel, Model, Platform
+
+    def make(user, platform_name: str = "OpenAI", model_name: str = "gpt-4o", api_key: str = "sk-test-key-0001"):
+        platform = db.query(Platform).filter(Platform.name == platform_name).first()
+        if platform is None:
+            platform = Platform(name=platform_name, base_url=f"https://{platform_name.lower()}.example.com")
+            db.add(platform)
+            db.flush()
+        model = db.query(Model).filter(Model.platform_id == platform.id, Model.name == model_name).first()
+        if model is None:
+            model = Model(name=model_name, platform_id=platform.id)
+            db.add(model)
+            db.flush()
+        ai_model = AIModel(
+            user_id=user.id, model_id=model.id,
+            api_key=encrypt_api_key(api_key), api_key_mask=mask_api_key(api_key)
+        )
+        db.add(ai_model)
+        db.commit()
+        return ai_model
+    return make
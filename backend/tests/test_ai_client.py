@@ -0,0 +1,86 @@
+# test_ai_client.py
+"""AI 平台客户端：Ernie/Spark 的 SSE 行解析及同步/异步共用的请求构建，SDK 客户端不自行重试"""
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+
+from app.AI_client import (
+    AnthropicClient, ErnieClient, GLMClient, OpenAIClient, QwenClient, SparkClient, _sse_data, _STREAM_DONE
+)
+
+
+def _sse_body(*chunks: str) -> bytes:
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': c}}]}, ensure_ascii=False)}" for c in chunks]
+    lines.append("data: [DONE]")
+    return ("\n\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def _client(cls, handler, base_url="https://llm.example.com/v1/chat/completions"):
+    client = cls(api_key=f"sk-{uuid.uuid4().hex}", base_url=base_url, api_key_encrypted=False)
+    client._initialize_async_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def _stream(client) -> list:
+    async def collect():
+        return [c async for c in client.astream_generate("写一份通知", "系统提示")]
+    return asyncio.run(collect())
+
+
+def test_sse_data_removes_prefix_once():
+    assert _sse_data('data: {"a": 1}') == '{"a": 1}'
+    assert _sse_data("data:[DONE]") == "[DONE]"
+    # lstrip("data: ") 会按字符集合删除，把 "ta" 一并删掉
+    assert _sse_data("data:ta") == "ta"
+    assert _sse_data("data: data: x") == "data: x"
+    assert _sse_data("   ") is None
+
+
+def test_parse_stream_line():
+    assert ErnieClient._parse_stream_line("data: [DONE]") is _STREAM_DONE
+    assert ErnieClient._parse_stream_line(": keep-alive") is None
+    assert ErnieClient._parse_stream_line('data: {"choices": [{"delta": {"content": "公文"}}]}') == "公文"
+    with pytest.raises(RuntimeError):
+        ErnieClient._parse_stream_line('data: {"error": {"message": "bad key"}}')
+    assert SparkClient._parse_stream_line('data: {"choices": [{"delta": {"content": "  "}}]}') is None
+
+
+@pytest.mark.parametrize("cls", [ErnieClient, SparkClient])
+def test_async_stream_uses_shared_payload(cls):
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200, content=_sse_body("关于", "通知", "data"))
+
+    client = _client(cls, handler)
+    assert _stream(client) == ["关于", "通知", "data"]
+    body = json.loads(requests[0].content)
+    assert body == client._build_payload("写一份通知", "系统提示", stream=True)
+    assert requests[0].headers["Authorization"] == f"Bearer {client.api_key}"
+
+
+@pytest.mark.parametrize("cls", [ErnieClient, SparkClient])
+def test_async_generate(cls):
+    def handler(request: httpx.Request):
+        assert "stream" not in json.loads(request.content)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "全文"}}]})
+
+    assert asyncio.run(_client(cls, handler).agenerate("p", "s")) == "全文"
+
+
+def test_spark_requires_base_url():
+    client = SparkClient(api_key=f"sk-{uuid.uuid4().hex}", api_key_encrypted=False)
+    with pytest.raises(ValueError):
+        client._get_api_endpoint()
+
+
+@pytest.mark.parametrize("cls", [OpenAIClient, QwenClient, GLMClient, AnthropicClient])
+def test_sdk_clients_do_not_retry(cls):
+    # 重试只由 ResilientClient 负责，SDK 自身重试会绕过重试预算并叠加退避
+    client = cls(api_key=f"sk-{uuid.uuid4().hex}", base_url="https://llm.example.com/v1", api_key_encrypted=False)
+    assert client.client.max_retries == 0
+    assert client.async_client.max_retries == 0
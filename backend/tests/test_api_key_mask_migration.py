@@ -0,0 +1,38 @@
+# test_api_key_mask_migration.py
+"""5c6f760060c8：按行回填 api_key_mask，无法解密的行保持 NULL"""
+import os
+
+from alembic import command
+from cryptography.fernet import Fernet
+from sqlalchemy import create_engine, text
+
+from conftest import alembic_config
+
+
+def test_backfill_masks_per_row(tmp_path):
+    fernet = Fernet(os.environ["ENCRYPTION_KEY"].encode())
+    other_key = Fernet(Fernet.generate_key())
+    from app.models import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'mask.db'}")
+    # 主链中段的修订面向 MySQL，SQLite 上按 ORM 建表后去掉该列，再标记为上一修订
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE ai_models DROP COLUMN api_key_mask"))
+        command.stamp(alembic_config(connection), "a42e37a67f7d")
+        connection.execute(text("INSERT INTO users (id, username, password_hash) VALUES (1, 'u', 'x')"))
+        connection.execute(text("INSERT INTO platforms (id, name, base_url) VALUES (1, 'OpenAI', 'https://x')"))
+        connection.execute(text("INSERT INTO models (id, name, platform_id) VALUES (1, 'gpt-4o', 1)"))
+        rows = {
+            1: fernet.encrypt(b"sk-abcdefgh12345678").decode(),
+            2: other_key.encrypt(b"sk-rotated-key-0000").decode(),  # 其他密钥加密：无法解密
+            3: "not-a-token",
+        }
+        for row_id, api_key in rows.items():
+            connection.execute(
+                text("INSERT INTO ai_models (id, user_id, model_id, api_key) VALUES (:id, 1, 1, :key)"),
+                {"id": row_id, "key": api_key}
+            )
+        command.upgrade(alembic_config(connection), "5c6f760060c8")
+        masks = dict(connection.execute(text("SELECT id, api_key_mask FROM ai_models")).fetchall())
+    assert masks == {1: "sk-a***5678", 2: None, 3: None}
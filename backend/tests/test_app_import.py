@@ -0,0 +1,14 @@
+# test_app_import.py
+"""导入 app.main 不产生副作用（不建目录、不建表），这些工作只在 lifespan / 首次使用时进行"""
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+
+def test_import_does_not_create_directories(tmp_path):
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, TEMPLATE_BLOB_DIR=str(tmp_path / "blobs"))
+    subprocess.run([sys.executable, "-c", "import app.main"], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / "generated_docs").exists()
+    assert not (tmp_path / "blobs").exists()
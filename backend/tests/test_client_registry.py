@@ -0,0 +1,121 @@
+# test_client_registry.py
+"""客户端注册表：锁外创建、LRU/TTL 淘汰，以及在用客户端的延迟关闭"""
+import gc
+import threading
+import time
+
+from app.client_registry import ClientRegistry
+
+
+class FakeSDKClient:
+    def __init__(self, name: str):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Owner:
+    """模拟平台客户端包装：存活期间在用取到的客户端"""
+
+
+def test_hit_and_miss():
+    registry = ClientRegistry(max_size=4, idle_ttl=60)
+    first = registry.get_or_create(("a",), "fp-a", "sync", lambda: FakeSDKClient("a"))
+    again = registry.get_or_create(("a",), "fp-a", "sync", lambda: FakeSDKClient("other"))
+    assert again is first
+    assert registry.stats()["hits"] == 1 and registry.stats()["misses"] == 1
+
+
+def test_factory_runs_outside_lock():
+    registry = ClientRegistry(max_size=4, idle_ttl=60)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_factory():
+        started.set()
+        release.wait(5)
+        return FakeSDKClient("slow")
+
+    worker = threading.Thread(target=registry.get_or_create, args=(("slow",), "fp", "sync", slow_factory))
+    worker.start()
+    assert started.wait(5)
+    # 慢创建进行中，其他键不被阻塞
+    fast = registry.get_or_create(("fast",), "fp", "sync", lambda: FakeSDKClient("fast"))
+    assert fast.name == "fast"
+    release.set()
+    worker.join(5)
+
+
+def test_concurrent_create_keeps_first_and_closes_loser():
+    registry = ClientRegistry(max_size=4, idle_ttl=60)
+    created = []
+    barrier = threading.Barrier(2)
+
+    def factory():
+        client = FakeSDKClient(f"c{len(created)}")
+        created.append(client)
+        barrier.wait(5)
+        return client
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get_or_create(("k",), "fp", "sync", factory)))
+        for _ in range(2)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert results[0] is results[1]
+    loser = next(c for c in created if c is not results[0])
+    assert loser.closed and not results[0].closed
+
+
+def test_lru_eviction_closes_idle_client():
+    registry = ClientRegistry(max_size=1, idle_ttl=60)
+    first = registry.get_or_create(("a",), "fp", "sync", lambda: FakeSDKClient("a"))
+    registry.get_or_create(("b",), "fp", "sync", lambda: FakeSDKClient("b"))
+    assert first.closed
+    assert registry.stats()["evictions"] == 1
+
+
+def test_eviction_defers_close_until_owner_released():
+    registry = ClientRegistry(max_size=1, idle_ttl=60)
+    owner = Owner()
+    streaming = registry.get_or_create(("a",), "fp", "sync", lambda: FakeSDKClient("a"), owner=owner)
+    registry.get_or_create(("b",), "fp", "sync", lambda: FakeSDKClient("b"))
+    assert not streaming.closed
+    assert registry.stats()["retired_in_use"] == 1
+
+    del owner
+    gc.collect()
+    assert streaming.closed
+    assert registry.stats()["retired_in_use"] == 0
+
+
+def test_idle_ttl_defers_close_for_client_in_use():
+    registry = ClientRegistry(max_size=4, idle_ttl=0.01)
+    owner = Owner()
+    client = registry.get_or_create(("a",), "fp", "sync", lambda: FakeSDKClient("a"), owner=owner)
+    time.sleep(0.02)
+    replacement = registry.get_or_create(("a",), "fp", "sync", lambda: FakeSDKClient("a2"))
+    assert replacement is not client
+    assert not client.closed
+    del owner
+    gc.collect()
+    assert client.closed
+
+
+def test_invalidate_defers_close_and_clear_closes_all():
+    registry = ClientRegistry(max_size=4, idle_ttl=60)
+    owner = Owner()
+    client = registry.get_or_create(("a",), "fp-a", "sync", lambda: FakeSDKClient("a"), owner=owner)
+    assert registry.invalidate("ignored") == 0
+    from app.client_registry import api_key_fingerprint
+    registry.get_or_create(("b",), api_key_fingerprint("sk-b"), "sync", lambda: FakeSDKClient("b"), owner=owner)
+    assert registry.invalidate("sk-b") == 1
+    assert registry.stats()["retired_in_use"] == 1
+    registry.clear()
+    assert client.closed
+    assert registry.stats()["size"] == 0 and registry.stats()["retired_in_use"] == 0
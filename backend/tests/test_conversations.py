@@ -0,0 +1,47 @@
+# test_conversations.py
+"""对话接口：追加消息的响应、对话列表的最后一条消息预览（仅截断时加省略号）"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.auth import get_current_user
+from app.conversations import router
+from app.models import Conversation
+
+
+@pytest.fixture
+def client(db, make_user, make_ai_model):
+    user = make_user()
+    conversation = Conversation(user_id=user.id, ai_model_id=make_ai_model(user).id, title="测试")
+    db.add(conversation)
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.dependency_overrides[get_current_user] = lambda: user
+    client = TestClient(app)
+    client.conversation_id = conversation.id
+    return client
+
+
+def test_add_message_returns_content(client):
+    resp = client.post(
+        f"/api/conversations/{client.conversation_id}/messages",
+        data={"role": "user", "content": "请起草一份会议通知"}
+    )
+    assert resp.status_code == 200
+    message = resp.json()["message"]
+    assert message["content"] == "请起草一份会议通知"
+    assert message["role"] == "user"
+    assert message["id"]
+
+
+@pytest.mark.parametrize("content, preview", [
+    ("短消息", "短消息"),
+    ("一" * 20, "一" * 20),
+    ("一" * 21, "一" * 20 + "..."),
+])
+def test_list_preview_adds_ellipsis_only_when_truncated(client, content, preview):
+    client.post(f"/api/conversations/{client.conversation_id}/messages", data={"role": "user", "content": content})
+    conversations = client.get("/api/conversations").json()
+    assert conversations[0]["last_message"] == preview
@@ -0,0 +1,54 @@
+# test_encryption.py
+"""API Key 加解密：解密结果缓存、淘汰时明文清零、脱敏格式"""
+import pytest
+
+from app import encryption
+from app.encryption import _DecryptCache, clear_decrypt_cache, decrypt_api_key, encrypt_api_key, mask_api_key
+
+
+def test_decrypt_is_cached_by_ciphertext(monkeypatch):
+    clear_decrypt_cache()
+    token = encrypt_api_key("sk-secret-0001")
+    calls = []
+    real_decrypt = encryption.fernet.decrypt
+    monkeypatch.setattr(encryption.fernet, "decrypt", lambda data: calls.append(data) or real_decrypt(data))
+
+    assert decrypt_api_key(token) == "sk-secret-0001"
+    assert decrypt_api_key(token) == "sk-secret-0001"
+    assert len(calls) == 1
+    clear_decrypt_cache()
+    assert decrypt_api_key(token) == "sk-secret-0001"
+    assert len(calls) == 2
+    assert decrypt_api_key("") == ""
+
+
+def test_evicted_and_cleared_plaintext_is_wiped():
+    cache = _DecryptCache(max_entries=1, ttl=60)
+    cache.set(b"a", b"secret-a")
+    stored = cache._entries[b"a"][1]
+    cache.set(b"b", b"secret-b")
+    assert cache.get(b"a") is None
+    assert stored == bytearray(len(b"secret-a"))
+
+    stored = cache._entries[b"b"][1]
+    cache.clear()
+    assert stored == bytearray(len(b"secret-b"))
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(encryption.time, "monotonic", lambda: now[0])
+    cache = _DecryptCache(max_entries=10, ttl=5)
+    cache.set(b"k", b"value")
+    assert cache.get(b"k") == "value"
+    now[0] += 6
+    assert cache.get(b"k") is None
+
+
+@pytest.mark.parametrize("api_key, masked", [
+    ("sk-abcdefgh12345678", "sk-a***5678"),
+    ("sk-12345", "sk-1***"),
+    ("", ""),
+])
+def test_mask_api_key(api_key, masked):
+    assert mask_api_key(api_key) == masked
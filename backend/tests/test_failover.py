@@ -0,0 +1,123 @@
+# test_failover.py
+"""故障切换与对冲：只在平台不可用类错误时切换；手动指定模型时不使用备用模型"""
+import asyncio
+
+import pytest
+
+from app import failover
+from app.AI_client import AIClientFactory, GenerationContext
+from app.failover import EmptyGeneration, FailoverStream
+
+
+def _context(name: str, ai_model_id: int) -> GenerationContext:
+    return GenerationContext(
+        provider="openai", api_key="sk", model_name=name, base_url=None,
+        ai_model_id=ai_model_id, platform_name="OpenAI"
+    )
+
+
+class AuthError(Exception):
+    status_code = 401
+
+
+class FakeClient:
+    """按模型名决定行为：error 首 token 前抛出异常，delay 首 token 前等待，chunks 为空则返回空流"""
+
+    def __init__(self, behaviour: dict, calls: list, closed: list, name: str):
+        self.behaviour, self.calls, self.closed, self.name = behaviour, calls, closed, name
+
+    async def astream_generate(self, prompt, system_prompt=None):
+        self.calls.append(self.name)
+        try:
+            await asyncio.sleep(self.behaviour.get("delay", 0))
+            if "error" in self.behaviour:
+                raise self.behaviour["error"]
+            for chunk in self.behaviour.get("chunks", [f"{self.name}-1", f"{self.name}-2"]):
+                yield chunk
+        finally:
+            self.closed.append(self.name)
+
+
+@pytest.fixture
+def fake_clients(monkeypatch):
+    behaviours, calls, closed = {}, [], []
+    monkeypatch.setattr(
+        AIClientFactory, "create_client_for_context",
+        classmethod(lambda cls, ctx: FakeClient(behaviours.get(ctx.model_name, {}), calls, closed, ctx.model_name))
+    )
+    return behaviours, calls, closed
+
+
+def _run(stream: FailoverStream) -> list:
+    async def collect():
+        return [chunk async for chunk in stream]
+    return asyncio.run(collect())
+
+
+def test_transient_error_fails_over(fake_clients):
+    behaviours, calls, _ = fake_clients
+    behaviours["primary"] = {"error": TimeoutError("timeout")}
+    stream = FailoverStream([_context("primary", 1), _context("backup", 2)], "p", "s", hedge=False)
+    assert _run(stream) == ["backup-1", "backup-2"]
+    assert stream.winner.model_name == "backup"
+    assert calls == ["primary", "backup"]
+
+
+def test_empty_generation_fails_over(fake_clients):
+    behaviours, _, _ = fake_clients
+    behaviours["primary"] = {"chunks": []}
+    stream = FailoverStream([_context("primary", 1), _context("backup", 2)], "p", "s", hedge=False)
+    assert _run(stream) == ["backup-1", "backup-2"]
+
+
+def test_auth_error_does_not_fail_over(fake_clients):
+    behaviours, calls, _ = fake_clients
+    behaviours["primary"] = {"error": AuthError("invalid api key")}
+    stream = FailoverStream([_context("primary", 1), _context("backup", 2)], "p", "s", hedge=False)
+    with pytest.raises(AuthError):
+        _run(stream)
+    assert calls == ["primary"]
+
+
+def test_all_failed_raises_last_error(fake_clients):
+    behaviours, _, _ = fake_clients
+    behaviours["primary"] = {"error": TimeoutError("primary")}
+    behaviours["backup"] = {"chunks": []}
+    stream = FailoverStream([_context("primary", 1), _context("backup", 2)], "p", "s", hedge=False)
+    with pytest.raises(EmptyGeneration):
+        _run(stream)
+
+
+def test_hedge_wins_when_primary_is_slow(fake_clients, monkeypatch):
+    behaviours, calls, closed = fake_clients
+    behaviours["primary"] = {"delay": 5}
+    monkeypatch.setattr(failover, "hedge_delay", lambda: 0.05)
+    stream = FailoverStream([_context("primary", 1), _context("backup", 2)], "p", "s", hedge=True)
+    assert _run(stream) == ["backup-1", "backup-2"]
+    assert calls == ["primary", "backup"]
+    # 落败的主请求被取消并关闭
+    assert "primary" in closed
+
+
+def test_no_hedge_when_primary_is_fast(fake_clients, monkeypatch):
+    behaviours, calls, _ = fake_clients
+    monkeypatch.setattr(failover, "hedge_delay", lambda: 1.0)
+    stream = FailoverStream([_context("primary", 1), _context("backup", 2)], "p", "s", hedge=True)
+    assert _run(stream) == ["primary-1", "primary-2"]
+    assert calls == ["primary"]
+
+
+def test_explicit_model_has_no_fallbacks(db, make_user, make_ai_model):
+    from app.api import _prepare_generation
+
+    user = make_user()
+    chosen = make_ai_model(user, "OpenAI", "gpt-4o")
+    make_ai_model(user, "OpenAI", "gpt-4o-mini")
+
+    explicit = _prepare_generation("通知", "内容", None, chosen.id, None, user, db)
+    assert explicit.context.ai_model_id == chosen.id
+    assert explicit.fallbacks == ()
+
+    preferred = _prepare_generation("通知", "内容", None, None, None, user, db)
+    assert len(preferred.fallbacks) == 1
+    assert preferred.fallbacks[0].ai_model_id != preferred.context.ai_model_id
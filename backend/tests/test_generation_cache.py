@@ -0,0 +1,82 @@
+# test_generation_cache.py
+"""生成结果缓存：键按用户与模型配置隔离，内存/SQLite 后端的 LRU 与 TTL，缓存命中时输出文件名不冲突"""
+import time
+
+import pytest
+
+from app.AI_client import GenerationContext
+from app.generation import GenerationRequest, _cache_key, _output_filename
+from app.generation_cache import GenerationCache, MemoryCacheBackend, SQLiteCacheBackend, make_cache_key
+
+
+def _request(user_id: int, ai_model_id: int) -> GenerationRequest:
+    context = GenerationContext(
+        provider="openai", api_key=f"sk-{user_id}", model_name="gpt-4o", base_url=None,
+        ai_model_id=ai_model_id, platform_name="OpenAI"
+    )
+    return GenerationRequest(
+        user_id=user_id, doc_type="通知", user_input="开会", prompt="p", system_prompt="s",
+        context=context, output_dir="."
+    )
+
+
+def test_cache_key_is_scoped_to_user_and_model_config():
+    same = _cache_key(_request(1, 10), _request(1, 10).context)
+    assert same == _cache_key(_request(1, 10), _request(1, 10).context)
+    assert same != _cache_key(_request(2, 20), _request(2, 20).context)
+    assert same != _cache_key(_request(1, 11), _request(1, 11).context)
+
+
+def test_cache_key_fields_do_not_run_together():
+    a = make_cache_key(1, 1, "openai", "m", "ab", None, "c")
+    b = make_cache_key(1, 1, "openai", "m", "a", "b", "c")
+    assert a != b
+
+
+def test_memory_backend_lru_and_ttl():
+    backend = MemoryCacheBackend(max_entries=2, ttl=60)
+    backend.set("a", "A")
+    backend.set("b", "B")
+    assert backend.get("a") == "A"  # a 变为最近使用
+    backend.set("c", "C")
+    assert backend.get("b") is None and backend.get("a") == "A"
+
+    expiring = MemoryCacheBackend(max_entries=2, ttl=0.01)
+    expiring.set("a", "A")
+    time.sleep(0.02)
+    assert expiring.get("a") is None
+
+
+def test_sqlite_backend_lru_and_ttl(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_entries=2, ttl=60)
+    backend.set("a", "A")
+    time.sleep(0.001)
+    backend.set("b", "B")
+    time.sleep(0.001)
+    assert backend.get("a") == "A"
+    time.sleep(0.001)
+    backend.set("c", "C")
+    assert backend.get("b") is None and backend.get("a") == "A"
+    assert backend.size() == 2
+
+
+@pytest.mark.parametrize("backend_factory", [MemoryCacheBackend, None])
+def test_cache_facade_counts_hits(backend_factory, tmp_path):
+    backend = backend_factory() if backend_factory else SQLiteCacheBackend(str(tmp_path / "c.db"))
+    cache = GenerationCache(backend)
+    before = cache.stats()
+    assert cache.get("k") is None
+    cache.set("k", "全文")
+    assert cache.get("k") == "全文"
+    after = cache.stats()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+    assert after["entries"] == 1
+
+
+def test_output_filenames_are_unique_within_a_second():
+    # 缓存命中瞬间完成，同一秒内的重复请求不能写到同一个文件
+    request = _request(1, 10)
+    names = {_output_filename(request) for _ in range(50)}
+    assert len(names) == 50
+    assert all(name.startswith("通知_1_") and name.endswith(".docx") for name in names)
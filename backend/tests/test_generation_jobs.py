@@ -0,0 +1,95 @@
+# test_generation_jobs.py
+"""生成任务：环形缓冲区续传（Last-Event-ID）、缓冲区淘汰后的 reset 事件、过期清理"""
+import asyncio
+import time
+
+from app.generation_jobs import GenerationJob, JobManager
+
+
+def _job(chunks, buffer_size=100) -> GenerationJob:
+    job = GenerationJob(user_id=1, runner=None, buffer_size=buffer_size)
+    for text in chunks:
+        job.publish(None, {"chunk": text})
+    job.publish("complete", {"status": "success"})
+    job.finish()
+    return job
+
+
+def _collect(job: GenerationJob, last_event_id=None) -> list:
+    async def collect():
+        return [item async for item in job.subscribe(last_event_id)]
+    return asyncio.run(collect())
+
+
+def test_subscribe_replays_all_events():
+    events = _collect(_job(["a", "b", "c"]))
+    assert [seq for seq, _, _ in events] == [0, 1, 2, 3]
+    assert events[-1][1] == "complete"
+
+
+def test_resume_after_last_event_id():
+    events = _collect(_job(["a", "b", "c"]), last_event_id=1)
+    assert [(seq, data.get("chunk")) for seq, _, data in events] == [(2, "c"), (3, None)]
+
+
+def test_resume_past_ring_buffer_sends_reset_with_evicted_text():
+    job = _job([f"p{i}" for i in range(10)], buffer_size=4)
+    events = _collect(job, last_event_id=2)
+    seq, event, data = events[0]
+    # 缓冲区只剩 7、8、9 号片段及 complete；reset 覆盖 0..6 的文本
+    assert (seq, event) == (6, "reset")
+    assert data["text"] == "".join(f"p{i}" for i in range(7))
+    assert [s for s, _, _ in events[1:]] == [7, 8, 9, 10]
+    # reset 文本 + 后续片段即完整内容
+    text = data["text"] + "".join(d.get("chunk", "") for _, _, d in events[1:])
+    assert text == "".join(f"p{i}" for i in range(10))
+
+
+def test_resume_within_ring_buffer_has_no_reset():
+    job = _job([f"p{i}" for i in range(10)], buffer_size=4)
+    events = _collect(job, last_event_id=7)
+    assert [e for _, e, _ in events] == [None, None, "complete"]
+
+
+def test_live_subscriber_receives_events_as_published():
+    async def scenario():
+        job = GenerationJob(user_id=1, runner=None)
+        received = []
+
+        async def consume():
+            async for seq, _, data in job.subscribe():
+                received.append(data.get("chunk"))
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.sleep(0)
+        job.publish(None, {"chunk": "x"})
+        await asyncio.sleep(0)
+        job.publish(None, {"chunk": "y"})
+        job.finish()
+        await asyncio.wait_for(consumer, 1)
+        return received
+
+    assert asyncio.run(scenario()) == ["x", "y"]
+
+
+def test_purge_loop_removes_expired_jobs_without_new_submissions():
+    async def scenario():
+        async def runner():
+            yield None, {"chunk": "done"}
+
+        manager = JobManager(workers=1, retention=0, purge_interval=0.01)
+        job = manager.submit(1, runner)
+        for _ in range(100):
+            if job.done:
+                break
+            await asyncio.sleep(0.01)
+        assert manager.get(job.id, 1) is job
+        time.sleep(0.01)
+        await asyncio.sleep(0.05)
+        stats = manager.stats()
+        await manager.stop()
+        return manager.get(job.id, 1), stats
+
+    job, stats = asyncio.run(scenario())
+    assert job is None
+    assert stats["jobs"] == 0 and stats["workers"] == 1
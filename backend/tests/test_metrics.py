@@ -0,0 +1,32 @@
+# test_metrics.py
+"""/metrics 接口仅限管理员访问"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth import create_access_token
+from app.main import app
+
+
+@pytest.fixture
+def client(schema):
+    # 不进入 lifespan（无需预热连接池与进程池）
+    return TestClient(app)
+
+
+def _auth(user) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
+
+
+def test_metrics_requires_token(client):
+    assert client.get("/metrics").status_code == 401
+
+
+def test_metrics_requires_admin(client, db, make_user):
+    user = make_user()
+    assert client.get("/metrics", headers=_auth(user)).status_code == 403
+
+    user.role = "admin"
+    db.commit()
+    resp = client.get("/metrics", headers=_auth(user))
+    assert resp.status_code == 200
+    assert {"counters", "summaries", "db_pools"} <= set(resp.json())
@@ -0,0 +1,54 @@
+# test_migrations.py
+"""
+迁移链：空库基线分支排在主链之前；已有数据库升级时基线不做改动
+
+主链面向 MySQL（00e9cb53deb6 等修订直接 ALTER 外键），SQLite 只执行到其之前的修订
+"""
+from alembic import command
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect
+
+from conftest import alembic_config
+
+BASELINE = "593a84e34c3f"
+MAIN_ROOT = "9e798574e6c0"
+
+
+def _heads(connection) -> set:
+    return set(MigrationContext.configure(connection).get_current_heads())
+
+
+def test_single_head_and_baseline_runs_first():
+    script = ScriptDirectory.from_config(alembic_config(None))
+    assert len(script.get_heads()) == 1
+    order = [rev.revision for rev in reversed(list(script.iterate_revisions("heads", "base")))]
+    assert order.index(BASELINE) < order.index(MAIN_ROOT)
+
+
+def test_baseline_creates_tables_for_main_chain(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    with engine.begin() as connection:
+        command.upgrade(alembic_config(connection), BASELINE)
+        # 主链开头的几个修订可在基线表结构上直接执行
+        command.upgrade(alembic_config(connection), "b18076592822")
+    with engine.connect() as connection:
+        assert {"users", "ai_models", "templates", "messages"} <= set(inspect(connection).get_table_names())
+        assert _heads(connection) == {BASELINE, "b18076592822"}
+
+
+def test_existing_database_upgrade_skips_baseline(tmp_path):
+    from app.models import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'existing.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        before = {name: inspect(connection).get_columns(name) for name in inspect(connection).get_table_names()}
+        command.stamp(alembic_config(connection), "8eae0fff198c")
+        command.upgrade(alembic_config(connection), "head")
+    with engine.connect() as connection:
+        after = {name: inspect(connection).get_columns(name) for name in inspect(connection).get_table_names()}
+        assert _heads(connection) == {"f2b7c4e91d03"}
+    before.pop("alembic_version", None)
+    after.pop("alembic_version", None)
+    assert [[c["name"] for c in cols] for cols in before.values()] == [[c["name"] for c in cols] for cols in after.values()]
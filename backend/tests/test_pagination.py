@@ -0,0 +1,60 @@
+# test_pagination.py
+"""游标分页：游标编解码、keyset 翻页覆盖全部记录且不重复、有上限的计数"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models import DocumentHistory
+from app.pagination import capped_count, decode_cursor, encode_cursor, keyset_page
+
+
+def test_cursor_round_trip_keeps_datetime():
+    created = datetime(2025, 8, 1, 9, 30, 15, 123456)
+    cursor = encode_cursor(created, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [created, 42]
+    assert decode_cursor(None, 2) is None
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor(1), encode_cursor({"a": 1}, 2)[:-3]])
+def test_invalid_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor, 2)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.fixture
+def history(db, make_user):
+    user = make_user()
+    base = datetime(2025, 8, 1)
+    # 两两同一时间戳，检验 id 作为第二排序键
+    for i in range(7):
+        db.add(DocumentHistory(user_id=user.id, doc_type="通知", created_at=base + timedelta(minutes=i // 2)))
+    db.commit()
+    return db.query(DocumentHistory).filter(DocumentHistory.user_id == user.id)
+
+
+def test_keyset_pages_cover_every_row_once(history):
+    columns = (DocumentHistory.created_at, DocumentHistory.id)
+    expected = [row.id for row in history.order_by(DocumentHistory.created_at.desc(), DocumentHistory.id.desc())]
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(history, columns, cursor, page_size=3)
+        seen.extend(row.id for row in rows)
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_offset_fallback_without_cursor(history):
+    columns = (DocumentHistory.created_at, DocumentHistory.id)
+    first, _ = keyset_page(history, columns, None, page_size=3)
+    second, _ = keyset_page(history, columns, None, page_size=3, offset=3)
+    assert not {row.id for row in first} & {row.id for row in second}
+
+
+def test_capped_count(history):
+    assert capped_count(history, cap=100) == (7, True)
+    assert capped_count(history, cap=5) == (5, False)
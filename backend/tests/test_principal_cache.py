@@ -0,0 +1,58 @@
+# test_principal_cache.py
+"""认证用户缓存：LRU/TTL 淘汰，User 行更新时按用户名失效"""
+import pytest
+
+from app import principal_cache as module
+from app.principal_cache import Principal, PrincipalCache, principal_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_ttl_expiry(clock):
+    cache = PrincipalCache(max_entries=10, ttl=30)
+    alice = Principal(id=1, username="alice", role="user")
+    cache.set("alice", 100, alice)
+    assert cache.get("alice", 100) == alice
+    assert cache.get("alice", 101) is None  # 不同 iat 的 token 各自缓存
+    clock[0] += 31
+    assert cache.get("alice", 100) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_keeps_recently_used(clock):
+    cache = PrincipalCache(max_entries=2, ttl=30)
+    for i, name in enumerate(("a", "b")):
+        cache.set(name, 1, Principal(id=i, username=name, role="user"))
+    cache.get("a", 1)
+    cache.set("c", 1, Principal(id=3, username="c", role="user"))
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) is not None
+
+
+def test_invalidate_removes_every_token_of_user():
+    cache = PrincipalCache(max_entries=10, ttl=30)
+    for iat in (1, 2):
+        cache.set("alice", iat, Principal(id=1, username="alice", role="user"))
+    cache.set("bob", 1, Principal(id=2, username="bob", role="user"))
+    cache.invalidate("alice")
+    assert cache.get("alice", 1) is None and cache.get("alice", 2) is None
+    assert cache.get("bob", 1) is not None
+
+
+def test_user_update_invalidates_old_and_new_username(db, make_user):
+    user = make_user()
+    old_name = user.username
+    principal_cache.set(old_name, 1, Principal.from_user(user))
+    user.role = "admin"
+    db.commit()
+    assert principal_cache.get(old_name, 1) is None
+
+    principal_cache.set(old_name, 2, Principal.from_user(user))
+    user.username = old_name + "_renamed"
+    db.commit()
+    assert principal_cache.get(old_name, 2) is None
@@ -0,0 +1,124 @@
+# test_resilience.py
+"""熔断器状态转换、重试预算与退避时间"""
+import httpx
+import pytest
+
+from app import resilience
+from app.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay, is_transient_error
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.example.com")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def test_transient_error_classification():
+    assert is_transient_error(httpx.ConnectTimeout("timeout"))
+    assert is_transient_error(_status_error(503))
+    assert is_transient_error(_status_error(429))
+    assert not is_transient_error(_status_error(401))
+    assert not is_transient_error(ValueError("bad"))
+    # 客户端包装后的异常沿异常链判断
+    try:
+        try:
+            raise _status_error(502)
+        except httpx.HTTPStatusError as exc:
+            raise RuntimeError("调用失败") from exc
+    except RuntimeError as wrapped:
+        assert is_transient_error(wrapped)
+    assert not is_transient_error(CircuitOpenError("p", 1))
+
+
+def test_breaker_opens_after_threshold_then_half_opens(clock):
+    breaker = CircuitBreaker("p", failure_threshold=3, open_seconds=10, half_open_probes=1)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == pytest.approx(10)
+
+    clock.now += 10.5
+    breaker.before_call()  # 冷却结束，放行一个探测请求
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # 探测名额已占用
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.to_dict()["total_rejections"] == 2
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("p", failure_threshold=1, open_seconds=5)
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += 6
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.to_dict()["retry_after"] == pytest.approx(5)
+
+
+def test_released_probe_frees_slot(clock):
+    breaker = CircuitBreaker("p", failure_threshold=1, open_seconds=5)
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += 6
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_non_transient_error_counts_as_success(clock):
+    breaker = CircuitBreaker("p", failure_threshold=2)
+    breaker.record_error(_status_error(500))
+    breaker.record_error(_status_error(400))
+    breaker.record_error(_status_error(500))
+    assert breaker.state == CLOSED
+
+
+def test_retry_budget_ratio_and_window(clock):
+    budget = RetryBudget(ratio=0.5, min_retries=1, window=10)
+    assert budget.try_acquire()
+    assert not budget.try_acquire()  # 没有请求时只有最低额度
+    for _ in range(6):
+        budget.record_request()
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()  # 6 × 0.5 = 3 次
+    clock.now += 11
+    assert budget.try_acquire()  # 窗口滑过后额度恢复
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    assert [backoff_delay(n, base=0.2, cap=1.0) for n in (1, 2, 3, 4)] == [0.2, 0.4, 0.8, 1.0]
+
+
+def test_endpoints_are_isolated():
+    assert resilience.get_breaker("A", "https://a") is resilience.get_breaker("A", "https://a")
+    assert resilience.get_breaker("A", "https://a") is not resilience.get_breaker("A", None)
+    assert resilience.get_retry_budget("A", "https://a") is not resilience.get_retry_budget("B", "https://a")
@@ -0,0 +1,63 @@
+# test_sse.py
+"""ChunkCoalescer 成帧规则：按大小/时间窗口输出，空白内容留待合并，源异常原样抛出"""
+import asyncio
+
+import pytest
+
+from app.sse import ChunkCoalescer, format_sse
+
+
+async def _source(items):
+    """items 中的数字表示等待秒数，字符串为片段"""
+    for item in items:
+        if isinstance(item, (int, float)):
+            await asyncio.sleep(item)
+        elif isinstance(item, Exception):
+            raise item
+        else:
+            yield item
+
+
+def _frames(items, **kwargs):
+    async def collect():
+        coalescer = ChunkCoalescer(_source(items), **kwargs)
+        frames = [frame async for frame in coalescer]
+        return frames, coalescer
+    return asyncio.run(collect())
+
+
+def test_small_chunks_merge_into_one_frame():
+    frames, coalescer = _frames(["关于", "召开", "会议"], max_bytes=1024, max_delay=1)
+    assert frames == ["关于召开会议"]
+    assert (coalescer.chunks_in, coalescer.frames_out) == (3, 1)
+
+
+def test_flush_when_size_reached():
+    frames, _ = _frames(["aaaa", "bbbb", "cc"], max_bytes=8, max_delay=1)
+    assert frames == ["aaaabbbb", "cc"]
+
+
+def test_flush_when_time_window_expires():
+    frames, _ = _frames(["a", "b", 0.1, "c"], max_bytes=1024, max_delay=0.02)
+    assert frames == ["ab", "c"]
+
+
+def test_whitespace_only_is_held_back():
+    frames, _ = _frames(["\n", 0.1, "正文"], max_bytes=1024, max_delay=0.02)
+    assert frames == ["\n正文"]
+
+
+def test_empty_chunks_are_ignored():
+    frames, coalescer = _frames(["", "a", ""], max_bytes=1024, max_delay=1)
+    assert frames == ["a"]
+    assert coalescer.chunks_in == 1
+
+
+def test_source_error_is_raised():
+    with pytest.raises(ValueError):
+        _frames(["a", ValueError("boom")], max_bytes=1024, max_delay=1)
+
+
+def test_format_sse():
+    assert format_sse({"chunk": "a"}, event="reset", event_id=3) == 'id: 3\nevent: reset\ndata: {"chunk": "a"}\n\n'
+    assert format_sse({"x": 1}) == 'data: {"x": 1}\n\n'
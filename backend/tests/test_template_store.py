@@ -0,0 +1,140 @@
+# test_template_store.py
+"""模板内容寻址存储：引用计数、并发插入的落败方清理及 GC"""
+import hashlib
+import io
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import template_store
+from app.models import TemplateBlob
+from app.template_store import acquire_blob, collect_garbage, release_blob
+from app.template_structure import parse_template
+from app.utils import SavedUpload
+
+
+def _docx(text: str) -> bytes:
+    from docx import Document
+    doc = Document()
+    doc.add_paragraph(text)
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def _saved(data: bytes) -> SavedUpload:
+    """模拟 save_uploaded_file：写入 blob 目录下的临时文件"""
+    os.makedirs(template_store.TEMPLATE_BLOB_DIR, exist_ok=True)
+    path = os.path.join(template_store.TEMPLATE_BLOB_DIR, f"{uuid.uuid4().hex}.docx")
+    with open(path, "wb") as f:
+        f.write(data)
+    return SavedUpload(path=path, size=len(data), sha256=hashlib.sha256(data).hexdigest(), data=data)
+
+
+def _blob_path(blob: TemplateBlob) -> str:
+    return os.path.join(template_store.TEMPLATE_BLOB_DIR, blob.filename)
+
+
+def test_same_content_is_stored_once(db):
+    data = _docx(f"关于{uuid.uuid4().hex}的通知")
+    parses = []
+
+    def parse(raw):
+        parses.append(raw)
+        return parse_template(raw)
+
+    first_upload, second_upload = _saved(data), _saved(data)
+    first = acquire_blob(db, first_upload, parse)
+    db.commit()
+    second = acquire_blob(db, second_upload, parse)
+    db.commit()
+
+    assert second.id == first.id
+    assert len(parses) == 1
+    db.refresh(first)
+    assert first.ref_count == 2
+    assert os.path.exists(_blob_path(first))
+    assert not os.path.exists(first_upload.path) and not os.path.exists(second_upload.path)
+
+
+def test_parse_failure_removes_upload(db):
+    upload = _saved(b"not a docx")
+    with pytest.raises(Exception):
+        acquire_blob(db, upload, parse_template)
+    db.rollback()
+    assert not os.path.exists(upload.path)
+
+
+def test_concurrent_insert_loser_leaves_no_file(db, monkeypatch):
+    from app.database import SessionLocal
+
+    data = _docx(f"并发{uuid.uuid4().hex}")
+    upload = _saved(data)
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    # 另一请求已提交同一内容的 blob（及其文件），本请求查询时尚未看到
+    other = SessionLocal()
+    winner = TemplateBlob(sha256=sha256, size=len(data), filename=f"{sha256}.docx", ref_count=1)
+    other.add(winner)
+    other.commit()
+    winner_id = winner.id
+    other.close()
+
+    real_reference = template_store._reference_existing
+    calls = []
+
+    def reference_after_race(session, digest):
+        calls.append(digest)
+        return None if len(calls) == 1 else real_reference(session, digest)
+
+    monkeypatch.setattr(template_store, "_reference_existing", reference_after_race)
+    blob = acquire_blob(db, upload, parse_template)
+    db.commit()
+
+    assert blob.id == winner_id
+    db.refresh(blob)
+    assert blob.ref_count == 2
+    assert not os.path.exists(upload.path)
+    # 落败方不写入最终文件（胜出方负责）
+    assert not os.path.exists(_blob_path(blob))
+
+
+def test_release_and_gc(db):
+    data = _docx(f"待回收{uuid.uuid4().hex}")
+    blob = acquire_blob(db, _saved(data), parse_template)
+    db.commit()
+    path, blob_id = _blob_path(blob), blob.id
+
+    release_blob(db, blob_id)
+    db.commit()
+    db.refresh(blob)
+    assert blob.ref_count == 0
+
+    # 宽限期内不清理
+    collect_garbage(grace=3600)
+    assert db.get(TemplateBlob, blob_id) is not None
+
+    db.query(TemplateBlob).filter(TemplateBlob.id == blob_id).update(
+        {TemplateBlob.updated_at: datetime.now(timezone.utc) - timedelta(hours=2)}, synchronize_session=False
+    )
+    db.commit()
+    os.utime(path, (0, 0))
+    result = collect_garbage(grace=3600)
+    db.expire_all()
+    assert result["blobs_deleted"] >= 1
+    assert db.get(TemplateBlob, blob_id) is None
+    assert not os.path.exists(path)
+
+
+def test_gc_keeps_referenced_and_recent_files(db):
+    data = _docx(f"保留{uuid.uuid4().hex}")
+    blob = acquire_blob(db, _saved(data), parse_template)
+    db.commit()
+    os.utime(_blob_path(blob), (0, 0))
+    stray = _saved(b"stray upload in progress")
+
+    collect_garbage(grace=3600)
+    assert os.path.exists(_blob_path(blob))  # 仍有引用
+    assert os.path.exists(stray.path)  # 无记录但较新
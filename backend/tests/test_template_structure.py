@@ -0,0 +1,83 @@
+# test_template_structure.py
+"""模板结构化解析：标题、表格（合并单元格）、页眉页脚、待填写项，及 Prompt/版式组装与结构缓存"""
+import io
+import json
+
+import pytest
+
+from app.template_structure import (
+    TemplateStructureCache, dump_structure, parse_template, structure_layout, structure_to_prompt
+)
+
+
+def _docx() -> bytes:
+    from docx import Document
+
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "XX市人民政府办公室"
+    doc.sections[0].footer.paragraphs[0].text = "第1页"
+    doc.add_heading("关于{{事项名称}}的通知", level=1)
+    doc.add_paragraph("")
+    doc.add_paragraph("请于XX月XX日前报送【材料名称】。")
+    table = doc.add_table(rows=2, cols=3)
+    table.cell(0, 0).merge(table.cell(0, 1)).text = "单位"
+    table.cell(0, 2).text = "联系人"
+    table.cell(1, 0).text = "{{单位名称}}"
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="module")
+def parsed():
+    return parse_template(_docx())
+
+
+def test_parse_blocks(parsed):
+    heading, body, table = parsed.structure["blocks"]
+    assert heading == {"t": "p", "text": "关于{{事项名称}}的通知", "style": "Heading1", "ph": [[2, 10, "事项名称"]]}
+    assert "style" not in body  # 正文样式省略
+    assert [span[2] for span in body["ph"]] == ["", "", "材料名称"]
+    # 横向合并的单元格只保留一次
+    assert table["rows"] == [["单位", "联系人"], ["{{单位名称}}", "", ""]]
+    assert table["ph"] == [[1, 0, 0, 8, "单位名称"]]
+    assert parsed.structure["headers"] == ["XX市人民政府办公室"]
+    assert parsed.structure["footers"] == ["第1页"]
+    # 纯文本与旧版一致：全部正文段落（含空段），不含表格
+    assert parsed.text == "关于{{事项名称}}的通知\n\n请于XX月XX日前报送【材料名称】。"
+
+
+def test_structure_to_prompt(parsed):
+    lines = structure_to_prompt(parsed.structure).split("\n")
+    assert lines[0] == "【页眉】XX市人民政府办公室"
+    assert lines[1] == "# 关于{{事项名称}}的通知"
+    assert "| 单位 | 联系人 |" in lines
+    assert lines[-2] == "【页脚】第1页"
+    assert lines[-1] == "待填写项：事项名称、材料名称、单位名称"
+
+
+def test_structure_layout(parsed):
+    assert structure_layout(parsed.structure) == {"header": "XX市人民政府办公室", "footer": "第1页"}
+    assert structure_layout({"blocks": []}) is None
+
+
+def test_structure_survives_json_round_trip(parsed):
+    assert json.loads(dump_structure(parsed.structure)) == parsed.structure
+
+
+def test_invalid_docx_raises():
+    with pytest.raises(Exception):
+        parse_template(b"not a docx")
+
+
+def test_structure_cache_lru():
+    cache = TemplateStructureCache(max_size=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.stats() == {"size": 2, "max_size": 2}
+    disabled = TemplateStructureCache(max_size=0)
+    disabled.set("a", {"v": 1})
+    assert disabled.get("a") is None